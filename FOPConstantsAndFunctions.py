@@ -1,10 +1,13 @@
 """ This file provides helper functions used in multiple places in the FOP application and model.
 """
 
+import csv
 import datetime
+import hashlib
 import random
+from collections import OrderedDict
 import pandas as pd
-from math import isnan
+import numpy as np
 
 ######################################### CONSTANTS #########################################
 
@@ -26,6 +29,52 @@ LTG_STRIKE_CSV_HEADERS = ['date_group','local_striketime','gmt_striketime','mst_
 
 LTG_STRIKE_CSV_HEADERS_2 = ['LOCAL_STRIKETIME', 'LATITUDE', 'LONGITUDE', 'STRENGTH', 'MULTIPLICITY', 'year']
 
+# The five periods of the day that binned lightning strikes are counted in.
+LTG_STRIKE_PERIODS = [0, 1, 2, 3, 4]
+
+# Number of merged weather and lightning rows read in and processed into arrival and holdover probabilities at a time.
+LTG_PROBABILITY_CHUNK_ROWS = 100000
+
+# Row counts reported by the arrival and holdover probability stage: rows read, rows skipped (by reason) and rows written.
+LTG_PROBABILITY_ROW_COUNTS = ['read', 'skipped_month', 'skipped_region', 'skipped_ffmc', 'skipped_dmc', 'skipped_dc',
+                              'skipped_ws', 'written']
+
+# Lightning fire arrival and holdover ignition model coefficients (Dr. Wotton).
+# Some small NSRs that had few lightning fires are recast into their neighbours before the coefficients are looked up.
+LTG_NSR_RECODES = {15: 1, 18: 11, 14: 11, 5: 12, 7: 8}
+
+# Arrival model coefficients by NSR: (intercept, FFMC, DMC, DC). NSRs not listed use 0.0 for all of them.
+LTG_ARRIVAL_NSR_COEFFICIENTS = {1: (-0.279, 0.0011, 0.0033, -0.0005),
+                                2: (0.8539, -0.014, 0.0064, -0.0007),
+                                3: (-0.768, 0.0099, -0.0043, 0.0002),
+                                4: (0.466, -0.0056, 0.0232, -0.0023),
+                                6: (-0.373, 0.0105, -0.0057, -0.0014),
+                                8: (1.45, -0.0221, 0.0098, -0.002),
+                                9: (1.523, -0.0307, 0.0032, 0.0002),
+                                10: (1.1089, -0.0150, 0.0225, -0.0023),
+                                11: (1.19, -0.0164, 0.0217, -0.0028),
+                                12: (-1.0345, 0.0039, -0.0042, 0.0019),
+                                13: (-1.47, -0.0009, 0.0042, 0.0022)}
+
+# Holdover ignition model coefficients by NSR: (intercept, FFMC, DMC). NSRs not listed use 0.0 for all of them.
+LTG_HOLDOVER_NSR_COEFFICIENTS = {1: (1.43, -0.0193, 0.0027),
+                                 2: (2.67, -0.0398, 0.0029),
+                                 3: (1.55, -0.0139, -0.0093),
+                                 4: (-0.6778, 0.0065, -0.0096),
+                                 6: (0.3966, -0.0051, 0.0014),
+                                 8: (0.9429, -0.0188, -0.0030),
+                                 9: (3.388, -0.0579, 0.0006),
+                                 10: (0.776, -0.0197, 0.0204),
+                                 11: (1.688, -0.0292, 0.0190),
+                                 12: (1.566, -0.028, 0.0025),
+                                 13: (4.80, -0.062, 0.0018)}
+
+# Column headers for the merged binned weather and lightning file, '8_Alberta_Merged_Weather_Lightning.csv'.
+LTG_MERGED_WEATHER_LIGHTNING_HEADERS = ['grid', 'lat', 'lon', 'year', 'mon', 'day', 'temp', 'rh', 'ws', 'rain', 'ffmc', 'dmc', 'dc',
+                                        'isi', 'bui', 'fwi', 'numfire', 'pos0', 'neg0', 'pos1', 'neg1', 'pos2', 'neg2', 'pos3', 'neg3',
+                                        'pos4', 'neg4', 'pos', 'neg', 'nltg0', 'nltg1', 'nltg2', 'nltg3', 'nltg4', 'timing', 'totltg',
+                                        'ZONE_CODE', 'NSR', 'NSRNAME']
+
 # Raw weather data column headers used to ensure input weather data is structured correctly.
 RAW_WEATHER_CSV_HEADERS = ['id', 'ws_id', 'c_sky_cndt_id', 'c_wthr_typ_id', 'c_wnd_drct_id', 'weather_date',
                                'dry_bulb_temperature', 'wet_bulb_temperature', 'minimum_temperature', 'maximum_temperature',
@@ -43,6 +92,32 @@ RAW_WEATHER_CSV_HEADERS = ['id', 'ws_id', 'c_sky_cndt_id', 'c_wthr_typ_id', 'c_w
 #                                  'FIRE_WEATHER_INDEX', 'DAILY_SEVERITY_RATING', 'ACTIVE']
 RAW_WEATHER_CSV_HEADERS_2 = ['STATION_ID', 'WEATHER_DATE','DRY_BULB_TEMPERATURE', 'RELATIVE_HUMIDITY','rain_mm','snow_cm','hail_mm','precipitation_mm','WIND_SPEED_KMH', 'WIND_DIRECTION', 'FINE_FUEL_MOISTURE_CODE', 'DUFF_MOISTURE_CODE', 'DROUGHT_CODE', 'INITIAL_SPREAD_INDEX','BUILD_UP_INDEX', 'FIRE_WEATHER_INDEX', 'DAILY_SEVERITY_RATING']
 
+# Timestamp formats of the 'weather_date' column for each of the raw weather data layouts above.
+RAW_WEATHER_CSV_DATE_FORMAT = '%m/%d/%y %H:%M'
+RAW_WEATHER_CSV_DATE_FORMAT_2 = '%Y-%m-%d %H:%M:%S'
+
+# The raw weather data columns used by the FOP models (lowercase), and the types they are read in as.
+RAW_WEATHER_USED_COLUMN_TYPES = OrderedDict([('station_id', str), ('weather_date', str), ('dry_bulb_temperature', np.float64),
+                                             ('relative_humidity', np.float64), ('wind_speed_kmh', np.float64),
+                                             ('rain_mm', np.float64), ('fine_fuel_moisture_code', np.float64),
+                                             ('duff_moisture_code', np.float64), ('drought_code', np.float64),
+                                             ('initial_spread_index', np.float64), ('build_up_index', np.float64),
+                                             ('fire_weather_index', np.float64)])
+
+# Number of decimal places each weather column is rounded to when massaging raw weather data.
+RAW_WEATHER_MASSAGED_COLUMN_DECIMALS = OrderedDict([('dry_bulb_temperature', 1), ('relative_humidity', 1), ('wind_speed_kmh', 1),
+                                                    ('rain_mm', 2), ('fine_fuel_moisture_code', 1), ('duff_moisture_code', 1),
+                                                    ('drought_code', 1), ('initial_spread_index', 1), ('build_up_index', 1),
+                                                    ('fire_weather_index', 1)])
+
+# Raw weather observations are reduced to one observation per station per day before being massaged: the standard
+# noon (LST) observation, or if a station did not report in that hour, one chosen by the fallback rule:
+# 'nearest' (the observation closest in time to noon), 'before' (the last observation before noon) or 'none' (the
+# station is left out for that day).
+REDUCE_RAW_WEATHER_TO_STATION_DAILY = True
+RAW_WEATHER_STANDARD_OBSERVATION_HOUR = 12
+RAW_WEATHER_OBSERVATION_FALLBACK = 'nearest'
+
 # Interpolated and binned weather data column headers.
 INTERPOLATED_BINNED_WEATHER_DATA_HEADERS = ['grid', 'year', 'month', 'day', 'temp', 'rh', 'ws', 'rain',
                                             'ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
@@ -70,8 +145,94 @@ HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS = ['year', 'today', 'month', 'day',
                                                'totarrSLOPES_ci_low', 'totarrSLOPES_ci_high', 'totarrWESTBOREAL_ci_low', 'totarrWESTBOREAL_ci_high',
                                                'totarrEASTBOREAL_ci_low', 'totarrEASTBOREAL_ci_high']
 
-HMN_INTERMEDIATE_SIM_COLUMNS = ['sim_num', 'fishnet_id', 'region_ci', 'probability', 'random_number', 'fire_alberta', 'fire_slopes', 'fire_west_boreal',
-                                'fire_east_boreal']
+# Regions (region_ci) that the Human FOP confidence intervals are produced for, besides the whole Province of Alberta.
+HMN_CI_REGIONS = ['Slopes', 'West Boreal', 'East Boreal']
+
+# Range of the FFMC values covered by the Human FOP FFMC terms; the FFMC of a Human FOP scenario is kept within it.
+HMN_FFMC_TERM_RANGE = (0.0, 100.0)
+
+# Number of replications simulated at once by simulateRegionalFireCounts(); this bounds the simulation's memory use
+# (a replications x cells matrix of float32 uniforms) no matter how many replications are run in total.
+HMN_SIMULATION_BLOCK_REPLICATIONS = 100
+
+# Columns of the Human FOP variables files (GRID_*_AllVariables.csv, and the Slopes model's) used by the probability calculator.
+HMN_VARIABLES_USED_COLUMNS = ['FISHNET_AB', 'DIST_ROAD', 'NATURE_REGION', 'X', 'INF', 'WII', 'WUI', 'FOREST_NAME', 'D.1.D.2', 'WATER']
+HMN_SLOPES_VARIABLES_USED_COLUMNS = ['FISHNET_AB', 'COMBINED_STATIC_EFFECTS']
+
+# Suffix of the compiled cache kept next to each Human FOP terms workbook (*_AllTerms.xlsx) and variables file.
+HMN_COMPILED_CACHE_SUFFIX = '_compiled.pkl'
+
+# Suffix of the compiled per-cell static effects kept next to each Human FOP variables file (see humanStaticEffects()).
+HMN_STATIC_EFFECTS_CACHE_SUFFIX = '_static_effects_compiled.pkl'
+
+# Scale factors that turn the keys of each Human FOP GAM term table into integers (FFMC to 0.1, DIST_ROAD to the
+# nearest 100 m, the other covariates to 0.01), and the suffix of the compiled dense term tables kept next to each
+# terms workbook (see FOPDataStores.HumanTermTable).
+HMN_TERM_TABLE_SCALES = OrderedDict([('DAY_OF_YEAR', 1), ('SPATIAL', 1), ('FFMC', 10), ('DIST_ROAD', 0.01), ('WATER', 100),
+                                     ('D.1.D.2', 100), ('WUI', 100), ('WII', 100), ('INF', 100)])
+HMN_TERM_TABLES_CACHE_SUFFIX = '_term_tables_compiled.pkl'
+
+# Name of the folder (inside the intermediate data folder) holding the per-day interpolated weather grids.
+# This store is shared by both the Lightning and Human FOP models.
+WEATHER_GRID_STORE_FOLDER_NAME = 'weather_grid_store'
+
+# Column headers for the interpolated weather grid store index file.
+WEATHER_GRID_STORE_INDEX_HEADERS = ['DATE', 'FINGERPRINT']
+
+# Name of the folder (inside the intermediate data folder) holding the raw weather observations, partitioned by day.
+# This store is shared by both the Lightning and Human FOP models.
+RAW_WEATHER_STORE_FOLDER_NAME = 'raw_weather_store'
+
+# Column headers for the raw weather store index file.
+RAW_WEATHER_STORE_INDEX_HEADERS = ['DATE', 'ROWS']
+
+# Name of the folder (inside the resource files folder, next to the cumulative Human FOP expected values and probabilities
+# file) holding the cumulative Human FOP predictions, partitioned by day.
+HMN_PREDICTIONS_STORE_FOLDER_NAME = 'hmn_predictions_store'
+
+# Column headers for the Human FOP predictions store index file.
+HMN_PREDICTIONS_STORE_INDEX_HEADERS = ['DATE', 'ROWS']
+
+# Whether the whole cumulative Human FOP expected values and probabilities file is still re-written (exported from the
+# predictions store) after every prediction run.
+HMN_CUMULATIVE_TEXT_EXPORT = False
+
+# Name of the folder (inside the intermediate data folder) holding the binary season probability cubes, which pass the
+# lightning arrival and holdover ignition probabilities from the probability stage to the simulator and the mapper.
+LTG_PROBABILITY_CUBE_FOLDER_NAME = 'ltg_probability_cube'
+
+# Whether the probability stage writes the binary season probability cubes (read by the simulator and the mapper in
+# place of the probabilities text file), and whether it still exports the space-delimited probabilities text file.
+LTG_PROBABILITY_CUBE_ENABLED = True
+LTG_PROBABILITY_TEXT_EXPORT = True
+
+# Days of the year covered by a season probability cube (the simulator's season: day 121 onwards, for 154 days).
+LTG_PROBABILITY_CUBE_FIRST_DAY = 121
+LTG_PROBABILITY_CUBE_DAYS = 154
+
+# Columns of the probabilities text file that hold probabilities (output to 10 decimal places).
+LTG_PROBABILITY_COLUMNS = ['probign', 'probarr0', 'probarr1']
+
+# Fields held for each grid cell and day in a season probability cube (in LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS order).
+LTG_PROBABILITY_CUBE_FIELDS = ['probign', 'probarr0', 'probarr1', 'totltg', 'numfire', 'region', 'nltg0', 'nltg1', 'nltg2',
+                               'nltg3', 'nltg4', 'dmc', 'dc']
+
+# Number of worker processes used to interpolate several days of weather at once (None uses one per CPU).
+WEATHER_INTERPOLATION_PROCESSES = None
+
+# Number of worker processes (or threads, inside daemonic processes) used to score the Human FOP forest areas
+# concurrently (None uses one per CPU, 1 scores them one after the other).
+HMN_SCORING_PROCESSES = None
+
+# Weather interpolation mode: 'spline' (thin-plate spline through every station) or 'local' (weighted average of the
+# k nearest stations to each grid cell; suited to dense station networks and finer grids).
+WEATHER_INTERPOLATION_MODE = 'spline'
+
+# Number of nearest stations, and the weighting kernel ('inverse_distance' or 'gaussian'), used by the 'local' mode,
+# along with the bandwidth of the 'gaussian' kernel (in kilometres).
+WEATHER_INTERPOLATION_NEAREST_STATIONS = 8
+WEATHER_INTERPOLATION_KERNEL = 'inverse_distance'
+WEATHER_INTERPOLATION_KERNEL_BANDWIDTH_KM = 50.0
 
 ######################################### FUNCTIONS #########################################
 
@@ -89,128 +250,296 @@ def daterange(start_date, end_date):
     for i in range(int((end_date - start_date).days)):
         yield start_date + datetime.timedelta(i)
 
-def rawWeatherDataMassager(input_df, output_path, weather_station_locations_path):
-        """ This method massages raw Alberta weather data into the format required for
-            Dr. Wotton's weather interpolation and gridding C programs.
+def hashFile(path):
+    """ This helper function returns the SHA-1 hash of the contents of the file at the given path. """
 
-            Input column headers:
-            id, ws_id, c_sky_cndt_id, c_wthr_typ_id, c_wnd_drct_id, weather_date, dry_bulb_temperature,
-            wet_bulb_temperature, minimum_temperature, maximum_temperature, relative_humidity, visibility_km,
-            wind_speed_kmh, wind_gust_kmh, rain_mm, snow_cm, hail_mm, dew_point, high_cloud_amt, middle_cloud_amt,
-            low_cloud_amt, cu_cloud_amt, cuplus_cloud_amt, cb_cloud_amt, grand_total, fine_fuel_moisture_code,
-            initial_spread_index, duff_moisture_code, build_up_index, drought_code, daily_severity_rating,
-            fire_weather_index, present_weather, weather_remarks, station_id, c_wnd_drct_type, c_sky_cndt_type, name
+    file_hash = hashlib.sha1()
 
-            Output format (no header, sorted chronologically - VERY IMPORTANT):
-            id, latitude, longitude, year, month, day, dry_bulb_temperature, relative_humidity,
-            wind_speed_kmh, rain_mm, fine_fuel_moisture_code, duff_moisture_code, drought_code,
-            initial_spread_index, build_up_index, fire_weather_index
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+def roundLikeBuiltin(values, ndigits):
+    """ This helper function rounds an array of floats to ndigits decimal places, giving exactly the same
+        result as calling Python's built-in round() on every element.
+
+        numpy's round() scales the values by 10 ** ndigits first, which can land a value on the wrong side of
+        a halfway point; those few values are re-rounded with the built-in round(). """
+
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits)
+
+    # Find the values that are (nearly) halfway between two rounded results once scaled.
+    with np.errstate(invalid='ignore', over='ignore'):
+        scaled = values * (10.0 ** ndigits)
+        near_halfway = np.isfinite(scaled) & \
+                       (np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-6 + 8 * np.spacing(np.abs(scaled)))
+
+    if near_halfway.any():
+        rounded[near_halfway] = [round(x, ndigits) for x in values[near_halfway].tolist()]
+
+    return rounded
+
+def readRawWeatherData(raw_weather_data_path):
+        """ This method reads in a raw weather data file for the FOP models.
+
+            The header line is checked first, and a ValueError is raised straight away if it does not match one of the
+            known raw weather data layouts (RAW_WEATHER_CSV_HEADERS or RAW_WEATHER_CSV_HEADERS_2). Otherwise, only the
+            columns used by the models (RAW_WEATHER_USED_COLUMN_TYPES) are read in, with their column headers made
+            lowercase and the 'weather_date' column parsed using the layout's timestamp format.
         """
 
-        output_headers = ['id', 'latitude', 'longitude', 'year', 'month', 'day', 'dry_bulb_temperature', 'relative_humidity',
-                          'wind_speed_kmh', 'rain_mm', 'fine_fuel_moisture_code', 'duff_moisture_code', 'drought_code',
-                          'initial_spread_index', 'build_up_index', 'fire_weather_index']
+        # Sniff the header line.
+        with open(raw_weather_data_path, 'r', newline='', encoding='utf-8-sig') as raw_weather_file:
+            header = next(csv.reader(raw_weather_file), [])
+
+        if header == RAW_WEATHER_CSV_HEADERS:
+            # Raw weather headers type 1.
+            date_format = RAW_WEATHER_CSV_DATE_FORMAT
+        elif header == RAW_WEATHER_CSV_HEADERS_2:
+            # Raw weather headers type 2.
+            date_format = RAW_WEATHER_CSV_DATE_FORMAT_2
+        else:
+            raise ValueError("Raw weather data columns do not match what is expected: %s" % raw_weather_data_path)
+
+        # Map each of the used columns to its header in this layout.
+        used_columns = OrderedDict((column, column_type) for column, column_type in
+                                   ((column, RAW_WEATHER_USED_COLUMN_TYPES.get(column.lower())) for column in header)
+                                   if column_type is not None)
+
+        raw_weather_data_df = pd.read_csv(raw_weather_data_path, sep=',', usecols=list(used_columns.keys()), dtype=used_columns)
+
+        # Make all of the weather column headers lowercase, in the order the models expect them.
+        raw_weather_data_df.columns = [column.lower() for column in raw_weather_data_df.columns]
+        raw_weather_data_df = raw_weather_data_df[list(RAW_WEATHER_USED_COLUMN_TYPES.keys())]
+
+        # Observations are hourly, so many share a timestamp; only parse each distinct timestamp once.
+        timestamp_codes, timestamps = pd.factorize(raw_weather_data_df['weather_date'])
+        raw_weather_data_df['weather_date'] = pd.to_datetime(timestamps, format=date_format).take(timestamp_codes, allow_fill=True,
+                                                                                                   fill_value=pd.NaT)
+
+        return raw_weather_data_df
+
+def reduceToStationDailyObservations(input_df, observation_hour=RAW_WEATHER_STANDARD_OBSERVATION_HOUR,
+                                     fallback=RAW_WEATHER_OBSERVATION_FALLBACK):
+        """ This method reduces raw weather observations (with 'station_id' and a parsed 'weather_date' column) to a
+            single observation per station per day, so that each station is only used once when the day's weather
+            is interpolated.
+
+            The first observation in the standard observation hour (noon LST by default) is used. For a station that
+            did not report in that hour, the fallback rule decides:
+            'nearest': the observation closest in time to the standard observation (the earlier one on a tie).
+            'before': the last observation before the standard observation hour.
+            'none': the station is left out for that day.
+
+            Returns the reduced dataframe, sorted chronologically.
+        """
 
-        # Load in the weather station locations file.
-        # input_weather_station_locations = pd.read_csv(self.ltg_weather_station_locations_path, sep=',', quotechar='"',
-        #                                               dtype={'id': int, 'station_name': str})
-        input_weather_station_locations = pd.read_csv(weather_station_locations_path, sep=',', quotechar='"',
-                                                      dtype={'STATION_NAME': str})
+        if fallback not in ['nearest', 'before', 'none']:
+            raise ValueError("Unknown raw weather observation fallback rule: %s" % fallback)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data...")
+        reduced_df = input_df.copy()
 
-        # Assign a random number to the 'id' column, Dr. Wotton's binning program doesn't care what the value is.
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - id...")
-        input_df['id'] = random.randint(1, 1001)
-        
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - latitude...")
-        # input_df['latitude'] = input_df['station_id'].apply(lambda x : round(float(input_weather_station_locations.loc[input_weather_station_locations['STATION_ID'] == x]['LATITUDE']), 4))
-        # Step 1: Filter input_weather_station_locations based on 'station_id'
+        observation_day = reduced_df['weather_date'].dt.normalize()
+        offset = reduced_df['weather_date'] - (observation_day + pd.Timedelta(hours=observation_hour))
+        in_standard_hour = reduced_df['weather_date'].dt.hour == observation_hour
+
+        # Rank each station's observations for the day: observations in the standard hour first (earliest first),
+        # then the fallback candidates in order of preference.
+        if fallback == 'nearest':
+            candidate = pd.Series(True, index=reduced_df.index)
+            preference = offset.abs() + (offset > pd.Timedelta(0)) * pd.Timedelta(microseconds=1)
+        elif fallback == 'before':
+            candidate = in_standard_hour | (offset < pd.Timedelta(0))
+            preference = -offset
+        else:
+            candidate = in_standard_hour
+            preference = offset
+
+        reduced_df['_observation_day'] = observation_day
+        reduced_df['_fallback'] = ~in_standard_hour
+        reduced_df['_preference'] = preference.where(~in_standard_hour, offset)
+
+        reduced_df = reduced_df.loc[candidate]
+        reduced_df = reduced_df.sort_values(by=['station_id', '_observation_day', '_fallback', '_preference'], kind='mergesort')
+        reduced_df = reduced_df.drop_duplicates(subset=['station_id', '_observation_day'], keep='first')
+
+        # Put the observations back in chronological order (VERY IMPORTANT for the massaged weather output).
+        reduced_df = reduced_df.sort_index().sort_values(by='weather_date', kind='mergesort')
 
-        # print("step 1")
+        return reduced_df.drop(columns=['_observation_day', '_fallback', '_preference'])
 
-        input_df['filtered_location'] = input_df['station_id'].apply(lambda x: input_weather_station_locations[input_weather_station_locations['STATION_ID'] == x])
+def logistic(values):
+    """ This helper function returns exp(x) / (1 + exp(x)) for an array of values. """
 
- 
+    exp_values = np.exp(np.asarray(values, dtype=float))
 
-        # Step 2: Extract latitude from the filtered locations
+    return exp_values / (1 + exp_values)
 
-        # print("step 2")
+def humanStaticEffects(intercept, term_tables, variables_df):
+    """ This helper function returns the static (date-independent) part of the Human FOP forest area model's logit
+        for every cell in a variables file: the sum of the intercept and the SPATIAL, DIST_ROAD, WATER, D.1.D.2, WUI,
+        WII and INF terms, which only depend on the cell. Only the FFMC and DAY_OF_YEAR terms are left to add daily.
 
-        input_df['latitude'] = input_df['filtered_location'].apply(lambda x: float(x['LATITUDE'].values[0]) if not x.empty else None)
+        term_tables are the forest area's dense term tables (see FOPDataStores.loadCompiledHumanTermTables()). The
+        result is an array in variables file row order; cells with a term that can not be looked up are given NaN.
+        The covariates are rounded exactly as Python's round() would round them. """
 
- 
+    return (intercept +
+            term_tables['SPATIAL'].gather(variables_df['FISHNET_AB'].values, 'te(X,Y)') +
+            term_tables['DIST_ROAD'].gather(roundLikeBuiltin(variables_df['DIST_ROAD'].values / 100, 0) * 100, 's(DIST_ROAD)') +
+            term_tables['WATER'].gather(roundLikeBuiltin(variables_df['WATER'].values, 2), 's(WATER)') +
+            term_tables['D.1.D.2'].gather(roundLikeBuiltin(variables_df['D.1.D.2'].values, 2), 's(D.1.D.2)') +
+            term_tables['WUI'].gather(roundLikeBuiltin(variables_df['WUI'].values, 2), 's(WUI)') +
+            term_tables['WII'].gather(roundLikeBuiltin(variables_df['WII'].values, 2), 's(WII)') +
+            term_tables['INF'].gather(roundLikeBuiltin(variables_df['INF'].values, 2), 's(INF)')
+            )
 
-        # Step 3: Round latitude to 4 decimal places
+def poissonBinomialDistribution(probabilities):
+    """ This helper function returns the exact distribution of the number of successes among independent Bernoulli
+        trials with the given success probabilities (a Poisson-binomial distribution), as an array whose k-th element
+        is the probability of exactly k successes.
 
-        # print("step 3")
+        The distribution is built up one trial at a time (a dynamic programme over the number of successes so far).
+        Probabilities of 0 or less (e.g. cells without valid data) can never succeed and are left out. """
 
-        input_df['latitude'] = input_df['latitude'].apply(lambda x: round(x, 4) if x is not None else None)
+    probabilities = np.asarray(probabilities, dtype=float)
+    probabilities = np.minimum(probabilities[probabilities > 0], 1.0)
 
- 
+    distribution = np.zeros(len(probabilities) + 1)
+    distribution[0] = 1.0
 
-        # Step 4: Drop the intermediate column 'filtered_location'
+    for trial, probability in enumerate(probabilities.tolist()):
+        distribution[1:trial + 2] = distribution[1:trial + 2] * (1 - probability) + distribution[0:trial + 1] * probability
+        distribution[0] *= 1 - probability
 
-        # print("step 4")
+    return distribution
 
-        input_df.drop(columns=['filtered_location'], inplace=True)
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - longitude...")
-        # input_df['longitude'] = input_df['station_id'].apply(lambda x : round(float(input_weather_station_locations.loc[input_weather_station_locations['STATION_ID'] == x]['LONGITUDE']), 4))
-        input_df['filtered_location'] = input_df['station_id'].apply(lambda x: input_weather_station_locations[input_weather_station_locations['STATION_ID'] == x])
+def poissonBinomialQuantiles(probabilities, quantile_levels):
+    """ This helper function returns the exact quantiles of the number of successes among independent Bernoulli trials
+        with the given success probabilities: for each level q in quantile_levels, the smallest count k such that the
+        probability of k or fewer successes is at least q. """
 
-        input_df['longitude'] = input_df['filtered_location'].apply(lambda x: float(x['LONGITUDE'].values[0]) if not x.empty else None)
+    cumulative_distribution = np.cumsum(poissonBinomialDistribution(probabilities))
 
-        input_df['longitude'] = input_df['longitude'].apply(lambda x: round(x, 4) if x is not None else None)
+    return [int(min(np.searchsorted(cumulative_distribution, level, side='left'), len(cumulative_distribution) - 1)) for level in quantile_levels]
 
-        input_df.drop(columns=['filtered_location'], inplace=True)
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - year...")
-        input_df['year'] = input_df['weather_date'].apply(lambda x : x.year)
+def humanRegionalConfidenceIntervals(probabilities, regions, hmn_fire_confidence_interval):
+    """ This helper function returns the exact Human FOP confidence interval bounds for the whole Province of Alberta and
+        each of the HMN_CI_REGIONS, given the fire probability and CI region (region_ci) of every cell, as the list
+        [Alberta low, Alberta high, Slopes low, Slopes high, West Boreal low, ..., East Boreal high]. """
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - month...")
-        input_df['month'] = input_df['weather_date'].apply(lambda x : x.month)
+    # The low and high bounds are the quantiles that leave (1 - confidence) / 2 of the distribution on either side.
+    ci_levels = [(1 - (hmn_fire_confidence_interval / 100)) / 2, 1 - (1 - (hmn_fire_confidence_interval / 100)) / 2]
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - day...")
-        input_df['day'] = input_df['weather_date'].apply(lambda x : x.day)
+    probabilities = np.asarray(probabilities, dtype=float)
+    regions = np.asarray(regions)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - dry_bulb_temperature...")
-        input_df['dry_bulb_temperature'] = input_df['dry_bulb_temperature'].apply(lambda x : round(x, 1))
-        input_df['dry_bulb_temperature'] = input_df['dry_bulb_temperature'].apply(lambda x : '-999.9' if isnan(x) else x)
+    confidence_interval_bounds = poissonBinomialQuantiles(probabilities, ci_levels)
+    for region in HMN_CI_REGIONS:
+        confidence_interval_bounds += poissonBinomialQuantiles(probabilities[regions == region], ci_levels)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - relative_humidity...")
-        input_df['relative_humidity'] = input_df['relative_humidity'].apply(lambda x : round(x, 1))
-        input_df['relative_humidity'] = input_df['relative_humidity'].apply(lambda x : -999.9 if isnan(x) else x)
+    return confidence_interval_bounds
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - wind_speed_kmh...")
-        input_df['wind_speed_kmh'] = input_df['wind_speed_kmh'].apply(lambda x : round(x, 1))
-        input_df['wind_speed_kmh'] = input_df['wind_speed_kmh'].apply(lambda x : -999.9 if isnan(x) else x)
+def simulateRegionalFireCounts(probabilities, region_codes, num_regions, replications, block_replications=HMN_SIMULATION_BLOCK_REPLICATIONS,
+                               random_generator=None):
+    """ This helper function simulates the number of fires in each region over many replications of a day, where each
+        cell is an independent trial that has a fire with its given probability. region_codes holds the region of each
+        cell, as an integer from 0 to num_regions - 1.
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - rain_mm...")
-        input_df['rain_mm'] = input_df['rain_mm'].apply(lambda x : round(x, 2))
-        input_df['rain_mm'] = input_df['rain_mm'].apply(lambda x : -999.9 if isnan(x) else x)
+        Returns a replications x num_regions array of fire counts. The replications are simulated block_replications
+        at a time, as a matrix of float32 uniforms compared against the cells' probabilities and reduced to counts per
+        replication and region with a single bincount, so the memory used does not grow with the replication count.
+        Unless a numpy Generator is given, one is seeded from numpy's global random state (so np.random.seed() still
+        makes the simulation repeatable). """
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - fine_fuel_moisture_code...")
-        input_df['fine_fuel_moisture_code'] = input_df['fine_fuel_moisture_code'].apply(lambda x : round(x, 1))
-        input_df['fine_fuel_moisture_code'] = input_df['fine_fuel_moisture_code'].apply(lambda x : -999.9 if isnan(x) else x)
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    region_codes = np.asarray(region_codes, dtype=np.int64)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - duff_moisture_code...")
-        input_df['duff_moisture_code'] = input_df['duff_moisture_code'].apply(lambda x : round(x, 1))
-        input_df['duff_moisture_code'] = input_df['duff_moisture_code'].apply(lambda x : -999.9 if isnan(x) else x)
+    if random_generator is None:
+        random_generator = np.random.default_rng(np.random.randint(np.iinfo(np.int32).max))
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - drought_code...")
-        input_df['drought_code'] = input_df['drought_code'].apply(lambda x : round(x, 1))
-        input_df['drought_code'] = input_df['drought_code'].apply(lambda x : -999.9 if isnan(x) else x)
+    fire_counts = np.zeros((replications, num_regions), dtype=np.int64)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - initial_spread_index...")
-        input_df['initial_spread_index'] = input_df['initial_spread_index'].apply(lambda x : round(x, 1))
-        input_df['initial_spread_index'] = input_df['initial_spread_index'].apply(lambda x : -999.9 if isnan(x) else x)
+    for block_start in range(0, replications, block_replications):
+        block_size = min(block_replications, replications - block_start)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - build_up_index...")
-        input_df['build_up_index'] = input_df['build_up_index'].apply(lambda x : round(x, 1))
-        input_df['build_up_index'] = input_df['build_up_index'].apply(lambda x : -999.9 if isnan(x) else x)
+        # A fire happens in a cell when its uniform draw falls below its probability (never, for probabilities <= 0).
+        replication_indices, cell_indices = np.nonzero(random_generator.random((block_size, len(probabilities)), dtype=np.float32) < probabilities)
+
+        fire_counts[block_start:block_start + block_size] = np.bincount(replication_indices * num_regions + region_codes[cell_indices],
+                                                                        minlength=block_size * num_regions).reshape(block_size, num_regions)
+
+    return fire_counts
+
+def formatProbabilities(values):
+    """ This helper function formats an array of probabilities to 10 decimal places, without trailing zeros. """
+
+    return [('%.10f' % x).rstrip('0') for x in np.asarray(values, dtype=float).tolist()]
+
+def rawWeatherDataMassager(input_df, output_path, weather_station_locations_path):
+        """ This method massages raw Alberta weather data into the format required for
+            Dr. Wotton's weather interpolation and gridding C programs.
+
+            Input column headers:
+            id, ws_id, c_sky_cndt_id, c_wthr_typ_id, c_wnd_drct_id, weather_date, dry_bulb_temperature,
+            wet_bulb_temperature, minimum_temperature, maximum_temperature, relative_humidity, visibility_km,
+            wind_speed_kmh, wind_gust_kmh, rain_mm, snow_cm, hail_mm, dew_point, high_cloud_amt, middle_cloud_amt,
+            low_cloud_amt, cu_cloud_amt, cuplus_cloud_amt, cb_cloud_amt, grand_total, fine_fuel_moisture_code,
+            initial_spread_index, duff_moisture_code, build_up_index, drought_code, daily_severity_rating,
+            fire_weather_index, present_weather, weather_remarks, station_id, c_wnd_drct_type, c_sky_cndt_type, name
+
+            Output format (no header, sorted chronologically - VERY IMPORTANT):
+            id, latitude, longitude, year, month, day, dry_bulb_temperature, relative_humidity,
+            wind_speed_kmh, rain_mm, fine_fuel_moisture_code, duff_moisture_code, drought_code,
+            initial_spread_index, build_up_index, fire_weather_index
+        """
+
+        output_headers = ['id', 'latitude', 'longitude', 'year', 'month', 'day', 'dry_bulb_temperature', 'relative_humidity',
+                          'wind_speed_kmh', 'rain_mm', 'fine_fuel_moisture_code', 'duff_moisture_code', 'drought_code',
+                          'initial_spread_index', 'build_up_index', 'fire_weather_index']
+
+        # Load in the weather station locations file.
+        # input_weather_station_locations = pd.read_csv(self.ltg_weather_station_locations_path, sep=',', quotechar='"',
+        #                                               dtype={'id': int, 'station_name': str})
+        input_weather_station_locations = pd.read_csv(weather_station_locations_path, sep=',', quotechar='"',
+                                                      dtype={'STATION_NAME': str})
+
+        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data...")
+
+        # Assign a random number to the 'id' column, Dr. Wotton's binning program doesn't care what the value is.
+        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - id...")
+        input_df['id'] = random.randint(1, 1001)
 
-        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - fire_weather_index...")
-        input_df['fire_weather_index'] = input_df['fire_weather_index'].apply(lambda x : round(x, 1))
-        input_df['fire_weather_index'] = input_df['fire_weather_index'].apply(lambda x : -999.9 if isnan(x) else x)
+        # Build a lookup table of station locations keyed by station ID, rounded to 4 decimal places. Where a station ID
+        # is listed more than once, its first location is used.
+        station_locations = input_weather_station_locations.dropna(subset=['STATION_ID'])
+        station_locations = station_locations.drop_duplicates(subset='STATION_ID', keep='first').set_index('STATION_ID')
+
+        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - latitude / longitude...")
+        # Join each observation to its station's location with a single hash lookup; observations from unknown
+        # stations get a blank location.
+        for column in ['LATITUDE', 'LONGITUDE']:
+            station_coordinates = pd.Series(roundLikeBuiltin(station_locations[column].astype(float), 4),
+                                            index=station_locations.index)
+            input_df[column.lower()] = input_df['station_id'].map(station_coordinates)
+
+        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - year / month / day...")
+        input_df['year'] = input_df['weather_date'].dt.year
+        input_df['month'] = input_df['weather_date'].dt.month
+        input_df['day'] = input_df['weather_date'].dt.day
+
+        # Round the weather columns (rain to 2 decimal places, everything else to 1), and flag missing values as -999.9.
+        # Integer columns cannot be missing and are already rounded, so they are written out as they are.
+        # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - weather columns...")
+        for column, ndigits in RAW_WEATHER_MASSAGED_COLUMN_DECIMALS.items():
+            if pd.api.types.is_integer_dtype(input_df[column]):
+                continue
+
+            rounded = roundLikeBuiltin(input_df[column].astype(float), ndigits)
+            input_df[column] = np.where(np.isnan(rounded), -999.9, rounded)
 
         # print("FOPConstantsAndFunctions().rawWeatherDataMassager(): Massaging raw weather data - Applying column types...")
         input_df['id'] = input_df['id'].astype('int32')
@@ -0,0 +1,635 @@
+""" This file contains the on-disk data stores shared by the Lightning and Human FOP models.
+"""
+
+import datetime
+import json
+import os
+import shutil
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import FOPConstantsAndFunctions
+import FOPGridRegistry
+import FOPWeatherInterpolation
+
+######################################### CLASSES #########################################
+
+class WeatherGridStore(object):
+    """ This class holds the interpolated and binned weather grids, one per day, keyed by date.
+
+        Each day's grid is an array of grid cells (in grid registry order) by the ten weather variables, and is
+        saved along with a fingerprint of the massaged weather observations it was interpolated from. A day is only
+        re-interpolated when its observations change, and either FOP model can read a day back from the store. """
+
+    def __init__(self, store_folder, grid_locations_path,
+                 interpolation_mode=FOPConstantsAndFunctions.WEATHER_INTERPOLATION_MODE,
+                 nearest_stations=FOPConstantsAndFunctions.WEATHER_INTERPOLATION_NEAREST_STATIONS,
+                 kernel=FOPConstantsAndFunctions.WEATHER_INTERPOLATION_KERNEL,
+                 kernel_bandwidth_km=FOPConstantsAndFunctions.WEATHER_INTERPOLATION_KERNEL_BANDWIDTH_KM,
+                 smoothing_factors=FOPWeatherInterpolation.WEATHER_INTERPOLATION_SMOOTHING_FACTORS):
+
+        self.store_folder = store_folder
+        self.index_path = os.path.join(store_folder, 'index.csv')
+
+        # Settings passed on to the interpolation; these are part of each day's fingerprint, so changing them
+        # causes the affected days to be re-interpolated. The kernel is given by name (see
+        # FOPWeatherInterpolation.localInterpolationKernel()), and its bandwidth only matters to the 'gaussian' kernel.
+        if interpolation_mode == FOPWeatherInterpolation.WEATHER_INTERPOLATION_MODE_LOCAL:
+            FOPWeatherInterpolation.localInterpolationKernel(kernel)
+            self.interpolation_settings = {'mode': interpolation_mode, 'nearest_stations': nearest_stations, 'kernel': kernel}
+            if kernel == 'gaussian':
+                self.interpolation_settings['kernel_bandwidth_km'] = float(kernel_bandwidth_km)
+        else:
+            self.interpolation_settings = {'mode': interpolation_mode,
+                                           'smoothing_factors': list(smoothing_factors)}
+
+        # Load the grid cells that the weather is interpolated onto; row i of each day's grid is grid cell i in the registry.
+        self.grid_registry = FOPGridRegistry.getGridRegistry(grid_locations_path)
+        self.grid_ids = self.grid_registry.ids
+        self.grid_latitudes = self.grid_registry.latitudes
+        self.grid_longitudes = self.grid_registry.longitudes
+
+        # Create the store on first use.
+        if not os.path.isdir(store_folder):
+            os.makedirs(store_folder)
+
+        if os.path.isfile(self.index_path):
+            self.index_df = pd.read_csv(self.index_path, sep=',', dtype=str)
+        else:
+            self.index_df = pd.DataFrame(columns=FOPConstantsAndFunctions.WEATHER_GRID_STORE_INDEX_HEADERS)
+
+        self.index_df.set_index('DATE', inplace=True)
+
+    def _dayGridPath(self, date):
+        """ Returns the path of the file holding the grid for the given date. """
+
+        return os.path.join(self.store_folder, 'weather_grid_' + date.strftime('%Y-%m-%d') + '.npy')
+
+    def update(self, massaged_weather_path, processes=FOPConstantsAndFunctions.WEATHER_INTERPOLATION_PROCESSES):
+        """ Interpolates every day found in the massaged weather file whose observations are new or have changed
+            since they were last interpolated, and saves them to the store. When several days need interpolating,
+            they are interpolated in parallel across a pool of processes (see interpolateWeatherDays()).
+
+            Returns the list of dates found in the massaged weather file. """
+
+        days = FOPWeatherInterpolation.readMassagedWeatherByDay(massaged_weather_path)
+
+        # Find the days which have not already been interpolated from the same observations.
+        stale_days = OrderedDict()
+        fingerprints = {}
+
+        for date, day_records in days.items():
+            date_key = date.strftime('%Y-%m-%d')
+            fingerprints[date] = FOPWeatherInterpolation.fingerprintWeatherDay(day_records, **self.interpolation_settings)
+
+            if date_key in self.index_df.index and self.index_df.at[date_key, 'FINGERPRINT'] == fingerprints[date] and \
+               os.path.isfile(self._dayGridPath(date)):
+                continue
+
+            stale_days[date] = day_records
+
+        day_grids = FOPWeatherInterpolation.interpolateWeatherDays(stale_days, self.grid_latitudes, self.grid_longitudes,
+                                                                   processes=processes, **self.interpolation_settings)
+
+        for date, day_grid in day_grids.items():
+            np.save(self._dayGridPath(date), day_grid)
+            self.index_df.at[date.strftime('%Y-%m-%d'), 'FINGERPRINT'] = fingerprints[date]
+
+        # Write the updated index to disk.
+        self.index_df.sort_index().to_csv(self.index_path, sep=',', index=True)
+
+        return list(days.keys())
+
+    def getDayGrid(self, date):
+        """ Returns the interpolated weather grid for the given date (grid cells by weather variables). """
+
+        date = datetime.date(date.year, date.month, date.day)
+
+        if date.strftime('%Y-%m-%d') not in self.index_df.index:
+            raise KeyError("No interpolated weather grid in the store for %s." % date.strftime('%Y-%m-%d'))
+
+        return np.load(self._dayGridPath(date))
+
+    def getDayFrame(self, date):
+        """ Returns the interpolated and binned weather for the given date as a dataframe, with the same rows and
+            columns as the binned weather file (INTERPOLATED_BINNED_WEATHER_DATA_HEADERS).
+            As with use_cf2.py, only the grid cells with a valid relative humidity value are included. """
+
+        day_grid = self.getDayGrid(date)
+        valid = day_grid[:, 1] > -900.0
+
+        day_df = pd.DataFrame(day_grid[valid], columns=FOPWeatherInterpolation.WEATHER_INTERPOLATION_VARIABLES)
+        day_df.insert(0, 'grid', self.grid_ids[valid])
+        day_df.insert(1, 'year', date.year)
+        day_df.insert(2, 'month', date.month)
+        day_df.insert(3, 'day', date.day)
+        day_df.columns = FOPConstantsAndFunctions.INTERPOLATED_BINNED_WEATHER_DATA_HEADERS
+
+        return day_df
+
+    def getDaysFrame(self, dates):
+        """ Returns the interpolated and binned weather for all of the given dates as a single dataframe. """
+
+        if len(dates) == 0:
+            return pd.DataFrame(columns=FOPConstantsAndFunctions.INTERPOLATED_BINNED_WEATHER_DATA_HEADERS)
+
+        return pd.concat([self.getDayFrame(date) for date in dates], ignore_index=True)
+
+    def writeBinnedWeatherFile(self, dates, output_path):
+        """ Writes the interpolated and binned weather for the given dates out in the same format as use_cf2.py. """
+
+        self.getDaysFrame(dates).to_csv(output_path, sep=',', header=False, index=False, float_format='%.1f')
+
+class RawWeatherStore(object):
+    """ This class holds the raw weather observations from an uploaded raw weather data file, partitioned by day.
+
+        The store is built once per raw weather data file (keyed by the SHA-1 hash of its contents): the file is read
+        in and sorted chronologically once, and each day's observations are saved to their own partition. Fetching
+        a day's observations is then a single partition read, rather than a full parse and sort of the file. """
+
+    def __init__(self, store_folder, raw_weather_data_path):
+
+        self.store_folder = store_folder
+        self.raw_weather_data_path = raw_weather_data_path
+
+        # Each raw weather data file gets its own folder in the store, named after the hash of its contents.
+        self.file_hash = FOPConstantsAndFunctions.hashFile(raw_weather_data_path)
+        self.partition_folder = os.path.join(store_folder, self.file_hash)
+        self.index_path = os.path.join(self.partition_folder, 'index.csv')
+
+        # The index is written last, so a partition folder without one was not built completely.
+        if not os.path.isfile(self.index_path):
+            self._build()
+
+        self.index_df = pd.read_csv(self.index_path, sep=',', dtype={'DATE': str, 'ROWS': np.int64})
+        self.index_df.set_index('DATE', inplace=True)
+
+    def _dayPartitionPath(self, date):
+        """ Returns the path of the partition holding the observations for the given date. """
+
+        return os.path.join(self.partition_folder, 'raw_weather_' + date.strftime('%Y-%m-%d') + '.pkl')
+
+    def _build(self):
+        """ Reads in the raw weather data file, and saves each day's observations to its own partition. """
+
+        # Only the partitions for the current raw weather data file are kept.
+        if os.path.isdir(self.store_folder):
+            for folder_name in os.listdir(self.store_folder):
+                if folder_name != self.file_hash:
+                    shutil.rmtree(os.path.join(self.store_folder, folder_name), ignore_errors=True)
+
+        if not os.path.isdir(self.partition_folder):
+            os.makedirs(self.partition_folder)
+
+        raw_weather_data_df = FOPConstantsAndFunctions.readRawWeatherData(self.raw_weather_data_path)
+
+        # Sort the raw weather dataframe by the column: "weather_date".
+        raw_weather_data_df = raw_weather_data_df.sort_values(by='weather_date')
+
+        index_rows = []
+
+        for day, day_df in raw_weather_data_df.groupby(raw_weather_data_df['weather_date'].dt.date, sort=True):
+            day_df.to_pickle(self._dayPartitionPath(day))
+            index_rows.append([day.strftime('%Y-%m-%d'), len(day_df)])
+
+        pd.DataFrame(index_rows, columns=FOPConstantsAndFunctions.RAW_WEATHER_STORE_INDEX_HEADERS).to_csv(self.index_path, sep=',', index=False)
+
+    def getDates(self):
+        """ Returns the list of dates that have raw weather observations, in chronological order. """
+
+        return [datetime.datetime.strptime(date, '%Y-%m-%d').date() for date in self.index_df.index]
+
+    def getDay(self, date):
+        """ Returns the raw weather observations for the given date, in chronological order (see readRawWeatherData()
+            for the columns). If there are no observations for the date, an empty dataframe is returned. """
+
+        date = datetime.date(date.year, date.month, date.day)
+
+        if date.strftime('%Y-%m-%d') not in self.index_df.index:
+            return pd.DataFrame(columns=list(FOPConstantsAndFunctions.RAW_WEATHER_USED_COLUMN_TYPES.keys()))
+
+        return pd.read_pickle(self._dayPartitionPath(date))
+
+class HumanPredictionsStore(object):
+    """ This class holds the cumulative Human FOP expected values and probabilities (one row per fishnet cell and day,
+        with the HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS columns), partitioned by day.
+
+        Writing a day's predictions replaces only that day's partition, and readers fetch the days they need by date,
+        so neither gets slower as the season fills up. When the store is first created, it is seeded with the rows
+        of the cumulative Human FOP expected values and probabilities file (if there is one) that it replaces. """
+
+    # Columns read back from the cumulative file as numbers, and the decimal places that the columns are rounded to.
+    NUMERIC_COLUMNS = ['fishnet_id', 'day_of_year', 'latitude', 'longitude', 'nsr_numerical_code', 'ffmc_interpolated', 'logit', 'probability']
+    ROUNDED_COLUMNS = [('latitude', 4), ('longitude', 4), ('logit', 12), ('probability', 12)]
+
+    def __init__(self, store_folder, cumulative_file_path=None):
+
+        self.store_folder = store_folder
+        self.index_path = os.path.join(store_folder, 'index.csv')
+
+        # The index is written last, so a store folder without one was not seeded completely.
+        if not os.path.isfile(self.index_path):
+            if not os.path.isdir(store_folder):
+                os.makedirs(store_folder)
+
+            self.index_df = pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_PREDICTIONS_STORE_INDEX_HEADERS).set_index('DATE')
+
+            if cumulative_file_path is not None and os.path.isfile(cumulative_file_path):
+                cumulative_df = pd.read_csv(cumulative_file_path, sep=',', parse_dates=['date'])
+                cumulative_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
+                self.putDays(cumulative_df)
+
+            self._writeIndex()
+
+        self.index_df = pd.read_csv(self.index_path, sep=',', dtype={'DATE': str, 'ROWS': np.int64})
+        self.index_df.set_index('DATE', inplace=True)
+
+    def _dayPartitionPath(self, date):
+        """ Returns the path of the partition holding the predictions for the given date. """
+
+        return os.path.join(self.store_folder, 'hmn_predictions_' + date.strftime('%Y-%m-%d') + '.pkl')
+
+    def _writeIndex(self):
+        """ Writes the index of the stored days to disk (through a temporary file, so it is never partially written). """
+
+        self.index_df.sort_index().to_csv(self.index_path + '.tmp', sep=',', index=True)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def putDays(self, predictions_df):
+        """ Saves the given predictions (HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS columns), replacing the partition of
+            every day found in them. Each day's rows are sorted by fishnet_id, rounded as Python's round() would round
+            them, and duplicate rows are dropped, as the cumulative file always was. """
+
+        predictions_df = predictions_df.copy()
+        predictions_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
+        predictions_df['date'] = pd.to_datetime(predictions_df['date'])
+
+        for column in self.NUMERIC_COLUMNS:
+            predictions_df[column] = pd.to_numeric(predictions_df[column])
+        for column, ndigits in self.ROUNDED_COLUMNS:
+            predictions_df[column] = FOPConstantsAndFunctions.roundLikeBuiltin(predictions_df[column].values, ndigits)
+
+        for day, day_df in predictions_df.groupby(predictions_df['date'].dt.date, sort=True):
+            day_df = day_df.sort_values('fishnet_id', kind='mergesort').drop_duplicates(keep='first').reset_index(drop=True)
+
+            # Write to a temporary file first, so that a partially-written partition is never picked up.
+            day_df.to_pickle(self._dayPartitionPath(day) + '.tmp')
+            os.replace(self._dayPartitionPath(day) + '.tmp', self._dayPartitionPath(day))
+
+            self.index_df.loc[day.strftime('%Y-%m-%d'), 'ROWS'] = len(day_df)
+
+        self._writeIndex()
+
+    def getDates(self):
+        """ Returns the list of dates that have predictions, in chronological order. """
+
+        return [datetime.datetime.strptime(date, '%Y-%m-%d').date() for date in sorted(self.index_df.index)]
+
+    def getDay(self, date):
+        """ Returns the predictions for the given date, sorted by fishnet_id. If there are no predictions for the date,
+            an empty dataframe is returned. """
+
+        date = datetime.date(date.year, date.month, date.day)
+
+        if date.strftime('%Y-%m-%d') not in self.index_df.index:
+            return pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS)
+
+        return pd.read_pickle(self._dayPartitionPath(date))
+
+    def getDays(self, dates):
+        """ Returns the predictions for all of the given dates as a single dataframe, in the order of the dates. """
+
+        days_dfs = [self.getDay(date) for date in dates]
+        days_dfs = [day_df for day_df in days_dfs if not day_df.empty]
+
+        if len(days_dfs) == 0:
+            return pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS)
+
+        return pd.concat(days_dfs, ignore_index=True)
+
+    def exportCumulativeFile(self, output_path):
+        """ Writes every stored day out in the format of the cumulative Human FOP expected values and probabilities file. """
+
+        self.getDays(self.getDates()).to_csv(output_path, sep=',', index=False)
+
+class LightningProbabilityCube(object):
+    """ This class holds the lightning fire arrival and holdover ignition probabilities as binary season cubes, one per
+        year. Each cube is an array of days of the fire season (starting on day of year LTG_PROBABILITY_CUBE_FIRST_DAY)
+        by grid cells (in grid registry order) by fields (LTG_PROBABILITY_CUBE_FIELDS), with NaNs wherever there is no
+        probability row for a grid cell and day.
+
+        The cubes are the interchange format between the probability stage, the simulator and the mapper. They are
+        partitioned by day: each day is a contiguous slice of its year's cube, so a run only rewrites (upserts) the
+        days that it computed, and the days before them (needed for the holdover lookback) are kept. Readers memory-map
+        the cubes and only touch the days they need. The folder also holds the grid cells (ID, lat and long) and a
+        manifest describing the layout of the cubes, so that they can be read without this class. """
+
+    def __init__(self, cube_folder, grid_locations_path):
+
+        self.cube_folder = cube_folder
+        self.manifest_path = os.path.join(cube_folder, 'manifest.json')
+        self.cells_path = os.path.join(cube_folder, 'cells.npy')
+
+        self.grid_registry = FOPGridRegistry.getGridRegistry(grid_locations_path)
+        self.fields = FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_FIELDS
+        self.first_day = FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_FIRST_DAY
+        self.days = FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_DAYS
+
+        # Days being built up in memory (by addColumns()), keyed by (year, day of year), along with the grid cell lat/longs.
+        self._day_slices = OrderedDict()
+        self._latitudes = np.full(len(self.grid_registry), np.nan)
+        self._longitudes = np.full(len(self.grid_registry), np.nan)
+
+    def _yearCubePath(self, year):
+        """ Returns the path of the file holding the cube for the given year. """
+
+        return os.path.join(self.cube_folder, 'probabilities_%d.npy' % year)
+
+    def _readManifest(self):
+        """ Returns the manifest of the cube folder, or None if there is no (compatible) manifest. """
+
+        if not os.path.isfile(self.manifest_path):
+            return None
+
+        with open(self.manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        layout = {'first_day': self.first_day, 'days': self.days, 'fields': self.fields, 'cells': len(self.grid_registry)}
+        if any(manifest.get(key) != value for key, value in layout.items()):
+            return None
+
+        return manifest
+
+    def addColumns(self, output_columns):
+        """ Adds the given probability rows to the days being built. output_columns holds a list (or array) of values
+            for each column in LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS, with the probabilities as floats rounded to
+            the 10 decimal places written to the probabilities text file. Rows outside of the fire season covered by
+            the cubes are left out. """
+
+        cells = self.grid_registry.indexOf(np.array(output_columns['grid'], dtype=np.int64))
+        years = np.array(output_columns['year'], dtype=np.int64)
+        days = np.array(output_columns['jd'], dtype=np.int64)
+
+        keep = (cells >= 0) & (days >= self.first_day) & (days < self.first_day + self.days)
+
+        # The fields are stored as the values written to the text file, so that the simulator reads in the same values
+        # whichever file it is given.
+        values = np.column_stack([np.asarray(output_columns[field], dtype=float) for field in self.fields])
+
+        self._latitudes[cells[keep]] = np.array(output_columns['lat'], dtype=float)[keep]
+        self._longitudes[cells[keep]] = np.array(output_columns['lon'], dtype=float)[keep]
+
+        year_days = years * 1000 + days
+        for year_day in np.unique(year_days[keep]).tolist():
+            key = (year_day // 1000, year_day % 1000)
+            if key not in self._day_slices:
+                self._day_slices[key] = np.full((len(self.grid_registry), len(self.fields)), np.nan)
+
+            in_day = keep & (year_days == year_day)
+            self._day_slices[key][cells[in_day]] = values[in_day]
+
+    def save(self):
+        """ Upserts the days built by addColumns() into the cubes: each of these days replaces the stored day in its
+            year's cube (which is created if need be), and every other stored day is left as it is. """
+
+        manifest = self._readManifest()
+
+        # Start the store over if it was written with a different layout (or grid).
+        if manifest is None:
+            if os.path.isdir(self.cube_folder):
+                shutil.rmtree(self.cube_folder)
+
+            manifest = {'first_day': self.first_day, 'days': self.days, 'fields': self.fields,
+                        'cells': len(self.grid_registry), 'stored_days': {}}
+
+        if not os.path.isdir(self.cube_folder):
+            os.makedirs(self.cube_folder)
+
+        for (year, day), day_slice in self._day_slices.items():
+            year_cube_path = self._yearCubePath(year)
+
+            if str(year) in manifest['stored_days'] and os.path.isfile(year_cube_path):
+                year_cube = np.lib.format.open_memmap(year_cube_path, mode='r+')
+            else:
+                year_cube = np.lib.format.open_memmap(year_cube_path, mode='w+', dtype=np.float64,
+                                                      shape=(self.days, len(self.grid_registry), len(self.fields)))
+                year_cube[:] = np.nan
+                manifest['stored_days'][str(year)] = []
+
+            year_cube[day - self.first_day] = day_slice
+            year_cube.flush()
+            del year_cube
+
+            manifest['stored_days'][str(year)] = sorted(set(manifest['stored_days'][str(year)]) | {day})
+
+        # Keep the lat/longs of the grid cells from earlier runs that were not computed in this run.
+        latitudes, longitudes = self._latitudes, self._longitudes
+        if os.path.isfile(self.cells_path):
+            stored_cells = np.load(self.cells_path)
+            latitudes = np.where(np.isnan(latitudes), stored_cells['lat'], latitudes)
+            longitudes = np.where(np.isnan(longitudes), stored_cells['lon'], longitudes)
+
+        cells = np.empty(len(self.grid_registry), dtype=[('grid', np.int64), ('lat', np.float64), ('lon', np.float64)])
+        cells['grid'] = self.grid_registry.ids
+        cells['lat'] = latitudes
+        cells['lon'] = longitudes
+        np.save(self.cells_path, cells)
+
+        manifest['years'] = sorted(int(year) for year in manifest['stored_days'].keys())
+
+        # Write the manifest last, replacing the old one in a single step.
+        with open(self.manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+        self._day_slices = OrderedDict()
+
+    def getYears(self):
+        """ Returns the list of years that have a cube in the cube folder. """
+
+        manifest = self._readManifest()
+
+        return [] if manifest is None else manifest['years']
+
+    def getStoredDays(self, year):
+        """ Returns the list of days of the year that are stored in the cube for the given year. """
+
+        manifest = self._readManifest()
+
+        return [] if manifest is None else manifest['stored_days'].get(str(year), [])
+
+    def getYearCube(self, year):
+        """ Returns the cube for the given year (days by grid cells by fields), memory-mapped read-only. """
+
+        if year not in self.getYears():
+            raise KeyError("No lightning probability cube for %d." % year)
+
+        return np.load(self._yearCubePath(year), mmap_mode='r')
+
+    def getDayFrame(self, date):
+        """ Returns the probabilities for the given date as a dataframe, with the same rows and columns as the
+            probabilities text file (LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS). """
+
+        day = int(date.strftime('%j'))
+
+        if day not in self.getStoredDays(date.year):
+            return pd.DataFrame(columns=FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS)
+
+        day_values = np.asarray(self.getYearCube(date.year)[day - self.first_day])
+        present = ~np.isnan(day_values[:, 0])
+        cells = np.load(self.cells_path)[present]
+
+        day_df = pd.DataFrame(day_values[present], columns=self.fields)
+        day_df.insert(0, 'grid', cells['grid'])
+        day_df.insert(1, 'lat', cells['lat'])
+        day_df.insert(2, 'lon', cells['lon'])
+        day_df.insert(3, 'year', date.year)
+        day_df.insert(4, 'jd', day)
+
+        return day_df[FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS]
+
+class HumanTermTable(object):
+    """ This class holds one GAM term table of a Human FOP terms workbook (e.g. the FFMC sheet) as a dense array over
+        its integer-scaled key domain: the table row for key k is stored at position round(k * scale) - offset, and a
+        validity mask records which positions hold a table row. Lookups are integer gathers rather than float-keyed
+        index lookups, and keys within a small tolerance of a table key (e.g. 85.30000000000001 for 85.3) still match.
+
+        The scale factors of the term tables are in HMN_TERM_TABLE_SCALES. """
+
+    # Largest distance between a scaled key and the nearest integer for the key to be considered on the grid of keys.
+    KEY_TOLERANCE = 1e-6
+
+    def __init__(self, table_df, scale):
+
+        self.scale = scale
+        self.columns = list(table_df.columns)
+
+        scaled_keys = np.asarray(table_df.index.values, dtype=float) * scale
+        integer_keys = np.rint(scaled_keys).astype(np.int64)
+        if (np.abs(scaled_keys - integer_keys) > self.KEY_TOLERANCE).any() or len(np.unique(integer_keys)) != len(integer_keys):
+            raise ValueError("The term table keys are not distinct multiples of %s." % (1.0 / scale))
+
+        self.offset = integer_keys.min() if len(integer_keys) else 0
+        size = integer_keys.max() - self.offset + 1 if len(integer_keys) else 0
+
+        self.valid = np.zeros(size, dtype=bool)
+        self.valid[integer_keys - self.offset] = True
+        self.values = np.full((size, len(self.columns)), np.nan)
+        self.values[integer_keys - self.offset] = table_df.values.astype(float)
+
+    def positionsOf(self, keys):
+        """ Returns the positions of the given keys in the dense table, as an array; keys that are not in the table
+            (outside of its domain, off its grid of keys, or NaN) are given a position of -1. """
+
+        with np.errstate(invalid='ignore'):
+            scaled_keys = np.asarray(keys, dtype=float) * self.scale
+            integer_keys = np.rint(scaled_keys)
+            positions = np.where(np.abs(scaled_keys - integer_keys) <= self.KEY_TOLERANCE, integer_keys - self.offset, -1)
+            positions = np.where((positions >= 0) & (positions < len(self.valid)), positions, -1).astype(np.int64)
+
+        positions[positions >= 0] = np.where(self.valid[positions[positions >= 0]], positions[positions >= 0], -1)
+
+        return positions
+
+    def contains(self, keys):
+        """ Returns a mask of which of the given keys are in the table. """
+
+        return self.positionsOf(keys) >= 0
+
+    def gather(self, keys, column):
+        """ Returns the values of the given column at each of the given keys, with NaN for keys not in the table. """
+
+        positions = self.positionsOf(keys)
+
+        return np.where(positions >= 0, self.values[positions, self.columns.index(column)], np.nan)
+
+    def lookup(self, keys, column):
+        """ Returns the values of the given column at each of the given keys. A KeyError listing all of the keys that
+            are not in the table is raised if there are any. """
+
+        positions = self.positionsOf(keys)
+        if (positions < 0).any():
+            missing_keys = np.unique(np.asarray(keys)[positions < 0])
+            raise KeyError("%d key(s) not in the %s term table: %s" % (len(missing_keys), column, ', '.join(str(key) for key in missing_keys)))
+
+        return self.values[positions, self.columns.index(column)]
+
+######################################### FUNCTIONS #########################################
+
+def loadCompiledHumanTerms(terms_path):
+    """ This function returns the GAM term tables of a Human FOP terms workbook (*_AllTerms.xlsx), as a dictionary of
+        dataframes keyed by sheet name (the same as pd.read_excel(..., sheet_name=None, index_col=0) returns).
+
+        The workbook is only parsed when its compiled cache is missing or out of date (see _loadCompiled()). """
+
+    return _loadCompiled(terms_path, 'terms',
+                         lambda: pd.read_excel(terms_path, sheet_name=None, index_col=0, engine='openpyxl'))
+
+def loadCompiledHumanTermTables(terms_path):
+    """ This function returns the GAM term tables of a Human FOP terms workbook (*_AllTerms.xlsx) that have a scale
+        factor in HMN_TERM_TABLE_SCALES, as a dictionary of HumanTermTables keyed by sheet name.
+
+        The tables are only rebuilt when the workbook changes (see _loadCompiled()). """
+
+    def compile_term_tables():
+        terms_dfs = loadCompiledHumanTerms(terms_path)
+        return {sheet_name: HumanTermTable(terms_dfs[sheet_name], scale)
+                for sheet_name, scale in FOPConstantsAndFunctions.HMN_TERM_TABLE_SCALES.items() if sheet_name in terms_dfs}
+
+    return _loadCompiled(terms_path, 'term_tables:' + repr(list(FOPConstantsAndFunctions.HMN_TERM_TABLE_SCALES.items())), compile_term_tables,
+                         suffix=FOPConstantsAndFunctions.HMN_TERM_TABLES_CACHE_SUFFIX)
+
+def loadCompiledHumanVariables(variables_path, used_columns=FOPConstantsAndFunctions.HMN_VARIABLES_USED_COLUMNS):
+    """ This function returns the given columns of a Human FOP variables file (GRID_*_AllVariables.csv) as a
+        dataframe, with the columns in file order.
+
+        The file is only parsed when its compiled cache is missing or out of date (see _loadCompiled()). """
+
+    return _loadCompiled(variables_path, 'variables:' + ','.join(used_columns),
+                         lambda: pd.read_csv(variables_path, sep=',', usecols=used_columns))
+
+def loadCompiledHumanStaticEffects(terms_path, variables_path):
+    """ This function returns the per-cell static logit effects of a Human FOP forest area (see
+        FOPConstantsAndFunctions.humanStaticEffects()), as an array in variables file row order.
+
+        The effects are computed once and kept in a compiled cache next to the variables file; they are only
+        recomputed when the terms workbook or the variables file changes (see _loadCompiled()). """
+
+    return _loadCompiled(variables_path, 'static_effects:' + repr(list(FOPConstantsAndFunctions.HMN_TERM_TABLE_SCALES.items())),
+                         lambda: FOPConstantsAndFunctions.humanStaticEffects(loadCompiledHumanTerms(terms_path)['INTERCEPT'].index.values[0],
+                                                                             loadCompiledHumanTermTables(terms_path),
+                                                                             loadCompiledHumanVariables(variables_path)),
+                         dependency_paths=[terms_path],
+                         suffix=FOPConstantsAndFunctions.HMN_STATIC_EFFECTS_CACHE_SUFFIX)
+
+def _loadCompiled(source_path, contents, parse, dependency_paths=(), suffix=FOPConstantsAndFunctions.HMN_COMPILED_CACHE_SUFFIX):
+    """ Returns the parsed contents of the given source file from its compiled cache, a pickle kept next to the source
+        file (with the given suffix). The cache is keyed by the SHA-1 hashes of the source file and of any other files
+        the contents are derived from (dependency_paths), and a description of its contents; when any of these no
+        longer match, the source is parsed again using parse() and the cache is rebuilt. If the cache can not be written
+        (e.g. a read-only folder), the parsed contents are returned all the same. """
+
+    compiled_path = os.path.splitext(source_path)[0] + suffix
+    key = {'source_sha1': FOPConstantsAndFunctions.hashFile(source_path), 'contents': contents}
+    if dependency_paths:
+        key['dependency_sha1s'] = [FOPConstantsAndFunctions.hashFile(path) for path in dependency_paths]
+
+    if os.path.isfile(compiled_path):
+        try:
+            compiled = pd.read_pickle(compiled_path)
+        except Exception:
+            compiled = None
+
+        if isinstance(compiled, dict) and compiled.get('key') == key:
+            return compiled['data']
+
+    data = parse()
+
+    # Write to a temporary file first, so that a partially-written cache is never picked up.
+    try:
+        pd.to_pickle({'key': key, 'data': data}, compiled_path + '.tmp')
+        os.replace(compiled_path + '.tmp', compiled_path)
+    except OSError:
+        pass
+
+    return data
@@ -0,0 +1,224 @@
+""" This file contains the canonical registry of the Alberta grid cells used by the Lightning and Human FOP models.
+
+    Grid cells are identified by their fishnet ID ('grid' in Gridlocations.prn and the binned weather and lightning
+    data, 'fishnet_AB' in alberta_static.csv, 'FISHNET_AB' in the Human FOP variables and terms files). The registry
+    loads the grid cells once and gives each one a dense index, 0..N-1 in fishnet ID order, so that the stages of
+    the models can pass around plain arrays indexed by grid cell instead of merging dataframes on their IDs.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import FOPConstantsAndFunctions
+import FOPWeatherInterpolation
+
+######################################### CONSTANTS #########################################
+
+# Attributes read in from the fishnet static file (alberta_static.csv) for each grid cell.
+GRID_STATIC_ATTRIBUTES = ['ZONE_CODE', 'NSR', 'NSRNAME']
+
+# Coordinate reference systems of the grid cell locations (NAD83 lat/long), and of the Alberta maps (NAD83 / Alberta 10-TM).
+GRID_LOCATIONS_EPSG = 4269
+GRID_PROJECTED_EPSG = 3400
+
+# Columns of the fishnet static file (alberta_static.csv) compiled into the grid static attribute store.
+GRID_STATIC_COMPILED_COLUMNS = ['fishnet_AB'] + GRID_STATIC_ATTRIBUTES + ['X', 'Y']
+
+# Suffixes of the compiled grid static attribute store (a numpy structured array) and its sidecar file, which records
+# the source file it was compiled from and a checksum of the compiled data.
+GRID_STATIC_COMPILED_SUFFIX = '_compiled.npy'
+GRID_STATIC_COMPILED_SIDECAR_SUFFIX = '_compiled.json'
+
+# Loaded registries, keyed by the files they were loaded from (see getGridRegistry()).
+_GRID_REGISTRIES = {}
+
+# Compiled grid static attribute stores whose checksums have been verified by this process.
+_VERIFIED_GRID_STATIC_STORES = set()
+
+######################################### CLASSES #########################################
+
+class GridRegistry(object):
+    """ This class holds every grid cell in Gridlocations.prn, ordered by fishnet ID, along with their locations and
+        (optionally) their static attributes from the fishnet static file.
+
+        Grid cell i (0 <= i < N) has fishnet ID ids[i], and is located at (latitudes[i], longitudes[i]). """
+
+    def __init__(self, grid_locations_path, fishnet_static_path=None):
+
+        grid_ids, grid_latitudes, grid_longitudes = FOPWeatherInterpolation.readGridLocations(grid_locations_path)
+
+        if len(np.unique(grid_ids)) != len(grid_ids):
+            raise ValueError("Duplicate grid cell IDs in %s." % grid_locations_path)
+
+        order = np.argsort(grid_ids, kind='mergesort')
+        self.ids = grid_ids[order]
+        self.latitudes = grid_latitudes[order]
+        self.longitudes = grid_longitudes[order]
+
+        # Lookup table from fishnet ID to grid cell index (-1 for IDs that are not in the registry).
+        self._id_lookup = np.full(self.ids[-1] + 1 if len(self.ids) else 0, -1, dtype=np.int64)
+        self._id_lookup[self.ids] = np.arange(len(self.ids))
+
+        # Static attributes for each grid cell, in grid cell order.
+        if fishnet_static_path is not None:
+            fishnet_static_df = pd.DataFrame(loadGridStaticAttributes(fishnet_static_path))
+            self.static_df = self.alignFrame(fishnet_static_df, 'fishnet_AB')[GRID_STATIC_ATTRIBUTES]
+        else:
+            self.static_df = pd.DataFrame(index=pd.RangeIndex(len(self.ids)))
+
+        self._projected_coordinates = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def indexOf(self, grid_ids):
+        """ Returns the grid cell indices of the given fishnet IDs, as an array. IDs that are not in the registry
+            are given an index of -1. """
+
+        grid_ids = np.asarray(grid_ids)
+
+        # IDs stored as floats (e.g. '3332.000000000000000') are accepted as long as they are whole numbers.
+        if grid_ids.dtype.kind == 'f':
+            whole = np.isfinite(grid_ids) & (grid_ids == np.floor(grid_ids))
+            grid_ids = np.where(whole, grid_ids, -1).astype(np.int64)
+        else:
+            grid_ids = grid_ids.astype(np.int64)
+
+        known = (grid_ids >= 0) & (grid_ids < len(self._id_lookup))
+        indices = np.full(grid_ids.shape, -1, dtype=np.int64)
+        indices[known] = self._id_lookup[grid_ids[known]]
+
+        return indices
+
+    def idOf(self, indices):
+        """ Returns the fishnet IDs of the given grid cell indices, as an array. """
+
+        return self.ids[np.asarray(indices, dtype=np.int64)]
+
+    def alignFrame(self, input_df, id_column=None):
+        """ Returns the rows of the given dataframe lined up with the grid cells: row i of the returned dataframe
+            (indexed 0..N-1) holds the input row for grid cell i, or NaNs if there is no input row for it.
+
+            The fishnet IDs are taken from id_column, or from the dataframe's index if no column is given. Where
+            an ID appears more than once, its first row is used. """
+
+        grid_ids = input_df.index.values if id_column is None else input_df[id_column].values
+        indices = self.indexOf(grid_ids)
+
+        # Keep the first row for each grid cell in the registry.
+        keep = indices >= 0
+        keep[keep] = ~pd.Series(indices[keep]).duplicated().values
+
+        aligned_df = input_df.loc[keep].copy()
+        aligned_df.index = indices[keep]
+
+        return aligned_df.reindex(pd.RangeIndex(len(self.ids)))
+
+    def projectedCoordinates(self):
+        """ Returns the grid cell locations projected into the Alberta map coordinate system (NAD83 / Alberta 10-TM),
+            as (x, y) arrays of metres. The projection is only computed once. """
+
+        if self._projected_coordinates is None:
+            import geopandas as gpd  # Only needed for mapping; imported here to keep the registry light-weight.
+
+            points = gpd.GeoSeries(gpd.points_from_xy(self.longitudes, self.latitudes), crs='EPSG:%d' % GRID_LOCATIONS_EPSG)
+            points = points.to_crs(epsg=GRID_PROJECTED_EPSG)
+
+            self._projected_coordinates = (points.x.values, points.y.values)
+
+        return self._projected_coordinates
+
+######################################### FUNCTIONS #########################################
+
+def getGridRegistry(grid_locations_path, fishnet_static_path=None):
+    """ This function returns the grid registry for the given grid locations and fishnet static files. Each
+        registry is only loaded once per process (and re-loaded if either file changes). """
+
+    paths = [grid_locations_path] + ([fishnet_static_path] if fishnet_static_path is not None else [])
+    key = tuple((os.path.abspath(path), os.path.getmtime(path), os.path.getsize(path)) for path in paths)
+
+    if key not in _GRID_REGISTRIES:
+        _GRID_REGISTRIES[key] = GridRegistry(grid_locations_path, fishnet_static_path)
+
+    return _GRID_REGISTRIES[key]
+
+def compileGridStaticAttributes(fishnet_static_path, compiled_path, sidecar_path):
+    """ This function compiles the grid static attributes used by the FOP models (GRID_STATIC_COMPILED_COLUMNS) out of
+        the fishnet static file into a numpy structured array with typed columns, saved at compiled_path.
+
+        fishnet_AB (stored as a float string in the file) is compiled as a 32-bit integer, other numerical columns keep
+        the type pandas reads them in as, and text columns are compiled as fixed-width strings. The sidecar file
+        records the size, modification time and hash of the source file, and the hash of the compiled file. """
+
+    fishnet_static_df = pd.read_csv(fishnet_static_path, sep=',', usecols=GRID_STATIC_COMPILED_COLUMNS)
+    fishnet_static_df['fishnet_AB'] = fishnet_static_df['fishnet_AB'].astype(np.int32)
+
+    fields = []
+    for column in GRID_STATIC_COMPILED_COLUMNS:
+        if fishnet_static_df[column].dtype == object:
+            fishnet_static_df[column] = fishnet_static_df[column].fillna('').astype(str)
+            fields.append((column, 'U%d' % max(1, fishnet_static_df[column].str.len().max())))
+        else:
+            fields.append((column, fishnet_static_df[column].dtype.str))
+
+    compiled = np.empty(len(fishnet_static_df), dtype=fields)
+    for column in GRID_STATIC_COMPILED_COLUMNS:
+        compiled[column] = fishnet_static_df[column].values
+
+    # Write to temporary files first, so that a partially-written store is never picked up.
+    np.save(compiled_path + '.tmp.npy', compiled)
+    os.replace(compiled_path + '.tmp.npy', compiled_path)
+
+    sidecar = {'source_size': os.path.getsize(fishnet_static_path),
+               'source_mtime': os.path.getmtime(fishnet_static_path),
+               'source_sha1': FOPConstantsAndFunctions.hashFile(fishnet_static_path),
+               'compiled_sha1': FOPConstantsAndFunctions.hashFile(compiled_path)}
+
+    _writeSidecar(sidecar, sidecar_path)
+
+    return sidecar
+
+def _writeSidecar(sidecar, sidecar_path):
+    """ Writes a compiled grid static attribute store's sidecar file, through a temporary file so that a
+        partially-written sidecar is never picked up. """
+
+    with open(sidecar_path + '.tmp', 'w') as sidecar_file:
+        json.dump(sidecar, sidecar_file, indent=4)
+    os.replace(sidecar_path + '.tmp', sidecar_path)
+
+def loadGridStaticAttributes(fishnet_static_path):
+    """ This function returns the compiled grid static attributes for the given fishnet static file, as a read-only
+        memory-mapped numpy structured array (one field per column in GRID_STATIC_COMPILED_COLUMNS, rows in file order).
+
+        The store is (re)compiled automatically when it is missing or when the source file has changed. The compiled
+        file is checked against its checksum the first time it is loaded by a process. """
+
+    compiled_path = os.path.splitext(fishnet_static_path)[0] + GRID_STATIC_COMPILED_SUFFIX
+    sidecar_path = os.path.splitext(fishnet_static_path)[0] + GRID_STATIC_COMPILED_SIDECAR_SUFFIX
+
+    sidecar = None
+    if os.path.isfile(compiled_path) and os.path.isfile(sidecar_path):
+        with open(sidecar_path, 'r') as sidecar_file:
+            sidecar = json.load(sidecar_file)
+
+    # Recompile if the source file has changed. A new modification time alone (e.g. the file was copied) only
+    # means that the source has to be hashed to find out; if it is unchanged, the new modification time is recorded
+    # so that the source does not have to be hashed again.
+    if sidecar is None or sidecar['source_size'] != os.path.getsize(fishnet_static_path):
+        sidecar = compileGridStaticAttributes(fishnet_static_path, compiled_path, sidecar_path)
+    elif sidecar['source_mtime'] != os.path.getmtime(fishnet_static_path):
+        if sidecar['source_sha1'] != FOPConstantsAndFunctions.hashFile(fishnet_static_path):
+            sidecar = compileGridStaticAttributes(fishnet_static_path, compiled_path, sidecar_path)
+        else:
+            sidecar['source_mtime'] = os.path.getmtime(fishnet_static_path)
+            _writeSidecar(sidecar, sidecar_path)
+
+    if (compiled_path, sidecar['compiled_sha1']) not in _VERIFIED_GRID_STATIC_STORES:
+        if FOPConstantsAndFunctions.hashFile(compiled_path) != sidecar['compiled_sha1']:
+            sidecar = compileGridStaticAttributes(fishnet_static_path, compiled_path, sidecar_path)
+
+        _VERIFIED_GRID_STATIC_STORES.add((compiled_path, sidecar['compiled_sha1']))
+
+    return np.load(compiled_path, mmap_mode='r')
+
@@ -0,0 +1,247 @@
+""" This file contains the scoring of the Human FOP forest area models, shared by the Human FOP probability calculator
+    and its worker processes.
+
+    Each forest area is scored from its compiled dense term tables, variables and per-cell static effects (see
+    FOPDataStores), for all of the days being predicted for at once. The forest areas are independent of each other,
+    so they can be scored concurrently on worker processes that are kept alive between calls, each one always scoring
+    the same forest areas (whose compiled models it keeps loaded), or on a pool of threads inside daemonic processes
+    that can not start workers of their own; the results are always handed back in the order
+    that the forest areas were given, so the output does not depend on the number of processes used.
+"""
+
+import atexit
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import FOPConstantsAndFunctions
+from FOPDataStores import loadCompiledHumanStaticEffects, loadCompiledHumanTermTables, loadCompiledHumanVariables
+
+######################################### CONSTANTS #########################################
+
+# Natural subregions (NATURE_REGION) of the cells covered by the Slopes region, and those of them with their own
+# seasonality (s(DAY_OF_YEAR):NATURE_REGION*) term in the Slopes v2 model.
+HMN_SLOPES_NATURE_REGIONS = [7, 8, 9, 10, 11, 14, 18]
+HMN_SLOPES_SEASONAL_NATURE_REGIONS = [7, 8, 9, 10, 11, 14]
+
+# Columns produced for each forest area, per cell and per day and cell (see scoreHumanForestArea()).
+HMN_FOREST_AREA_CELL_COLUMNS = ['fishnet_id', 'latitude', 'longitude', 'forest_area', 'region_ci', 'nsr_numerical_code']
+HMN_FOREST_AREA_DAY_CELL_COLUMNS = ['ffmc_interpolated', 'logit', 'probability']
+
+# Compiled forest area models held by this process, keyed by the files they were loaded from (see getForestAreaModel()).
+_FOREST_AREA_MODELS = {}
+_FOREST_AREA_MODELS_LOCK = threading.Lock()
+
+# Worker processes kept alive between calls to scoreHumanForestAreas(), each one a single-process pool (see
+# _getForestAreaWorkers()). Forest area i is always scored by worker i % len(_forest_area_workers).
+_forest_area_workers = []
+
+######################################### FUNCTIONS #########################################
+
+def getForestAreaModel(terms_path, variables_path, used_columns=FOPConstantsAndFunctions.HMN_VARIABLES_USED_COLUMNS):
+    """ This function returns the compiled model of a forest area: its dense term tables, its variables and the static
+        effects of its cells (or None for a variables file with its own static effects, such as the Slopes v2 model's,
+        whose variables are indexed by their (first) FISHNET_AB instead). Each model is only loaded once per process (and re-loaded if either file changes), even when it is asked for by
+        several threads at once. """
+
+    key = tuple((os.path.abspath(path), os.path.getmtime(path), os.path.getsize(path)) for path in [terms_path, variables_path]) + (tuple(used_columns),)
+
+    with _FOREST_AREA_MODELS_LOCK:
+        if key not in _FOREST_AREA_MODELS:
+            _FOREST_AREA_MODELS[key] = _loadForestAreaModel(terms_path, variables_path, used_columns)
+
+        return _FOREST_AREA_MODELS[key]
+
+def _loadForestAreaModel(terms_path, variables_path, used_columns):
+    """ Loads the compiled model of a forest area (see getForestAreaModel()). """
+
+    term_tables = loadCompiledHumanTermTables(terms_path)
+    variables_df = loadCompiledHumanVariables(variables_path, used_columns)
+
+    if used_columns == FOPConstantsAndFunctions.HMN_VARIABLES_USED_COLUMNS:
+        static_effects = loadCompiledHumanStaticEffects(terms_path, variables_path)
+    else:
+        static_effects = None
+
+    # The Slopes v2 model's variables are only ever looked up by fishnet ID.
+    if used_columns == FOPConstantsAndFunctions.HMN_SLOPES_VARIABLES_USED_COLUMNS:
+        variables_df = variables_df.drop_duplicates(subset='FISHNET_AB', keep='first').set_index('FISHNET_AB')
+
+    return term_tables, variables_df, static_effects
+
+def _lookup(table_df, keys, column):
+    """ Returns the values of table_df[column] at each of the given index keys, as table_df.at[key, column] would; a
+        KeyError is raised if any of the keys are missing from the table. """
+
+    positions = table_df.index.get_indexer(keys)
+    if (positions < 0).any():
+        raise KeyError(np.asarray(keys)[positions < 0][0])
+
+    return table_df[column].values[positions]
+
+def scoreHumanForestArea(terms_path, variables_path, scoring_inputs):
+    """ This function calculates the Human FOP logits and probabilities of every fishnet cell in a forest area's
+        variables file, for all of the days being predicted for at once (as days x cells matrices).
+
+        scoring_inputs is a dictionary holding the days' day of year (Julian) and whether they are in March or April
+        (day_of_year_julians, march_april_days), the days' interpolated FFMC by fishnet ID (ffmc_by_fishnet_df, one
+        column per day), the NSR of each fishnet (nsr_by_fishnet_df), the Slopes v2 model's terms and variables files
+        (slopes_terms_path and slopes_variables_path, or None to not use it), and the value given to cells without
+        valid data (no_valid_data_value).
+
+        Returns a dictionary of HMN_FOREST_AREA_CELL_COLUMNS (arrays over the cells) and HMN_FOREST_AREA_DAY_CELL_COLUMNS
+        (days x cells arrays), or None if the variables file is empty. """
+
+    term_tables, variables_df, static_effects = getForestAreaModel(terms_path, variables_path)
+
+    # Calculate the probabilities and expected values of all of the fishnet cells in the variables file at once.
+    # The static (date-independent) terms of each cell's logit are summed up ahead of time (static_effects).
+    if variables_df.empty:
+        return None
+
+    day_of_year_julians = scoring_inputs['day_of_year_julians']
+    march_april_days = scoring_inputs['march_april_days']
+    no_valid_data_value = scoring_inputs['no_valid_data_value']
+
+    fishnet_ids = variables_df['FISHNET_AB'].values
+    nature_regions = variables_df['NATURE_REGION'].values
+    slopes_cells = np.isin(nature_regions, HMN_SLOPES_NATURE_REGIONS)
+    shape = (len(day_of_year_julians), len(variables_df))
+
+    # Get the NSR (numerical code) for each fishnet.
+    nsr_numerical_codes = _lookup(scoring_inputs['nsr_by_fishnet_df'], fishnet_ids, 'NSR')
+
+    # Prepare the terms required for calculating the Human FOP expected value.
+    day_of_year_term = term_tables['DAY_OF_YEAR'].lookup(day_of_year_julians, 's(DAY_OF_YEAR)')
+
+    # Handle -999.9 value for the interpolated FFMC. Cells whose FFMC can not be looked up in Dr. Woolford's model
+    # (including cells without interpolated weather) are assigned "-1.0" for their FFMC, logit and probability;
+    # they will be plotted on our map as a special "No data" datapoint.
+    ffmc_interpolated = np.round(scoring_inputs['ffmc_by_fishnet_df'].reindex(fishnet_ids).values.astype(float).T, 1).reshape(shape)
+    valid = term_tables['FFMC'].contains(ffmc_interpolated)
+
+    logit = np.full(shape, no_valid_data_value)
+    probability = np.full(shape, no_valid_data_value)
+
+    if valid.any():
+        # Only the FFMC and day of year terms are added to the static effects of the cells with a valid FFMC
+        # value; a cell missing one of its static terms can not be scored.
+        if np.isnan(static_effects[valid.any(axis=0)]).any():
+            missing_fishnet_ids = fishnet_ids[valid.any(axis=0) & np.isnan(static_effects)]
+            raise KeyError("%d fishnet cell(s) missing static terms: %s" % (len(missing_fishnet_ids), ', '.join(str(fishnet_id) for fishnet_id in missing_fishnet_ids)))
+
+        ffmc_term = term_tables['FFMC'].lookup(ffmc_interpolated[valid], 's(FFMC)')
+        valid_logit = (np.broadcast_to(static_effects, shape)[valid] +
+                       np.broadcast_to(day_of_year_term[:, np.newaxis], shape)[valid] +
+                       ffmc_term
+                       )
+
+        # If we are to use the new version of the Slopes model, then re-calculate the logit for the Slopes cells.
+        use_slopes_model_v2 = scoring_inputs['slopes_terms_path'] is not None
+        valid_slopes_cells = (valid & slopes_cells)[valid] if use_slopes_model_v2 else np.zeros(int(valid.sum()), dtype=bool)
+
+        if valid_slopes_cells.any():
+            slopes_term_tables, slopes_variables_df, _ = getForestAreaModel(scoring_inputs['slopes_terms_path'], scoring_inputs['slopes_variables_path'],
+                                                                            FOPConstantsAndFunctions.HMN_SLOPES_VARIABLES_USED_COLUMNS)
+
+            slopes_ffmc_term = slopes_term_tables['FFMC'].lookup(ffmc_interpolated[valid][valid_slopes_cells], 's(FFMC)')
+
+            slopes_day_of_year_term = np.zeros(shape)
+            for nature_region in HMN_SLOPES_SEASONAL_NATURE_REGIONS:
+                if (nature_regions == nature_region).any():
+                    slopes_day_of_year_term[:, nature_regions == nature_region] = \
+                        slopes_term_tables['DAY_OF_YEAR'].lookup(day_of_year_julians, 's(DAY_OF_YEAR):NATURE_REGION%d' % nature_region)[:, np.newaxis]
+
+            # If the month we are predicting for is May onward, then set the seasonality effect to be 0 for NSR 18.
+            # Do not refer to the s(DAY_OF_YEAR):NATURE_REGION18 column. (In March and April, the probability is set to 0 below.)
+            slopes_day_of_year_term[np.ix_(march_april_days, nature_regions == 18)] = day_of_year_term[march_april_days][:, np.newaxis]
+
+            static_effects_variables_term = _lookup(slopes_variables_df, np.broadcast_to(fishnet_ids, shape)[valid][valid_slopes_cells], 'COMBINED_STATIC_EFFECTS')
+
+            valid_logit[valid_slopes_cells] = (slopes_ffmc_term +
+                                               slopes_day_of_year_term[valid][valid_slopes_cells] +
+                                               static_effects_variables_term
+                                               )
+
+        # Calculate the probability for each grid cell using the inverse logit function.
+        valid_probability = FOPConstantsAndFunctions.roundLikeBuiltin(FOPConstantsAndFunctions.logistic(valid_logit), 12)
+
+        # If the given cell's natural subregion (NSR) is 18 and we are predicting for a day in March or April, set
+        # the probability to be 0.
+        valid_probability[valid_slopes_cells & np.outer(march_april_days, nature_regions == 18)[valid]] = 0
+
+        logit[valid] = np.round(valid_logit, 12)
+        probability[valid] = valid_probability
+
+    return OrderedDict([('fishnet_id', fishnet_ids.astype(object)),
+                        ('latitude', np.round(term_tables['SPATIAL'].lookup(fishnet_ids, 'Y'), 4).astype(object)),
+                        ('longitude', np.round(term_tables['SPATIAL'].lookup(fishnet_ids, 'X'), 4).astype(object)),
+                        ('forest_area', variables_df['FOREST_NAME'].values.astype(object)),
+                        ('region_ci', np.where(slopes_cells, 'Slopes', np.where(variables_df['X'].values >= -114, 'East Boreal', 'West Boreal')).astype(object)),
+                        ('nsr_numerical_code', nsr_numerical_codes.astype(object)),
+                        ('ffmc_interpolated', np.where(valid, ffmc_interpolated, no_valid_data_value).astype(object)),
+                        ('logit', logit.astype(object)),
+                        ('probability', probability.astype(object))])
+
+def _scoreHumanForestAreaWorker(forest_area_paths, scoring_inputs):
+    """ Worker process task; scores a single forest area (a (terms path, variables path) pair). The worker loads the
+        forest area's compiled model the first time it scores it, and keeps it (see getForestAreaModel()). """
+
+    return scoreHumanForestArea(forest_area_paths[0], forest_area_paths[1], scoring_inputs)
+
+def _getForestAreaWorkers(processes):
+    """ Returns the given number of worker processes, starting them the first time they are asked for. They are kept
+        alive (along with the forest area models they have loaded) until a different number of workers is asked for,
+        or until the program exits. """
+
+    if len(_forest_area_workers) != processes:
+        _closeForestAreaWorkers()
+        _forest_area_workers.extend(multiprocessing.Pool(processes=1) for _ in range(processes))
+
+    return _forest_area_workers
+
+def _closeForestAreaWorkers():
+    """ Stops the worker processes started by _getForestAreaWorkers(), if any. """
+
+    for worker in _forest_area_workers:
+        worker.terminate()
+        worker.join()
+
+    del _forest_area_workers[:]
+
+atexit.register(_closeForestAreaWorkers)
+
+def scoreHumanForestAreas(forest_areas, scoring_inputs, processes=1):
+    """ This function scores many forest areas (a list of (terms path, variables path) pairs) with scoreHumanForestArea(),
+        and returns the list of their results in the same order.
+
+        The forest areas are independent of each other, so they can be spread across worker processes (processes=None
+        uses one per CPU). The workers are kept alive between calls, and forest area i of the list is always scored by
+        worker i % processes, so each worker keeps the compiled models of its own forest areas loaded from one call to
+        the next. When we are already running inside a daemonic (pool) process, which is not allowed to start workers of
+        its own (as the models are when run from the GUI), a pool of threads is used instead; most of the scoring is
+        done by numpy, which releases the GIL. Every forest area is still scored by scoreHumanForestArea(), so the
+        results are identical to scoring the forest areas one after the other, which is what happens when processes is
+        1 or when there is only a single forest area. """
+
+    forest_areas = [tuple(forest_area_paths) for forest_area_paths in forest_areas]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes == 1 or len(forest_areas) <= 1:
+        return [scoreHumanForestArea(terms_path, variables_path, scoring_inputs) for terms_path, variables_path in forest_areas]
+
+    if multiprocessing.current_process().daemon:
+        with multiprocessing.pool.ThreadPool(processes=min(processes, len(forest_areas))) as pool:
+            # pool.map() hands the results back in the order of the forest areas given to it.
+            return pool.map(lambda forest_area_paths: _scoreHumanForestAreaWorker(forest_area_paths, scoring_inputs), forest_areas)
+
+    workers = _getForestAreaWorkers(min(processes, len(forest_areas)))
+    pending_results = [workers[i % len(workers)].apply_async(_scoreHumanForestAreaWorker, (forest_area_paths, scoring_inputs))
+                       for i, forest_area_paths in enumerate(forest_areas)]
+
+    # Hand the results back in the order of the forest areas given.
+    return [pending_result.get() for pending_result in pending_results]
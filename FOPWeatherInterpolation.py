@@ -0,0 +1,522 @@
+""" This file contains an in-process, per-day implementation of Dr. Wotton's weather interpolation
+    (lightning/weather/cf-build-AB.py) and weather binning (lightning/weather/use_cf2.py) tools.
+
+    The two tools fit a thin-plate spline to each day's weather station observations and evaluate it at
+    every Alberta grid cell. Here, the same fit and evaluation is performed one day at a time so that the
+    interpolated weather grids can be cached per day and shared between the Lightning and Human FOP models.
+"""
+
+import datetime
+import hashlib
+import multiprocessing
+import multiprocessing.pool
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree  # Spatial index used to find the nearest stations for the local interpolation mode.
+import FOPConstantsAndFunctions
+
+######################################### CONSTANTS #########################################
+
+# Interpolated weather variables, in the order that they are fitted and binned.
+WEATHER_INTERPOLATION_VARIABLES = ['temp', 'rh', 'ws', 'rain', 'ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
+
+# Thin-plate spline smoothing factor used for each of the interpolated weather variables.
+WEATHER_INTERPOLATION_SMOOTHING_FACTORS = [0.001, 0.001, 0.001, 0.01, 0.001, 0.001, 0.001, 0.001, 0.001, 0.001]
+
+# Value used for missing weather observations and missing interpolated values.
+WEATHER_MISSING_VALUE = -999.9
+
+# Number of values in a complete massaged weather record:
+# id, latitude, longitude, year, month, day, followed by the ten weather variables.
+MASSAGED_WEATHER_RECORD_LENGTH = 16
+
+# Column positions within a day's massaged weather records (the random id column is not kept).
+RECORD_LATITUDE = 0
+RECORD_LONGITUDE = 1
+RECORD_FIRST_VARIABLE = 5
+
+# Interpolation modes.
+# 'spline': a single thin-plate spline through every station (Dr. Wotton's method).
+# 'local': a weighted average of the k nearest stations to each grid cell, found through a spatial index.
+WEATHER_INTERPOLATION_MODE_SPLINE = 'spline'
+WEATHER_INTERPOLATION_MODE_LOCAL = 'local'
+
+# Mean radius of the Earth, in kilometres.
+EARTH_RADIUS_KM = 6371.0
+
+# Bandwidth of the Gaussian kernel used by the local interpolation mode, in kilometres.
+GAUSSIAN_KERNEL_BANDWIDTH_KM = 50.0
+
+# Candidate smoothing factors searched by generalized cross-validation (GCV).
+WEATHER_SMOOTHING_FACTOR_CANDIDATES = np.logspace(-6, 0, 25)
+
+# Column headers for the weather interpolation cross-validation outputs.
+WEATHER_LOO_RESIDUALS_HEADERS = ['date', 'variable', 'latitude', 'longitude', 'observed', 'loo_predicted', 'loo_residual']
+WEATHER_GCV_SCORES_HEADERS = ['date', 'variable', 'smoothing_factor', 'gcv_score']
+
+######################################### FUNCTIONS #########################################
+
+def readGridLocations(grid_locations_path):
+    """ This function reads in the grid locations file (Gridlocations.prn) and returns the grid cell IDs,
+        latitudes and longitudes as arrays, in file order. """
+
+    grid_locations_df = pd.read_csv(grid_locations_path, delim_whitespace=True, header=None,
+                                    usecols=[0, 1, 2], names=['grid', 'latitude', 'longitude'])
+
+    return (grid_locations_df['grid'].values.astype(np.int64),
+            grid_locations_df['latitude'].values.astype(float),
+            grid_locations_df['longitude'].values.astype(float))
+
+def readMassagedWeatherByDay(massaged_weather_path):
+    """ This function reads in the massaged weather file and splits it up into one array of station records per day.
+
+        Each record holds: latitude, longitude, year, month, day, followed by the ten weather variables.
+        The randomly-generated id column is dropped so that a day's records only depend on its observations.
+
+        Records without a station location are handled the same way as cf-build-AB.py handles them: those
+        found before the first complete record are skipped, and any others repeat the preceding complete record. """
+
+    days = OrderedDict()
+    previous_record = None
+    previous_date = None
+
+    with open(massaged_weather_path, 'r') as massaged_weather_file:
+        for line in massaged_weather_file:
+            values = line.split()
+
+            # cf-build-AB.py stops reading at the first blank line once it has found a complete record.
+            if len(values) == 0:
+                if previous_record is not None:
+                    break
+                continue
+
+            if len(values) < MASSAGED_WEATHER_RECORD_LENGTH:
+                if previous_record is not None:
+                    days[previous_date].append(previous_record)
+                continue
+
+            previous_record = [float(value) for value in values[1:MASSAGED_WEATHER_RECORD_LENGTH]]
+            previous_date = datetime.date(int(previous_record[2]), int(previous_record[3]), int(previous_record[4]))
+            days.setdefault(previous_date, []).append(previous_record)
+
+    return OrderedDict((date, np.array(records, dtype=float)) for date, records in days.items())
+
+def fingerprintWeatherDay(day_records, **interpolation_settings):
+    """ This function returns a fingerprint (SHA-1 hex digest) of a day's massaged weather records and the settings
+        used to interpolate them. If the fingerprint of a day has not changed, neither has its interpolated grid. """
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(np.ascontiguousarray(day_records, dtype=float).tobytes())
+
+    # The settings are fingerprinted by their repr(), so they must be plain values (a kernel is given by its name in
+    # LOCAL_INTERPOLATION_KERNELS, and its bandwidth as a number); a function has no repr() that identifies it.
+    for name in sorted(interpolation_settings):
+        setting = interpolation_settings[name]
+
+        if callable(setting):
+            raise ValueError("fingerprintWeatherDay(): The %s interpolation setting must be a plain value, not a function (%r)." % (name, setting))
+
+        fingerprint.update(('%s=%r;' % (name, setting)).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
+def fitThinPlateSpline(latitudes, longitudes, observations, smoothing_factor):
+    """ This function fits a smoothed thin-plate spline to a set of station observations, exactly as the regress()
+        function in cf-build-AB.py does.
+
+        Returns the station coefficients followed by the three coefficients of the affine term
+        (constant, longitude, latitude). """
+
+    num_stations = len(observations)
+
+    # Radial basis function values between every pair of stations; the diagonal holds the smoothing term.
+    distances = np.sqrt((longitudes[np.newaxis, :] - longitudes[:, np.newaxis]) ** 2 +
+                        (latitudes[np.newaxis, :] - latitudes[:, np.newaxis]) ** 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kernel = np.where(distances == 0, 0.0, distances ** 2 * np.log(distances))
+
+    np.fill_diagonal(kernel, num_stations * smoothing_factor)
+
+    # Border the kernel with the affine terms.
+    system = np.zeros((num_stations + 3, num_stations + 3), dtype=float)
+    system[:num_stations, :num_stations] = kernel
+    system[:num_stations, num_stations] = 1.0
+    system[num_stations, :num_stations] = 1.0
+    system[:num_stations, num_stations + 1] = longitudes
+    system[num_stations + 1, :num_stations] = longitudes
+    system[:num_stations, num_stations + 2] = latitudes
+    system[num_stations + 2, :num_stations] = latitudes
+
+    right_hand_side = np.zeros(num_stations + 3, dtype=float)
+    right_hand_side[:num_stations] = observations
+
+    return np.dot(np.linalg.inv(system), right_hand_side)
+
+def _thinPlateSplineEigensystem(latitudes, longitudes):
+    """ This function factorizes the thin-plate spline system for a set of stations once, so that it can then be solved
+        for any smoothing factor without refitting.
+
+        The stations' affine terms are projected out with a QR decomposition, and the remaining (reduced) kernel is
+        eigendecomposed. For a smoothing factor s, the station coefficients are then:
+            c = V diag(1 / (eigenvalues + n * s)) V' y
+        where V (the returned basis) is n x (n - 3) with orthonormal columns. The matrix multiplying y is the
+        station block of the inverse of the full spline system built by fitThinPlateSpline(). """
+
+    num_stations = len(latitudes)
+
+    distances = np.sqrt((longitudes[np.newaxis, :] - longitudes[:, np.newaxis]) ** 2 +
+                        (latitudes[np.newaxis, :] - latitudes[:, np.newaxis]) ** 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kernel = np.where(distances == 0, 0.0, distances ** 2 * np.log(distances))
+
+    affine = np.column_stack((np.ones(num_stations), longitudes, latitudes))
+    q, _ = np.linalg.qr(affine, mode='complete')
+    null_space = q[:, 3:]
+
+    eigenvalues, eigenvectors = np.linalg.eigh(null_space.T.dot(kernel).dot(null_space))
+
+    return eigenvalues, null_space.dot(eigenvectors)
+
+def crossValidateThinPlateSpline(latitudes, longitudes, observations, smoothing_factors):
+    """ This function computes, for each of the given smoothing factors, the exact leave-one-out (LOO) residuals of the
+        thin-plate spline at every station, and the generalized cross-validation (GCV) score, from a single factorization.
+
+        The LOO residual of station i is c_i / B_ii (where B is the station block of the inverse of the spline system):
+        exactly what refitting the spline without station i and predicting at station i would give, without the n refits.
+        The GCV score is n * |c|^2 / trace(B)^2.
+
+        Returns (an array of LOO residuals, smoothing factors by stations; an array of GCV scores, one per smoothing factor). """
+
+    num_stations = len(observations)
+    eigenvalues, basis = _thinPlateSplineEigensystem(latitudes, longitudes)
+    projected_observations = basis.T.dot(observations)
+
+    loo_residuals = np.zeros((len(smoothing_factors), num_stations))
+    gcv_scores = np.zeros(len(smoothing_factors))
+
+    for k, smoothing_factor in enumerate(smoothing_factors):
+        inverse_eigenvalues = 1.0 / (eigenvalues + num_stations * smoothing_factor)
+
+        coefficients = basis.dot(projected_observations * inverse_eigenvalues)
+        inverse_diagonal = (basis * basis).dot(inverse_eigenvalues)
+
+        loo_residuals[k] = coefficients / inverse_diagonal
+        gcv_scores[k] = num_stations * coefficients.dot(coefficients) / inverse_eigenvalues.sum() ** 2
+
+    return loo_residuals, gcv_scores
+
+def crossValidateWeatherDay(date, day_records, smoothing_factors=WEATHER_INTERPOLATION_SMOOTHING_FACTORS,
+                            smoothing_factor_candidates=WEATHER_SMOOTHING_FACTOR_CANDIDATES):
+    """ This function cross-validates the thin-plate spline for each weather variable of a single day.
+
+        Returns two dataframes:
+        - The LOO residuals for every reporting station and variable, at the smoothing factors currently in use
+          (WEATHER_LOO_RESIDUALS_HEADERS).
+        - The GCV score for every variable and candidate smoothing factor (WEATHER_GCV_SCORES_HEADERS). """
+
+    loo_dfs = []
+    gcv_dfs = []
+
+    for i, variable in enumerate(WEATHER_INTERPOLATION_VARIABLES):
+        observations = day_records[:, RECORD_FIRST_VARIABLE + i]
+        valid = observations > -90
+
+        # The spline needs more stations than affine terms to have anything left to cross-validate.
+        if valid.sum() <= 3:
+            continue
+
+        latitudes = day_records[valid, RECORD_LATITUDE]
+        longitudes = day_records[valid, RECORD_LONGITUDE]
+        observations = observations[valid]
+
+        candidates = np.append(smoothing_factor_candidates, smoothing_factors[i])
+        loo_residuals, gcv_scores = crossValidateThinPlateSpline(latitudes, longitudes, observations, candidates)
+
+        loo_dfs.append(pd.DataFrame({'date': date,
+                                     'variable': variable,
+                                     'latitude': latitudes,
+                                     'longitude': longitudes,
+                                     'observed': observations,
+                                     'loo_predicted': observations - loo_residuals[-1],
+                                     'loo_residual': loo_residuals[-1]},
+                                    columns=WEATHER_LOO_RESIDUALS_HEADERS))
+
+        gcv_dfs.append(pd.DataFrame({'date': date,
+                                     'variable': variable,
+                                     'smoothing_factor': smoothing_factor_candidates,
+                                     'gcv_score': gcv_scores[:-1]},
+                                    columns=WEATHER_GCV_SCORES_HEADERS))
+
+    loo_df = pd.concat(loo_dfs, ignore_index=True) if loo_dfs else pd.DataFrame(columns=WEATHER_LOO_RESIDUALS_HEADERS)
+    gcv_df = pd.concat(gcv_dfs, ignore_index=True) if gcv_dfs else pd.DataFrame(columns=WEATHER_GCV_SCORES_HEADERS)
+
+    return loo_df, gcv_df
+
+def crossValidateMassagedWeather(massaged_weather_path, smoothing_factors=WEATHER_INTERPOLATION_SMOOTHING_FACTORS,
+                                 smoothing_factor_candidates=WEATHER_SMOOTHING_FACTOR_CANDIDATES):
+    """ This function cross-validates every day in the massaged weather file (see crossValidateWeatherDay()), and
+        selects the smoothing factor for each variable which minimizes its GCV score summed over all of the days.
+
+        Returns (the LOO residuals dataframe, the GCV scores dataframe, a list of the selected smoothing factors in
+        WEATHER_INTERPOLATION_VARIABLES order). Variables that could not be cross-validated keep their current factor. """
+
+    loo_dfs = []
+    gcv_dfs = []
+
+    for date, day_records in readMassagedWeatherByDay(massaged_weather_path).items():
+        day_loo_df, day_gcv_df = crossValidateWeatherDay(date, day_records, smoothing_factors, smoothing_factor_candidates)
+        loo_dfs.append(day_loo_df)
+        gcv_dfs.append(day_gcv_df)
+
+    loo_df = pd.concat(loo_dfs, ignore_index=True) if loo_dfs else pd.DataFrame(columns=WEATHER_LOO_RESIDUALS_HEADERS)
+    gcv_df = pd.concat(gcv_dfs, ignore_index=True) if gcv_dfs else pd.DataFrame(columns=WEATHER_GCV_SCORES_HEADERS)
+
+    # Pick the smoothing factor with the lowest season-wide GCV score for each variable.
+    season_gcv_scores = gcv_df.groupby(['variable', 'smoothing_factor'])['gcv_score'].sum()
+    selected_smoothing_factors = list(smoothing_factors)
+
+    for i, variable in enumerate(WEATHER_INTERPOLATION_VARIABLES):
+        if variable in season_gcv_scores.index.get_level_values('variable'):
+            selected_smoothing_factors[i] = float(season_gcv_scores.loc[variable].idxmin())
+
+    return loo_df, gcv_df, selected_smoothing_factors
+
+def _roundTripFixedWidth(values, fixed_width_format):
+    """ Returns the values as they read back after being written out with the given fixed-width format. """
+
+    return np.array([float(fixed_width_format % value) for value in np.asarray(values, dtype=float).tolist()])
+
+def buildWeatherDayCoefficients(day_records, smoothing_factors=WEATHER_INTERPOLATION_SMOOTHING_FACTORS):
+    """ This function fits the interpolation coefficients for each of the ten weather variables for a single day.
+
+        For each variable, either None is returned (fewer than two stations reported it), or a tuple of:
+        (station latitudes, station longitudes, coefficients, minimum observation, maximum observation)
+
+        Every value is rounded to the precision of the coefficient files written by cf-build-AB.py, so that
+        evaluating these coefficients gives the same values as use_cf2.py. """
+
+    day_coefficients = []
+
+    for i in range(len(WEATHER_INTERPOLATION_VARIABLES)):
+        observations = day_records[:, RECORD_FIRST_VARIABLE + i]
+        valid = observations > -90
+
+        # We need at least two reporting stations to fit the spline.
+        if valid.sum() <= 1:
+            day_coefficients.append(None)
+            continue
+
+        latitudes = day_records[valid, RECORD_LATITUDE]
+        longitudes = day_records[valid, RECORD_LONGITUDE]
+        observations = observations[valid]
+
+        coefficients = fitThinPlateSpline(latitudes, longitudes, observations, smoothing_factors[i])
+
+        day_coefficients.append((_roundTripFixedWidth(latitudes, '%08.3f'),
+                                 _roundTripFixedWidth(longitudes, '%08.3f'),
+                                 _roundTripFixedWidth(coefficients, '%014.6f'),
+                                 float('%06.1f' % observations.min()),
+                                 float('%06.1f' % observations.max())))
+
+    return day_coefficients
+
+def evaluateWeatherDayCoefficients(day_coefficients, grid_latitudes, grid_longitudes):
+    """ This function evaluates a day's interpolation coefficients at every grid cell, the same way that the
+        calculate() function in use_cf2.py does. Interpolated values are clamped to the range of the observations,
+        and then rounded to one decimal place (the precision of the binned weather file).
+
+        Returns an array of grid cells by weather variables; variables that could not be fitted are missing. """
+
+    day_grid = np.full((len(grid_latitudes), len(WEATHER_INTERPOLATION_VARIABLES)), WEATHER_MISSING_VALUE)
+
+    for i, variable_coefficients in enumerate(day_coefficients):
+        if variable_coefficients is None:
+            continue
+
+        station_latitudes, station_longitudes, coefficients, minimum, maximum = variable_coefficients
+        num_stations = len(station_latitudes)
+
+        # Affine term, followed by the contribution of each station in turn.
+        interpolated = coefficients[num_stations] + grid_longitudes * coefficients[num_stations + 1] + \
+                       grid_latitudes * coefficients[num_stations + 2]
+
+        for k in range(num_stations):
+            delta_latitudes = grid_latitudes - station_latitudes[k]
+            delta_longitudes = grid_longitudes - station_longitudes[k]
+            distances = np.sqrt(delta_latitudes * delta_latitudes + delta_longitudes * delta_longitudes)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                contributions = coefficients[k] * distances * distances * np.log(distances)
+
+            interpolated = interpolated + np.where(distances > 0.00001, contributions, 0.0)
+
+        day_grid[:, i] = np.clip(interpolated, minimum, maximum)
+
+    return FOPConstantsAndFunctions.roundLikeBuiltin(day_grid, 1)
+
+def _toUnitSphereKilometres(latitudes, longitudes):
+    """ Converts latitudes and longitudes into 3D cartesian coordinates (in kilometres) on a sphere the size of the Earth.
+        Straight-line distances between these points increase with great-circle distance, so nearest neighbours found
+        with them are the true nearest neighbours anywhere on the globe, with no map projection needed. """
+
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+
+    return EARTH_RADIUS_KM * np.column_stack((np.cos(latitudes) * np.cos(longitudes),
+                                              np.cos(latitudes) * np.sin(longitudes),
+                                              np.sin(latitudes)))
+
+def inverseDistanceKernel(distances, bandwidth_km=None):
+    """ Inverse distance squared weighting kernel; distances are in kilometres (the bandwidth is not used). """
+
+    return 1.0 / (distances * distances)
+
+def gaussianKernel(distances, bandwidth_km=GAUSSIAN_KERNEL_BANDWIDTH_KM):
+    """ Gaussian weighting kernel with the given bandwidth; distances and bandwidth are in kilometres. """
+
+    return np.exp(-0.5 * (distances / bandwidth_km) ** 2)
+
+# Weighting kernels available to the local interpolation mode, by name.
+LOCAL_INTERPOLATION_KERNELS = {'inverse_distance': inverseDistanceKernel,
+                               'gaussian': gaussianKernel}
+
+def localInterpolationKernel(kernel):
+    """ Returns the weighting kernel function with the given name in LOCAL_INTERPOLATION_KERNELS. Kernels are only
+        given by name, so that they can be fingerprinted and handed to worker processes; anything else (including
+        a function) raises a ValueError. """
+
+    if not isinstance(kernel, str) or kernel not in LOCAL_INTERPOLATION_KERNELS:
+        raise ValueError("The local interpolation kernel must be one of %s, given by name; got %r." % (', '.join(sorted(LOCAL_INTERPOLATION_KERNELS)), kernel))
+
+    return LOCAL_INTERPOLATION_KERNELS[kernel]
+
+def interpolateWeatherDayLocal(day_records, grid_latitudes, grid_longitudes, nearest_stations=8, kernel='inverse_distance',
+                               kernel_bandwidth_km=GAUSSIAN_KERNEL_BANDWIDTH_KM):
+    """ This function interpolates a single day's massaged weather records onto the grid cells using only the
+        k (nearest_stations) nearest reporting stations to each grid cell.
+
+        Each grid cell gets a weighted average of its nearest stations, with weights given by the kernel (the name of
+        one of the LOCAL_INTERPOLATION_KERNELS, with a bandwidth of kernel_bandwidth_km for the 'gaussian' kernel).
+        A grid cell sitting exactly on one or more stations takes their average value.
+
+        The nearest stations are found through a k-d tree, so this scales to thousands of stations and hundreds of
+        thousands of grid cells, with no cap on either. Like the spline, a variable reported by fewer than two stations
+        is missing, nothing is produced for November and December, and values are rounded to one decimal place. """
+
+    day_grid = np.full((len(grid_latitudes), len(WEATHER_INTERPOLATION_VARIABLES)), WEATHER_MISSING_VALUE)
+
+    if int(day_records[0, 3]) >= 11:
+        return day_grid
+
+    kernel_function = localInterpolationKernel(kernel)
+
+    grid_coordinates = _toUnitSphereKilometres(grid_latitudes, grid_longitudes)
+    station_coordinates = _toUnitSphereKilometres(day_records[:, RECORD_LATITUDE], day_records[:, RECORD_LONGITUDE])
+
+    # Nearest station searches, keyed by the set of reporting stations; most variables are reported by the same stations.
+    nearest_station_searches = {}
+
+    for i in range(len(WEATHER_INTERPOLATION_VARIABLES)):
+        observations = day_records[:, RECORD_FIRST_VARIABLE + i]
+        valid = observations > -90
+
+        if valid.sum() <= 1:
+            continue
+
+        observations = observations[valid]
+        num_neighbours = min(nearest_stations, len(observations))
+
+        # Find the nearest reporting stations to every grid cell.
+        if valid.tobytes() not in nearest_station_searches:
+            distances, neighbours = cKDTree(station_coordinates[valid]).query(grid_coordinates, k=num_neighbours, workers=-1)
+            nearest_station_searches[valid.tobytes()] = (distances.reshape(len(grid_latitudes), num_neighbours),
+                                                         neighbours.reshape(len(grid_latitudes), num_neighbours))
+
+        distances, neighbours = nearest_station_searches[valid.tobytes()]
+
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            weights = kernel_function(distances, kernel_bandwidth_km)
+
+        # Grid cells sitting on a station take that station's value.
+        on_station = distances < 1e-9
+        on_any_station = on_station.any(axis=1)
+        weights[on_any_station] = on_station[on_any_station]
+
+        # If the kernel gives no weight at all to a grid cell's neighbours, fall back to its nearest station.
+        no_weight = ~(weights.sum(axis=1) > 0)
+        weights[no_weight] = 0.0
+        weights[no_weight, 0] = 1.0
+
+        day_grid[:, i] = (weights * observations[neighbours]).sum(axis=1) / weights.sum(axis=1)
+
+    return FOPConstantsAndFunctions.roundLikeBuiltin(day_grid, 1)
+
+def interpolateWeatherDay(day_records, grid_latitudes, grid_longitudes, smoothing_factors=WEATHER_INTERPOLATION_SMOOTHING_FACTORS,
+                          mode=WEATHER_INTERPOLATION_MODE_SPLINE, nearest_stations=8, kernel='inverse_distance',
+                          kernel_bandwidth_km=GAUSSIAN_KERNEL_BANDWIDTH_KM):
+    """ This function interpolates a single day's massaged weather records onto the grid cells, using either the
+        thin-plate spline (mode='spline') or the k-nearest-station local interpolation (mode='local').
+
+        As with cf-build-AB.py, no weather is produced for November and December; the whole grid is missing. """
+
+    if mode == WEATHER_INTERPOLATION_MODE_LOCAL:
+        return interpolateWeatherDayLocal(day_records, grid_latitudes, grid_longitudes, nearest_stations, kernel, kernel_bandwidth_km)
+
+    month = int(day_records[0, 3])
+
+    if month >= 11:
+        return np.full((len(grid_latitudes), len(WEATHER_INTERPOLATION_VARIABLES)), WEATHER_MISSING_VALUE)
+
+    day_coefficients = buildWeatherDayCoefficients(day_records, smoothing_factors)
+
+    return evaluateWeatherDayCoefficients(day_coefficients, grid_latitudes, grid_longitudes)
+
+def _initializeWeatherInterpolationWorker(grid_latitudes, grid_longitudes, interpolation_settings):
+    """ Process pool initializer; keeps the grid cell locations and interpolation settings resident in each worker process. """
+
+    global _worker_grid_latitudes, _worker_grid_longitudes, _worker_interpolation_settings
+
+    _worker_grid_latitudes = grid_latitudes
+    _worker_grid_longitudes = grid_longitudes
+    _worker_interpolation_settings = interpolation_settings
+
+def _interpolateWeatherDayWorker(day_records):
+    """ Process pool task; interpolates a single day onto the grid cells held by this worker. """
+
+    return interpolateWeatherDay(day_records, _worker_grid_latitudes, _worker_grid_longitudes, **_worker_interpolation_settings)
+
+def interpolateWeatherDays(days, grid_latitudes, grid_longitudes, processes=None, **interpolation_settings):
+    """ This function interpolates many days of massaged weather records (a dictionary of date: day records) onto the
+        grid cells, and returns a dictionary of date: interpolated grid in the same order. Any other keyword arguments
+        (smoothing_factors, mode, nearest_stations, kernel, kernel_bandwidth_km) are passed on to interpolateWeatherDay().
+
+        Each day is independent of the others, so the days are spread across a pool of worker processes
+        (processes=None uses one per CPU). When we are already running inside a daemonic (pool) process, which is not
+        allowed to start workers of its own (as the models are when run from the GUI), a pool of threads is used
+        instead; the linear algebra and nearest station searches release the GIL. Every day is still interpolated by
+        interpolateWeatherDay(), so the results are identical to interpolating the days one after the other, which is
+        what happens when processes is 1 or when there is only a single day. """
+
+    dates = list(days.keys())
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes == 1 or len(dates) <= 1:
+        day_grids = [interpolateWeatherDay(days[date], grid_latitudes, grid_longitudes, **interpolation_settings) for date in dates]
+    elif multiprocessing.current_process().daemon:
+        with multiprocessing.pool.ThreadPool(processes=min(processes, len(dates))) as pool:
+            # pool.map() hands the results back in the order of the dates given to it.
+            day_grids = pool.map(lambda day_records: interpolateWeatherDay(day_records, grid_latitudes, grid_longitudes, **interpolation_settings),
+                                 [days[date] for date in dates])
+    else:
+        with multiprocessing.Pool(processes=min(processes, len(dates)),
+                                  initializer=_initializeWeatherInterpolationWorker,
+                                  initargs=(grid_latitudes, grid_longitudes, interpolation_settings)) as pool:
+            # pool.map() hands the results back in the order of the dates given to it.
+            day_grids = pool.map(_interpolateWeatherDayWorker, [days[date] for date in dates])
+
+    return OrderedDict(zip(dates, day_grids))
@@ -13,6 +13,7 @@ import traceback
 import configparser  # Used to load and save application state.
 import datetime
 import os
+import shutil
 import sys
 import multiprocessing
 import pandas as pd
@@ -61,6 +62,8 @@ ALBERTA_ICON_FILE = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname
 FOP_SYSTEM_STATE_DB_PATH = 'resource_files\\fop_system_state_db.csv'
 LTG_CUMULATIVE_PROBS_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resource_files\\ltg_fop_probabilities_output.out'))
 HMN_CUMULATIVE_PROBS_EXPVALS_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'FireOccurrencePrediction\\resource_files\\hmn_fop_probabilities_output.out'))
+HMN_PREDICTIONS_STORE_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'FireOccurrencePrediction\\resource_files\\hmn_predictions_store'))
+LTG_PROBABILITY_CUBE_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'FireOccurrencePrediction\\intermediate_output\\ltg_probability_cube'))
 
 ##########################################  CLASSES  ##########################################
 class StdoutRedirect(object):
@@ -429,6 +432,13 @@ def clearSystemStateDB():
             except Exception as e:
                 print(f'An error occurred: {str(e)}')
                 return
+        # Clear the Human FOP predictions store (it would otherwise be kept, as it is only seeded from the file above once).
+        if os.path.isdir(HMN_PREDICTIONS_STORE_PATH):
+            try:
+                shutil.rmtree(HMN_PREDICTIONS_STORE_PATH)
+            except Exception as e:
+                print(f'An error occurred: {str(e)}')
+                return
         # Clear the saved computed probabilities and expected values files for Lightning FOP.
         if os.path.isfile(LTG_CUMULATIVE_PROBS_PATH):
             try:
@@ -436,6 +446,13 @@ def clearSystemStateDB():
             except Exception as e:
                 print(f'An error occurred: {str(e)}')
                 return
+        # Clear the Lightning FOP probability cubes (they keep the probabilities of every day predicted for so far).
+        if os.path.isdir(LTG_PROBABILITY_CUBE_PATH):
+            try:
+                shutil.rmtree(LTG_PROBABILITY_CUBE_PATH)
+            except Exception as e:
+                print(f'An error occurred: {str(e)}')
+                return
         # Create an empty cumulative Human FOP probabilities and expected values file.
         # We do not need to create an empty cumulative arrivals and holdovers probabilities file for Lightning FOP because
         # that method uses Python's built-in CSV library and not pandas.
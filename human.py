@@ -22,6 +22,9 @@ from matplotlib import text
 import pylab
 import matplotlib.dates as mdates
 import FOPConstantsAndFunctions
+import FOPGridRegistry  # Compiled grid static attributes, shared with the Lightning FOP model.
+import FOPHumanModel  # Scoring of the Human FOP forest area models, optionally on a pool of worker processes.
+from FOPDataStores import HumanPredictionsStore, RawWeatherStore, WeatherGridStore  # Per-day raw weather and interpolated weather grids, shared with the Lightning FOP model.
 import time  # Time delay for debugging purposes.
 from lightning import LightningFireOccurrencePrediction  # Re-use the rawWeatherDataMassager method.
 import random
@@ -30,6 +33,7 @@ import numpy as np
 import sys
 import streamlit as st
 import csv
+from collections import OrderedDict
 
 # Numerical constants.
 NO_VALID_DATA_VALUE = -1.0
@@ -38,6 +42,10 @@ NUM_SIMULATION_REPLICATIONS = 1000
 # Other constants.
 USE_SLOPES_MODEL_V2 = True
 
+# Whether the regional confidence intervals are computed exactly from the Poisson-binomial distribution of the number of
+# fires (see humanExactConfidenceIntervalGenerator()), rather than by simulating NUM_SIMULATION_REPLICATIONS days.
+USE_EXACT_CONFIDENCE_INTERVALS = False
+
 class HumanFireOccurrencePrediction(object):
     """ This class contains the logic for the Human Fire Occurrence Prediction model itself. """
 
@@ -53,6 +61,9 @@ class HumanFireOccurrencePrediction(object):
 
         # 1. Raw weather data file (path is already constructed, explicit from the GUI).
         self.hmn_input_raw_weather_data_file = hmn_input_raw_weather_data_file
+
+        # 1a. Raw weather store folder, holding the raw weather data partitioned by day (to be put in the intermediate data folder; shared with the Lightning FOP model).
+        self.hmn_raw_weather_store_folder = hmn_intermediate_data_folder + '/' + FOPConstantsAndFunctions.RAW_WEATHER_STORE_FOLDER_NAME
         
         # 2. Massaged weather data file (to be put in the intermediate data folder).
         self.hmn_weather_massaged_output_path = hmn_intermediate_data_folder + '/2_Massaged_Weather.csv'
@@ -63,6 +74,9 @@ class HumanFireOccurrencePrediction(object):
         # 4. Binned weather data file (to be put in the intermediate data folder).
         self.hmn_weather_binned_output_path = hmn_intermediate_data_folder + '/4_Binned_Weather.csv'
 
+        # 4a. Interpolated weather grid store folder (to be put in the intermediate data folder; shared with the Lightning FOP model).
+        self.hmn_weather_grid_store_folder = hmn_intermediate_data_folder + '/' + FOPConstantsAndFunctions.WEATHER_GRID_STORE_FOLDER_NAME
+
         # 5. Gridded Human FOP probabilities output file path (to be put in the output data folder).
         self.hmn_gridded_predictions_output_path = hmn_output_data_folder + '\\AB-Human_FOP_Grids.out'
 
@@ -153,6 +167,11 @@ class HumanFireOccurrencePrediction(object):
         # Human FOP cumulative expected values and probabilities data file path.
         self.hmn_cumulative_probs_expvals_output_path = \
             os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fireoccurrenceprediction/resource_files/hmn_fop_probabilities_output.out'))
+
+        # Human FOP predictions store folder, holding the cumulative expected values and probabilities partitioned by day
+        # (seeded from the cumulative expected values and probabilities data file above when it is first created).
+        self.hmn_predictions_store_folder = \
+            os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fireoccurrenceprediction/resource_files/' + FOPConstantsAndFunctions.HMN_PREDICTIONS_STORE_FOLDER_NAME))
         
         # Weather station locations file path.
         self.hmn_weather_station_locations_path = 'resource_files/Alberta_Weather_Stations_2019_new.csv'
@@ -193,236 +212,103 @@ class HumanFireOccurrencePrediction(object):
         # Build the path to the C weather binning executable.
     
     def weatherInterpolationBinnerWrapper(self):
-        """ Calls the wrapped weather interpolation and binning tools, feeding it the massaged weather data.
-            Here, we use subprocess.call as opposed to subprocess.Popen because subprocess.call
-            is blocking; we need the external call to finish before we carry on with other stages of
-            the processing flow. """
+        """ Interpolates the massaged weather data onto the Alberta grid and bins it.
+
+            The interpolated grids are kept in a per-day weather grid store that is shared with the Lightning FOP model;
+            a day is only re-interpolated when its massaged weather observations have changed. The binned weather
+            file is then written out from the store for the days found in the massaged weather data. """
         st.write("In weatherInterpolationBinnerWrapper()")
-        st.write("Doing build")
-        subprocess.run([f"{sys.executable}", "lightning/weather/cf-build-AB.py"])
-        st.write("Done build and doing use")
-        subprocess.run([f"{sys.executable}", "lightning/weather/use_cf2.py"])
-        file_path2 = "intermediate_output/3_weather_interpolation_coefficients/CF-dc.ab"
-        file_path3 = "intermediate_output/3_weather_interpolation_coefficients/CF-dmc.ab"
-        file_path4 = "intermediate_output/3_weather_interpolation_coefficients/CF-fwi.ab"
-        file_path1 = "intermediate_output/3_weather_interpolation_coefficients/CF-bui.ab"
-
-     
-    
-    def humanFOPProbabilitiesCalculator(self, date_to_predict_for):
-        """ This method computes Human FOP expected values and probabilities per Alberta fishnet cell. """
-        # Open the Human FOP cumulative probabilities and expected values file.
-        hmn_cumulative_probs_expvals_df = pd.read_csv(self.hmn_cumulative_probs_expvals_output_path, sep=',', parse_dates=['date'])
-        hmn_cumulative_probs_expvals_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
-        
-        # Read in the interpolated and binned weather file.
-        interpolated_binned_weather_df = pd.read_csv(self.hmn_weather_binned_output_path, sep=',', header=None)
-        interpolated_binned_weather_df.columns = FOPConstantsAndFunctions.INTERPOLATED_BINNED_WEATHER_DATA_HEADERS
-        # Read in the Fishnet NSR file.
-        hmn_fishnet_nsr_path_df =  pd.read_csv(self.hmn_fishnet_nsr_path, sep=',')
+        weather_grid_store = WeatherGridStore(self.hmn_weather_grid_store_folder, self.hmn_grid_locations_path)
 
-        # Cast the 'fishnet_AB' column as 32-bit integer.
-        hmn_fishnet_nsr_path_df['fishnet_AB'] = hmn_fishnet_nsr_path_df['fishnet_AB'].astype('int32')
+        # Interpolate any new or changed days, and remember which days we have weather for.
+        self.hmn_interpolated_weather_dates = weather_grid_store.update(self.hmn_weather_massaged_output_path)
 
-        # Determine the day of year (Julian) that we are predicting for.
-        day_of_year_julian = date_to_predict_for.timetuple().tm_yday
+        # Write out the binned weather file for these days.
+        weather_grid_store.writeBinnedWeatherFile(self.hmn_interpolated_weather_dates, self.hmn_weather_binned_output_path)
+    
+    def humanForestAreas(self):
+        """ This method returns the forest areas scored by the Human FOP model, as (terms workbook, variables file) pairs,
+            in the order that their rows are output in. """
+        return [(self.hmn_coefficients_path_calgary_all_terms, self.hmn_coefficients_path_calgary_all_variables),
+                (self.hmn_coefficients_path_edson_all_terms, self.hmn_coefficients_path_edson_all_variables),
+                (self.hmn_coefficients_path_fort_mcmurray_all_terms, self.hmn_coefficients_path_fort_mcmurray_all_variables),
+                (self.hmn_coefficients_path_grande_prairie_all_terms, self.hmn_coefficients_path_grande_prairie_all_variables),
+                (self.hmn_coefficients_path_high_level_all_terms, self.hmn_coefficients_path_high_level_all_variables),
+                (self.hmn_coefficients_path_lac_la_biche_all_terms, self.hmn_coefficients_path_lac_la_biche_all_variables),
+                (self.hmn_coefficients_path_peace_river_all_terms, self.hmn_coefficients_path_peace_river_all_variables),
+                (self.hmn_coefficients_path_rocky_mountain_house_all_terms, self.hmn_coefficients_path_rocky_mountain_house_all_variables),
+                (self.hmn_coefficients_path_slave_lake_all_terms, self.hmn_coefficients_path_slave_lake_all_variables),
+                (self.hmn_coefficients_path_whitecourt_all_terms, self.hmn_coefficients_path_whitecourt_all_variables)]
+
+    def humanScoringInputs(self, day_of_year_julians, march_april_days, ffmc_by_fishnet_df):
+        """ This method returns the inputs that the forest areas are scored with (see FOPHumanModel.scoreHumanForestArea())
+            for the given days' day of year (Julian), whether they are in March or April, and their FFMC by fishnet ID. """
+        # Read in the Fishnet NSR attributes from the compiled grid static attribute store ('fishnet_AB' is a 32-bit integer).
+        hmn_fishnet_nsr_path_df = pd.DataFrame(FOPGridRegistry.loadGridStaticAttributes(self.hmn_fishnet_nsr_path))
+        nsr_by_fishnet_df = hmn_fishnet_nsr_path_df.drop_duplicates(subset='fishnet_AB', keep='first').set_index('fishnet_AB')
+
+        return {'day_of_year_julians': day_of_year_julians,
+                'march_april_days': march_april_days,
+                'ffmc_by_fishnet_df': ffmc_by_fishnet_df,
+                'nsr_by_fishnet_df': nsr_by_fishnet_df,
+                'slopes_terms_path': self.hmn_coefficients_path_slopes_all_terms if USE_SLOPES_MODEL_V2 else None,
+                'slopes_variables_path': self.hmn_coefficients_path_slopes_all_variables if USE_SLOPES_MODEL_V2 else None,
+                'no_valid_data_value': NO_VALID_DATA_VALUE}
 
-        # Create a dataframe to hold the computed probabilities and expected values.
+    def humanFOPProbabilitiesCalculator(self, date_to_predict_for):
+        """ This method computes Human FOP expected values and probabilities per Alberta fishnet cell. """
+        self.humanFOPRangeProbabilitiesCalculator([date_to_predict_for])
+
+    def humanFOPRangeProbabilitiesCalculator(self, dates_to_predict_for):
+        """ This method computes Human FOP expected values and probabilities per Alberta fishnet cell for a list of days
+            in one pass: the terms, variables and static effects are loaded once, every forest area is scored as a
+            (days x cells) matrix, and the predictions store is updated once for all of the days.
+
+            The gridded predictions output file holds the rows of every day, in the order that the days are given. """
+        # Determine the day of year (Julian) and month of each day that we are predicting for.
+        day_of_year_julians = np.array([date.timetuple().tm_yday for date in dates_to_predict_for], dtype=np.int64)
+        march_april_days = np.isin([date.month for date in dates_to_predict_for], [3, 4])
+
+        # Read in the interpolated and binned weather for each day from the weather grid store, and look up each day's
+        # interpolated FFMC by fishnet ID (where an ID appears more than once, its first row is used). Column i holds
+        # the FFMC of the i-th day.
+        weather_grid_store = WeatherGridStore(self.hmn_weather_grid_store_folder, self.hmn_grid_locations_path)
+        ffmc_by_day = []
+        for date in dates_to_predict_for:
+            interpolated_binned_weather_df = weather_grid_store.getDayFrame(date)
+            interpolated_binned_weather_df = interpolated_binned_weather_df.loc[((interpolated_binned_weather_df['year'] == date.year) &
+                                                                                 (interpolated_binned_weather_df['month'] == date.month) &
+                                                                                 (interpolated_binned_weather_df['day'] == date.day))]
+            ffmc_by_day.append(interpolated_binned_weather_df.drop_duplicates(subset='grid', keep='first').set_index('grid')['ffmc'])
+        ffmc_by_fishnet_df = pd.concat(ffmc_by_day, axis=1, keys=range(len(ffmc_by_day)))
+
+        # Score every forest area (in this order), optionally on a pool of worker processes (see FOPHumanModel). Each
+        # forest area's terms workbook and variables file are loaded as dense term tables, variables and per-cell
+        # static effects from their compiled caches, along with the Slopes region's if we are to use the new version of
+        # the Slopes model.
+        forest_areas = self.humanForestAreas()
+        scoring_inputs = self.humanScoringInputs(day_of_year_julians, march_april_days, ffmc_by_fishnet_df)
+
+        forest_area_results = FOPHumanModel.scoreHumanForestAreas(forest_areas, scoring_inputs, FOPConstantsAndFunctions.HMN_SCORING_PROCESSES)
+        forest_area_results = [result for result in forest_area_results if result is not None]
+
+        # Lay out the output rows day by day; each day holds the rows of every forest area, in the order scored above.
         self.hmn_fop_probabilities_expected_values_df = pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS)
+        if forest_area_results:
+            num_cells = sum(len(result['fishnet_id']) for result in forest_area_results)
+            output_columns = OrderedDict([('fishnet_id', np.tile(np.concatenate([result['fishnet_id'] for result in forest_area_results]), len(dates_to_predict_for))),
+                                          ('date', np.repeat(np.array(dates_to_predict_for, dtype=object), num_cells)),
+                                          ('day_of_year', np.repeat(day_of_year_julians.astype(object), num_cells))])
+            for column in FOPHumanModel.HMN_FOREST_AREA_CELL_COLUMNS[1:]:
+                output_columns[column] = np.tile(np.concatenate([result[column] for result in forest_area_results]), len(dates_to_predict_for))
+            for column in FOPHumanModel.HMN_FOREST_AREA_DAY_CELL_COLUMNS:
+                output_columns[column] = np.concatenate([result[column] for result in forest_area_results], axis=1).ravel()
+
+            # Column headers:
+            # 'fishnet_id', 'date', 'day_of_year', 'latitude', 'longitude', 'region', 'ffmc_interpolated', 'logit', 'probability'
+            self.hmn_fop_probabilities_expected_values_df = pd.DataFrame(output_columns, dtype=object)
+            self.hmn_fop_probabilities_expected_values_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
 
-        def do_calculate_probabilities(terms_df, variables_df):        
-            # Loop through all of the rows in the variables file and calculate the probabilities and expected values on a per-fishnet ID basis.
-            # Load up the Slopes region terms and variables file if we are to use the new version of the Slopes model.
-            if USE_SLOPES_MODEL_V2:
-                slopes_all_terms_df = pd.read_excel(self.hmn_coefficients_path_slopes_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-                slopes_all_variables_df = pd.read_csv(self.hmn_coefficients_path_slopes_all_variables, sep=',')
-
-            i = 0
-            for _ , row_variable in variables_df.iterrows():
-                i = i + 1
-                # if i % 250 == 0:
-                
-                # Get the NSR (numerical code) for this fishnet.
-                nsr_numerical_code = hmn_fishnet_nsr_path_df.loc[hmn_fishnet_nsr_path_df['fishnet_AB'] == row_variable['FISHNET_AB']]['NSR'].values[0]
-
-                # Prepare the terms required for calculating the Human FOP expected value.
-                intercept_term = terms_df['INTERCEPT'].index.values[0]
-                day_of_year_term = terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR)']
-                spatial_term = terms_df['SPATIAL'].at[row_variable['FISHNET_AB'], 'te(X,Y)']
-                # Handle -999.9 value for the interpolated FFMC.
-                try:
-                    ffmc_term = terms_df['FFMC'].at[round(interpolated_binned_weather_df.loc[((interpolated_binned_weather_df['grid'] == row_variable['FISHNET_AB']) &
-                                                                                              (interpolated_binned_weather_df['year'] == date_to_predict_for.year) &
-                                                                                              (interpolated_binned_weather_df['month'] == date_to_predict_for.month) &
-                                                                                              (interpolated_binned_weather_df['day'] == date_to_predict_for.day))]['ffmc'].values[0], 1), 's(FFMC)']
-                except KeyError:
-                    # If we except a KeyError, then we were unable to perform a lookup in Dr. Woolford's model for this FFMC value.
-                    # Assign the probability and FFMC for this particular cell to be "-1.0".
-                    # It will be plotted on our map as a special "No data" datapoint.
-                    row_df = pd.DataFrame([[row_variable['FISHNET_AB'],
-                                            date_to_predict_for,
-                                            day_of_year_julian,
-                                            round(terms_df['SPATIAL'].at[row_variable['FISHNET_AB'], 'Y'], 4),
-                                            round(terms_df['SPATIAL'].at[row_variable['FISHNET_AB'], 'X'], 4),
-                                            row_variable['FOREST_NAME'],
-                                            ('Slopes' if row_variable['NATURE_REGION'] in [7, 8, 9, 10, 11, 14, 18] else 'East Boreal' if row_variable['X'] >= -114 else 'West Boreal'),
-                                            nsr_numerical_code,
-                                            NO_VALID_DATA_VALUE,  # ffmc_interpolated
-                                            NO_VALID_DATA_VALUE,  # logit
-                                            NO_VALID_DATA_VALUE   # probability
-                                         ]])
-                
-                    row_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
-                    self.hmn_fop_probabilities_expected_values_df = self.hmn_fop_probabilities_expected_values_df.append(row_df)
-                    continue  # Go to the next grid cell; we are done processing this one.
-
-                # If we have a valid FFMC value that can be looked up, then continue onward with processing this cell.
-                dist_road_term = terms_df['DIST_ROAD'].at[(int(round((row_variable['DIST_ROAD'] / 100), 0) * 100)), 's(DIST_ROAD)']
-                water_term = terms_df['WATER'].at[round(row_variable['WATER'], 2), 's(WATER)']
-                d_1_d_2_term = terms_df['D.1.D.2'].at[round(row_variable['D.1.D.2'], 2), 's(D.1.D.2)']
-                wui_term = terms_df['WUI'].at[round(row_variable['WUI'], 2), 's(WUI)']
-                wii_term = terms_df['WII'].at[round(row_variable['WII'], 2), 's(WII)']
-                inf_term = terms_df['INF'].at[round(row_variable['INF'], 2), 's(INF)']
-                logit = (intercept_term +
-                         day_of_year_term +
-                         spatial_term +
-                         ffmc_term +
-                         dist_road_term +
-                         water_term +
-                         d_1_d_2_term +
-                         wui_term +
-                         wii_term +
-                         inf_term
-                         )
-                
-                old_logit = (intercept_term +
-                         day_of_year_term +
-                         spatial_term +
-                         ffmc_term +
-                         dist_road_term +
-                         water_term +
-                         d_1_d_2_term +
-                         wui_term +
-                         wii_term +
-                         inf_term
-                         )
-
-                # If we are to use the new version of the Slopes model, then re-calculate the probability for this cell.
-                if USE_SLOPES_MODEL_V2 and row_variable['NATURE_REGION'] in [7, 8, 9, 10, 11, 14, 18]:
-                    ffmc_term = slopes_all_terms_df['FFMC'].at[round(interpolated_binned_weather_df.loc[((interpolated_binned_weather_df['grid'] == row_variable['FISHNET_AB']) &
-                                                                                                         (interpolated_binned_weather_df['year'] == date_to_predict_for.year) &
-                                                                                                         (interpolated_binned_weather_df['month'] == date_to_predict_for.month) &
-                                                                                                         (interpolated_binned_weather_df['day'] == date_to_predict_for.day))]['ffmc'].values[0], 1), 's(FFMC)']
-                    
-                    if row_variable['NATURE_REGION'] == 7:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION7']
-                    elif row_variable['NATURE_REGION'] == 8:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION8']
-                    elif row_variable['NATURE_REGION'] == 9:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION9']
-                    elif row_variable['NATURE_REGION'] == 10:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION10']
-                    elif row_variable['NATURE_REGION'] == 11:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION11']
-                    elif row_variable['NATURE_REGION'] == 14:
-                        day_of_year_term = slopes_all_terms_df['DAY_OF_YEAR'].at[day_of_year_julian, 's(DAY_OF_YEAR):NATURE_REGION14']
-                    elif row_variable['NATURE_REGION'] == 18 and date_to_predict_for.month not in [3, 4]:
-                        # If the month we are predicting for is May onward, then set the seasonality effect to be 0.
-                        # Do not refer to the s(DAY_OF_YEAR):NATURE_REGION18 column.
-                        day_of_year_term = 0
-                    
-                    static_effects_variables_term = slopes_all_variables_df.loc[row_variable['FISHNET_AB'] == slopes_all_variables_df['FISHNET_AB']]['COMBINED_STATIC_EFFECTS'].values[0]
-
-                    logit = (ffmc_term +
-                             day_of_year_term +
-                             static_effects_variables_term
-                             )
-                    
-                    if old_logit == logit:
-                        ffmc_interp = round(interpolated_binned_weather_df.loc[((interpolated_binned_weather_df['grid'] == row_variable['FISHNET_AB']) &
-                                                                                  (interpolated_binned_weather_df['year'] == date_to_predict_for.year) &
-                                                                                  (interpolated_binned_weather_df['month'] == date_to_predict_for.month) &
-                                                                                  (interpolated_binned_weather_df['day'] == date_to_predict_for.day))]['ffmc'].values[0], 1)
-                        assert(old_logit != logit)
-                
-                # Calculate the probability for this grid cell using the inverse logit function.
-                # If the given cell's natural subregion (NSR) is 18 and we are predicting for a day in March or April, set
-                # the probability to be 0.
-                if USE_SLOPES_MODEL_V2 and row_variable['NATURE_REGION'] == 18 and date_to_predict_for.month in [3, 4]:
-                    probability = 0
-                else:
-                    probability = math.exp(logit) / (1 + math.exp(logit))
-                # Append a new row to the Human FOP expected value and probabilities output file.
-                # Column headers:
-                # 'fishnet_id', 'date', 'day_of_year', 'latitude', 'longitude', 'region', 'ffmc_interpolated', 'logit', 'probability'
-                row_df = pd.DataFrame([[row_variable['FISHNET_AB'],
-                                        date_to_predict_for,
-                                        day_of_year_julian,
-                                        round(terms_df['SPATIAL'].at[row_variable['FISHNET_AB'], 'Y'], 4),
-                                        round(terms_df['SPATIAL'].at[row_variable['FISHNET_AB'], 'X'], 4),
-                                        row_variable['FOREST_NAME'],
-                                        ('Slopes' if row_variable['NATURE_REGION'] in [7, 8, 9, 10, 11, 14, 18] else 'East Boreal' if row_variable['X'] >= -114 else 'West Boreal'),
-                                        nsr_numerical_code,
-                                        round(interpolated_binned_weather_df.loc[((interpolated_binned_weather_df['grid'] == row_variable['FISHNET_AB']) &
-                                                                                  (interpolated_binned_weather_df['year'] == date_to_predict_for.year) &
-                                                                                  (interpolated_binned_weather_df['month'] == date_to_predict_for.month) &
-                                                                                  (interpolated_binned_weather_df['day'] == date_to_predict_for.day))]['ffmc'].values[0], 1),
-                                        round(logit, 12),
-                                        round(probability, 12)
-                                    ]])
-                
-                row_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
-                self.hmn_fop_probabilities_expected_values_df = self.hmn_fop_probabilities_expected_values_df.append(row_df)
-        # Calgary forest region.
-        calgary_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_calgary_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        calgary_all_variables_df = pd.read_csv(self.hmn_coefficients_path_calgary_all_variables, sep=',')
-        do_calculate_probabilities(calgary_all_terms_dfs, calgary_all_variables_df)
-
-        # Edson forest region.
-        edson_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_edson_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        edson_all_variables_df = pd.read_csv(self.hmn_coefficients_path_edson_all_variables, sep=',')
-        do_calculate_probabilities(edson_all_terms_dfs, edson_all_variables_df)
-
-        # Fort McMurray forest region.
-        fort_mcmurray_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_fort_mcmurray_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        fort_mcmurray_all_variables_df = pd.read_csv(self.hmn_coefficients_path_fort_mcmurray_all_variables, sep=',')
-        do_calculate_probabilities(fort_mcmurray_all_terms_dfs, fort_mcmurray_all_variables_df)
-
-        # Grande Prairie forest region.
-        grande_prairie_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_grande_prairie_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        grande_prairie_all_variables_df = pd.read_csv(self.hmn_coefficients_path_grande_prairie_all_variables, sep=',')
-        do_calculate_probabilities(grande_prairie_all_terms_dfs, grande_prairie_all_variables_df)
-
-        # High Level forest region.
-        high_level_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_high_level_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        high_level_all_variables_df = pd.read_csv(self.hmn_coefficients_path_high_level_all_variables, sep=',')
-        do_calculate_probabilities(high_level_all_terms_dfs, high_level_all_variables_df)
-
-        # Lac la Biche forest region.
-        lac_la_biche_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_lac_la_biche_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        lac_la_biche_all_variables_df = pd.read_csv(self.hmn_coefficients_path_lac_la_biche_all_variables, sep=',')
-        do_calculate_probabilities(lac_la_biche_all_terms_dfs, lac_la_biche_all_variables_df)
-
-        # Peace River forest region.
-        peace_river_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_peace_river_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        peace_river_all_variables_df = pd.read_csv(self.hmn_coefficients_path_peace_river_all_variables, sep=',')
-        do_calculate_probabilities(peace_river_all_terms_dfs, peace_river_all_variables_df)
-
-        # Rocky Mountain House forest region.
-        rocky_mountain_house_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_rocky_mountain_house_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        rocky_mountain_house_all_variables_df = pd.read_csv(self.hmn_coefficients_path_rocky_mountain_house_all_variables, sep=',')
-        do_calculate_probabilities(rocky_mountain_house_all_terms_dfs, rocky_mountain_house_all_variables_df)
-
-        # Slave Lake forest region.
-        slave_lake_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_slave_lake_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        slave_lake_all_variables_df = pd.read_csv(self.hmn_coefficients_path_slave_lake_all_variables, sep=',')
-        do_calculate_probabilities(slave_lake_all_terms_dfs, slave_lake_all_variables_df)
-
-        # Whitecourt forest region.
-        whitecourt_all_terms_dfs = pd.read_excel(self.hmn_coefficients_path_whitecourt_all_terms, sheet_name=None, index_col=0, engine='openpyxl')
-        whitecourt_all_variables_df = pd.read_csv(self.hmn_coefficients_path_whitecourt_all_variables, sep=',')
-        do_calculate_probabilities(whitecourt_all_terms_dfs, whitecourt_all_variables_df)
-        
         # Post-probability calculation operations follow below:     
 
         # Convert the date column to datetime format.
@@ -431,26 +317,14 @@ class HumanFireOccurrencePrediction(object):
         # Output the Human FOP expected values and probabilities for this new prediction run to disk.
         self.hmn_fop_probabilities_expected_values_df.to_csv(self.hmn_gridded_predictions_output_path, sep=',', index=False)
 
-        # Append the new predictions to the cumulative Human FOP expected values and probabilties file.
-        hmn_cumulative_probs_expvals_df = hmn_cumulative_probs_expvals_df.append(self.hmn_fop_probabilities_expected_values_df)
-        
-        # Convert the date column to datetime format.
-        hmn_cumulative_probs_expvals_df['date'] = pd.to_datetime(hmn_cumulative_probs_expvals_df['date'])
-
-        # Sort the cumulative Human FOP expected values and probabilties file first by date, and then by fishnet_id.
-        hmn_cumulative_probs_expvals_df = hmn_cumulative_probs_expvals_df.sort_values(['date', 'fishnet_id'], ascending=[True, True])
-
-        # Apply rounding operations to specific columns.
-        hmn_cumulative_probs_expvals_df['latitude'] = hmn_cumulative_probs_expvals_df['latitude'].apply(lambda x : round(float(x), 4))
-        hmn_cumulative_probs_expvals_df['longitude'] = hmn_cumulative_probs_expvals_df['longitude'].apply(lambda x : round(float(x), 4))
-        hmn_cumulative_probs_expvals_df['logit'] = hmn_cumulative_probs_expvals_df['logit'].apply(lambda x : round(float(x), 12))
-        hmn_cumulative_probs_expvals_df['probability'] = hmn_cumulative_probs_expvals_df['probability'].apply(lambda x : round(float(x), 12))
+        # Save the new predictions to the cumulative Human FOP predictions store. Only the partitions of the days predicted
+        # for are re-written; their rows are sorted by fishnet_id, rounded and de-duplicated by the store.
+        hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
+        hmn_predictions_store.putDays(self.hmn_fop_probabilities_expected_values_df)
 
-        # Delete any duplicate rows which may have arisen, in order to maintain integrity of the dataset.
-        hmn_cumulative_probs_expvals_df.drop_duplicates(keep='first', inplace=True)
-
-        # Write the updated cumulative Human FOP expected values and probabilties dataframe to disk.
-        hmn_cumulative_probs_expvals_df.to_csv(self.hmn_cumulative_probs_expvals_output_path, sep=',', index=False) 
+        # Re-write the whole cumulative Human FOP expected values and probabilties file from the store, if asked to.
+        if FOPConstantsAndFunctions.HMN_CUMULATIVE_TEXT_EXPORT:
+            hmn_predictions_store.exportCumulativeFile(self.hmn_cumulative_probs_expvals_output_path)
 
         # We're done!
         return
@@ -460,8 +334,8 @@ class HumanFireOccurrencePrediction(object):
             (East Boreal, West Boreal, and Slopes), as well as for the whole Province of Alberta.
         """
 
-        # Load in the Human FOP cumulative probabilities and expected values file.
-        hmn_cumulative_probs_expvals_df = pd.read_csv(self.hmn_cumulative_probs_expvals_output_path, sep=',', parse_dates=['date'])
+        # Open the Human FOP cumulative predictions store; each day's probabilities are fetched from it below.
+        hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
 
         # Create a dataframe that will hold the final daily confidence interval outputs.
         hmn_confidence_intervals_output_df = pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS)
@@ -483,11 +357,8 @@ class HumanFireOccurrencePrediction(object):
                                             'randomly_generated_probability', 'did_a_fire_happen']
             hmn_daily_simulation_df = pd.DataFrame(columns=hmn_daily_simulation_headers)"""
 
-            # Load up a new "view" of probability data from the confidence interval output file for the current day.
-            hmn_daily_cumulative_probs_expvals_df = hmn_cumulative_probs_expvals_df.loc[(hmn_cumulative_probs_expvals_df['date'].dt.year == current_day.year) &
-                                                                                        (hmn_cumulative_probs_expvals_df['date'].dt.month == current_day.month) &
-                                                                                        (hmn_cumulative_probs_expvals_df['date'].dt.day == current_day.day)
-                                                                                        ]
+            # Load up the probability data for the current day from the predictions store.
+            hmn_daily_cumulative_probs_expvals_df = hmn_predictions_store.getDay(current_day)
             
             # Lists to keep track of the total number of human-caused fires which occur per day for all simulation replications.
             total_fires_slopes = []
@@ -610,8 +481,12 @@ class HumanFireOccurrencePrediction(object):
         """ This method runs a simulation to produce confidence intervals for the three Alberta regions
             (East Boreal, West Boreal, and Slopes), as well as for the whole Province of Alberta.
         """
-        # Load in the Human FOP cumulative probabilities and expected values file.
-        hmn_cumulative_probs_expvals_df = pd.read_csv(self.hmn_cumulative_probs_expvals_output_path, sep=',', parse_dates=['date'])
+        # Compute the confidence intervals exactly instead, if asked to.
+        if USE_EXACT_CONFIDENCE_INTERVALS:
+            return self.humanExactConfidenceIntervalGenerator(days_to_simulate, hmn_fire_confidence_interval)
+
+        # Open the Human FOP cumulative predictions store; each day's probabilities are fetched from it below.
+        hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
 
         # Create a dataframe that will hold the final daily confidence interval outputs.
         hmn_confidence_intervals_output_df = pd.DataFrame(columns=FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS)
@@ -629,59 +504,25 @@ class HumanFireOccurrencePrediction(object):
             # Determine the day of the year that we are simulating for.
             day_of_year = current_day.timetuple().tm_yday
 
-            # Create a dataframe that will hold each day's confidence interval outputs for all replications.
-            """hmn_daily_simulation_headers = ['simulation_replication_num', 'fishnet_id', 'date', 'nsr_numerical_code', 'ab_region', 'calculated_probability', 
-                                            'randomly_generated_probability', 'did_a_fire_happen']
-            hmn_daily_simulation_df = pd.DataFrame(columns=hmn_daily_simulation_headers)"""
-
-            # Load up a new "view" of probability data from the confidence interval output file for the current day.
-            hmn_daily_cumulative_probs_expvals_df = hmn_cumulative_probs_expvals_df.loc[(hmn_cumulative_probs_expvals_df['date'].dt.year == current_day.year) &
-                                                                                        (hmn_cumulative_probs_expvals_df['date'].dt.month == current_day.month) &
-                                                                                        (hmn_cumulative_probs_expvals_df['date'].dt.day == current_day.day)
-                                                                                        ]
+            # Load up the probability data for the current day from the predictions store.
+            hmn_daily_cumulative_probs_expvals_df = hmn_predictions_store.getDay(current_day)
+            probabilities = hmn_daily_cumulative_probs_expvals_df['probability'].values.astype(float)
+            regions = hmn_daily_cumulative_probs_expvals_df['region_ci'].values
 
-            # Start the simulation.
-            intermediate_sim_df = pd.DataFrame(index=np.arange(NUM_SIMULATION_REPLICATIONS * len(hmn_daily_cumulative_probs_expvals_df.index)),
-                                               columns=FOPConstantsAndFunctions.HMN_INTERMEDIATE_SIM_COLUMNS)
-            
-            # print("humanSimulationConfidenceIntervalGenerator(): Fetching and generating data for the following columns:")
-            # print("humanSimulationConfidenceIntervalGenerator(): sim_num. . .")
-            intermediate_sim_df['sim_num'] = pd.Series(np.arange(NUM_SIMULATION_REPLICATIONS).repeat(len(hmn_daily_cumulative_probs_expvals_df.index)),
-                                                       index=intermediate_sim_df.index)
-                                                       
-            # print("humanSimulationConfidenceIntervalGenerator(): fishnet_id. . .")
-            intermediate_sim_df['fishnet_id'] = pd.Series(np.tile(hmn_daily_cumulative_probs_expvals_df['fishnet_id'], NUM_SIMULATION_REPLICATIONS))
+            # Give each cell the code of its CI region (cells outside of them only count towards the whole province).
+            region_codes = np.full(len(regions), len(FOPConstantsAndFunctions.HMN_CI_REGIONS))
+            for region_code, region in enumerate(FOPConstantsAndFunctions.HMN_CI_REGIONS):
+                region_codes[regions == region] = region_code
 
-            # print("humanSimulationConfidenceIntervalGenerator(): region_ci. . .")
-            intermediate_sim_df['region_ci'] = pd.Series(np.tile(hmn_daily_cumulative_probs_expvals_df['region_ci'], NUM_SIMULATION_REPLICATIONS))
-
-            # print("humanSimulationConfidenceIntervalGenerator(): probability. . .")
-            intermediate_sim_df['probability'] = pd.Series(np.tile(hmn_daily_cumulative_probs_expvals_df['probability'], NUM_SIMULATION_REPLICATIONS))
-
-            # print("humanSimulationConfidenceIntervalGenerator(): random_number. . .")
-            intermediate_sim_df['random_number'] = pd.Series(np.random.random(NUM_SIMULATION_REPLICATIONS * len(hmn_daily_cumulative_probs_expvals_df.index)))
-
-            # print("humanSimulationConfidenceIntervalGenerator(): fire_alberta. . .")
-            intermediate_sim_df['fire_alberta'] = np.where((intermediate_sim_df['random_number'] < intermediate_sim_df['probability']), 1, 0)
-
-            # print("humanSimulationConfidenceIntervalGenerator(): fire_slopes. . .")
-            intermediate_sim_df['fire_slopes'] = np.where(((intermediate_sim_df['random_number'] < intermediate_sim_df['probability']) &
-                                                           (intermediate_sim_df['region_ci'] == 'Slopes')), 1, 0)
-
-            # print("humanSimulationConfidenceIntervalGenerator(): fire_west_boreal. . .")
-            intermediate_sim_df['fire_west_boreal'] = np.where(((intermediate_sim_df['random_number'] < intermediate_sim_df['probability']) &
-                                                                (intermediate_sim_df['region_ci'] == 'West Boreal')), 1, 0)
-
-            # print("humanSimulationConfidenceIntervalGenerator(): fire_east_boreal. . .")
-            intermediate_sim_df['fire_east_boreal'] = np.where(((intermediate_sim_df['random_number'] < intermediate_sim_df['probability']) &
-                                                                (intermediate_sim_df['region_ci'] == 'East Boreal')), 1, 0)
+            # Simulate the number of fires in each CI region for every replication, a block of replications at a time.
+            fire_counts = FOPConstantsAndFunctions.simulateRegionalFireCounts(probabilities, region_codes, len(FOPConstantsAndFunctions.HMN_CI_REGIONS) + 1,
+                                                                              NUM_SIMULATION_REPLICATIONS)
 
             # Determine the sorted sums of the four CI "regions" of interest.
-            # print("humanSimulationConfidenceIntervalGenerator(): Sorting sums of fires for %d replications. . ." % NUM_SIMULATION_REPLICATIONS)
-            alberta_ci_sums = np.sort(intermediate_sim_df.groupby('sim_num')['fire_alberta'].sum())
-            slopes_ci_sums = np.sort(intermediate_sim_df.groupby('sim_num')['fire_slopes'].sum())
-            west_boreal_ci_sums = np.sort(intermediate_sim_df.groupby('sim_num')['fire_west_boreal'].sum())
-            east_boreal_ci_sums = np.sort(intermediate_sim_df.groupby('sim_num')['fire_east_boreal'].sum())
+            alberta_ci_sums = np.sort(fire_counts.sum(axis=1))
+            slopes_ci_sums = np.sort(fire_counts[:, FOPConstantsAndFunctions.HMN_CI_REGIONS.index('Slopes')])
+            west_boreal_ci_sums = np.sort(fire_counts[:, FOPConstantsAndFunctions.HMN_CI_REGIONS.index('West Boreal')])
+            east_boreal_ci_sums = np.sort(fire_counts[:, FOPConstantsAndFunctions.HMN_CI_REGIONS.index('East Boreal')])
 
             # Assert statements; we should have as many means per CI region as we have simulation replications.
             assert(len(alberta_ci_sums) == NUM_SIMULATION_REPLICATIONS)
@@ -737,9 +578,44 @@ class HumanFireOccurrencePrediction(object):
 
         # print("humanSimulationConfidenceIntervalGenerator(): Simulation complete.")
     
-    def humanFirePredictionMapper(self, map_type, days_to_map, display_historical_fires_on_maps, hmn_fire_confidence_interval):
+    def humanExactConfidenceIntervalGenerator(self, days_to_simulate, hmn_fire_confidence_interval):
+        """ This method produces the same confidence intervals as humanSimulationConfidenceIntervalGeneratorV2(), for
+            the three Alberta regions (East Boreal, West Boreal, and Slopes) as well as for the whole Province of Alberta,
+            without simulating.
+
+            Each fishnet cell is an independent trial which has a fire with its predicted probability, so the number of
+            fires in a region follows a Poisson-binomial distribution; the confidence interval bounds are read off its
+            exact distribution (see FOPConstantsAndFunctions.poissonBinomialQuantiles()), with no sampling noise.
+        """
+        # Open the Human FOP cumulative predictions store; each day's probabilities are fetched from it below.
+        hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
+
+        confidence_interval_rows = []
+        for current_day in days_to_simulate:
+
+            # Load up the probability data for the current day from the predictions store.
+            hmn_daily_cumulative_probs_expvals_df = hmn_predictions_store.getDay(current_day)
+
+            # Province of Alberta, Slopes, West Boreal and East Boreal (low and high bounds of each).
+            confidence_interval_row = [current_day.year, current_day.timetuple().tm_yday, current_day.month, current_day.day]
+            confidence_interval_row += FOPConstantsAndFunctions.humanRegionalConfidenceIntervals(hmn_daily_cumulative_probs_expvals_df['probability'].values,
+                                                                                                 hmn_daily_cumulative_probs_expvals_df['region_ci'].values,
+                                                                                                 hmn_fire_confidence_interval)
+
+            confidence_interval_rows.append(confidence_interval_row)
+
+        # Output the confidence intervals to disk, in the same format as the simulation.
+        hmn_confidence_intervals_output_df = pd.DataFrame(confidence_interval_rows, columns=FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS)
+        hmn_confidence_intervals_output_df.to_csv(self.hmn_confidence_intervals_output_path, sep=' ', index=False, header=False)
+
+    def humanFirePredictionMapper(self, map_type, days_to_map, display_historical_fires_on_maps, hmn_fire_confidence_interval,
+                                  gridded_predictions_df=None, confidence_intervals_df=None, map_name_prefix='hmn_'):
         """ This method produces a map of human fire predictions overlayed on an Alberta
             weather zone map.
+
+            The predictions and confidence intervals are read from the predictions store and the confidence intervals
+            output file, unless they are given (see humanFOPScenario()); the maps are saved as
+            <map_name_prefix>probability_YYYY-MM-DD.png and <map_name_prefix>ffmc_YYYY-MM-DD.png.
         """
         
         # Read in the Alberta shapefile and set up the plot.
@@ -769,13 +645,15 @@ class HumanFireOccurrencePrediction(object):
         
         # Load up the necessary files as specified by the method input parameters, and populate dataframes.
 
-        # Load up the grid predictions file and add column headers.
-        gridded_predictions_df = pd.read_csv(self.hmn_cumulative_probs_expvals_output_path, sep=',', parse_dates=['date'])
-        gridded_predictions_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
+        # Load up the grid predictions for the days to map from the predictions store.
+        if gridded_predictions_df is None:
+            hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
+            gridded_predictions_df = hmn_predictions_store.getDays(days_to_map)
 
         # Load up the confidence intervals file and add column headers.
-        confidence_intervals_df = pd.read_csv(self.hmn_confidence_intervals_output_path, delim_whitespace=True, header=None)
-        confidence_intervals_df.columns = FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS
+        if confidence_intervals_df is None:
+            confidence_intervals_df = pd.read_csv(self.hmn_confidence_intervals_output_path, delim_whitespace=True, header=None)
+            confidence_intervals_df.columns = FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS
 
         # If there are no predictions for this date (ie. early in the fire season when there are no FWI values yet),
         # do not generate this map.
@@ -904,7 +782,7 @@ class HumanFireOccurrencePrediction(object):
                 ax.yaxis.set_visible(False)
 
                 # Output the generated map to a PNG image; crop the map's whitespace, leaving a 0.25 inch padding.
-                plt.savefig(fname=(self.hmn_output_maps_folder + "/hmn_probability_" + date.strftime('%Y-%m-%d') + ".png"), format='png', dpi=200,
+                plt.savefig(fname=(self.hmn_output_maps_folder + "/" + map_name_prefix + "probability_" + date.strftime('%Y-%m-%d') + ".png"), format='png', dpi=200,
                             bbox_inches='tight', pad_inches=0.25)
             
                 # Reset and close the plot and figures.
@@ -943,7 +821,7 @@ class HumanFireOccurrencePrediction(object):
                 ax.yaxis.set_visible(False)
 
                 # Output the generated map to a PNG image.
-                plt.savefig(fname=(self.hmn_output_maps_folder + "/hmn_ffmc_" + date.strftime('%Y-%m-%d') + ".png"), format='png', dpi=200,
+                plt.savefig(fname=(self.hmn_output_maps_folder + "/" + map_name_prefix + "ffmc_" + date.strftime('%Y-%m-%d') + ".png"), format='png', dpi=200,
                             bbox_inches='tight', pad_inches=0.25)
             
                 # Reset and close the plot and figures.
@@ -1096,11 +974,10 @@ class HumanFireOccurrencePrediction(object):
 
         # Call the C Simulator wrapper using the provided start_date and end_date.
         # print("HumanFOPDateRangeMapper(): Determining which days we can map immediately, and which ones we need to predict for first. . .")
-        # Call humanFOPController, which will take care of determining which days need predicting, vs. which days we can simply map
-        # straight away.
-        for date in FOPConstantsAndFunctions.daterange(start_day, end_day + datetime.timedelta(days=1)):
-            # print("HumanFOPDateRangeMapper(): Calling humanFOPController() for %s. . .", date.strftime("%Y-%m-%d"))
-            self.humanFOPController(date, hmn_fire_confidence_interval, display_historical_fires_on_maps)
+        # Call humanFOPRangeController, which will take care of determining which days need predicting, vs. which days we can simply map
+        # straight away. The days that need predicting are all predicted for in one pass.
+        dates = list(FOPConstantsAndFunctions.daterange(start_day, end_day + datetime.timedelta(days=1)))
+        self.humanFOPRangeController(dates, hmn_fire_confidence_interval, display_historical_fires_on_maps)
         
         # print("HumanFOPDateRangeMapper(): Date range mapping and prediction operation complete.")
     
@@ -1134,6 +1011,17 @@ class HumanFireOccurrencePrediction(object):
             
             The date_to_predict_for is a datetime datatype."""
         
+        self.humanFOPRangeController([date_to_predict_for], hmn_fire_confidence_interval, display_historical_fires_on_maps)
+
+    def humanFOPRangeController(self, dates_to_predict_for, hmn_fire_confidence_interval, display_historical_fires_on_maps):
+        """ This method runs the Human FOP flow (see humanFOPController()) for a list of days in one pass.
+
+            Days which have been predicted for already are simply simulated and mapped. The other days are predicted
+            for together: their raw weather is massaged and interpolated in one go, every fishnet cell is scored for
+            all of them at once (see humanFOPRangeProbabilitiesCalculator()), and the FOP system state DB is written
+            once. If one of these days does not exist in the raw weather dataset, the days before it are still
+            predicted for and mapped, and an exception is raised afterwards. """
+        
         # Load in the FOP system state data set, and the raw weather data.        
         # Sanity check: Ensure that the system state data set exists.
         try:
@@ -1146,8 +1034,8 @@ class HumanFireOccurrencePrediction(object):
             if len(self.fop_system_state_db_df.index) == 0:
                 # print("humanFOPController(): Initializing empty FOP system state DB. . .:")
 
-                for new_date in FOPConstantsAndFunctions.daterange(pd.Timestamp(date_to_predict_for.year, 3, 1),
-                                                                   pd.Timestamp(date_to_predict_for.year, 10, 31) + datetime.timedelta(days=1)
+                for new_date in FOPConstantsAndFunctions.daterange(pd.Timestamp(dates_to_predict_for[0].year, 3, 1),
+                                                                   pd.Timestamp(dates_to_predict_for[0].year, 10, 31) + datetime.timedelta(days=1)
                                                                   ):
                     row_data = {'DATE':[new_date], 'LIGHTNING_FOP_COMPLETED':['N'], 'HUMAN_FOP_COMPLETED':['N'], 'FORECASTED_OR_OBSERVED':['O']}
                     row_data_df = pd.DataFrame.from_dict(row_data)
@@ -1164,74 +1052,42 @@ class HumanFireOccurrencePrediction(object):
             # print(e)
             return
 
-        # See if we have already produced predictions for this day.
-        if self.fop_system_state_db_df.at[pd.to_datetime(date_to_predict_for), 'HUMAN_FOP_COMPLETED'] == 'Y':
-            # print("humanFOPController(): The provided date, %s, exists already in the system. Producing maps for it." % str(date_to_predict_for))
-
-            # The day we want to predict for exists already.
-            # Determine the day of year (Julian) so that we can pull the prediction for this day.
-            day_of_year = date_to_predict_for.timetuple().tm_yday
-            # print("humanFOPController(): day_of_year is ", day_of_year)
-
-            # Determine the confidence intervals for this day by calling the simulation method.
-            self.humanSimulationConfidenceIntervalGeneratorV2([date_to_predict_for], hmn_fire_confidence_interval)
-
-            # Valid map strings: 'probability', 'ffmc', ... all case sensitive.
-            # Use 'all' to output all maps.
-            self.humanFirePredictionMapper('all', [date_to_predict_for], display_historical_fires_on_maps, hmn_fire_confidence_interval)
-        
-        else:
-            # This day does not exist in the system. We need to execute the Human FOP flow for the desired day.            
-            # print("humanFOPController(): date_to_predict_for is ", date_to_predict_for)
-
-            # Parse the weather_date column as a datetime to allow for easy access to year, month, day and hour.
-            # Here, we use the infer_datetime_format=True flag because the datetime in the file is NOT zero-padded, and
-            # the default datetime placeholders do not allow for that by default.
-            
-            # Next, we need to select only the raw weather data for the day that we need to produce a human-caused
-            # prediction for.
-            raw_weather_data_df = pd.read_csv(self.hmn_input_raw_weather_data_file, sep=',')
-
-             # Perform a header check to determine the well-formed nature of the CSV.
-            if list(raw_weather_data_df.columns) == FOPConstantsAndFunctions.RAW_WEATHER_CSV_HEADERS:
-
-                raw_weather_data_df['weather_date'] = pd.to_datetime(raw_weather_data_df['weather_date'], format='%m/%d/%y %H:%M', infer_datetime_format=True)
-
-            elif list(raw_weather_data_df.columns) == FOPConstantsAndFunctions.RAW_WEATHER_CSV_HEADERS_2:
-                
-                
-                # Make all of the weather column headers to be lowercase.
-                raw_weather_data_df.columns = map(str.lower, raw_weather_data_df.columns)
-                raw_weather_data_df['weather_date'] = pd.to_datetime(raw_weather_data_df['weather_date'], format='%Y-%m-%d %H:%M:%S', infer_datetime_format=True)
-
-            else:
-                # print("humanFOPController(): Raw weather data columns do not match what is expected. ERROR")
-                raise ValueError
-
-            # Sort the raw weather dataframe by the column: "weather_date".
-            raw_weather_data_df = raw_weather_data_df.sort_values(by='weather_date')
-        
-            # Convert date_to_predict_for using pd.to_datetime().
-            date_to_predict_for = pd.to_datetime(date_to_predict_for)
-
-            date_mask_weather = ((raw_weather_data_df['weather_date'].dt.year == date_to_predict_for.year) &
-                                 (raw_weather_data_df['weather_date'].dt.month == date_to_predict_for.month) &
-                                 (raw_weather_data_df['weather_date'].dt.day == date_to_predict_for.day))
-
-            # Perform the date selection for this dataframe; selection is inclusive.
-            raw_weather_data_df = raw_weather_data_df.loc[date_mask_weather]
-
-
-
-            # Ensure that we actually have grabbed data for the date we want to predict for.
-            if raw_weather_data_df.empty:
-                # print("humanFOPController(): The provided date, %s, does not exist in the raw weather dataset. \r\n" \
-                    # "Please provide a more up-to-date raw weather data file or adjust the prediction date and try again." % str(date_to_predict_for))
-                raise Exception
-                return
-            
-            
-            # We are good to go on the raw weather data side. Let's start the Human FOP flow.
+        # Convert the dates using pd.to_datetime() for FOP system state DB indexing purposes.
+        dates_to_predict_for = [pd.to_datetime(date) for date in dates_to_predict_for]
+
+        # See which days we have already produced predictions for; the rest need the Human FOP flow to be executed.
+        dates_to_execute = [date for date in dates_to_predict_for if self.fop_system_state_db_df.at[date, 'HUMAN_FOP_COMPLETED'] != 'Y']
+
+        # The raw weather data is read in (and checked to be well-formed) once per uploaded file, and kept in a store
+        # partitioned by day; a ValueError is raised if the CSV is not well-formed.
+        raw_weather_data_dfs = []
+        missing_raw_weather_date = None
+        if dates_to_execute:
+            raw_weather_store = RawWeatherStore(self.hmn_raw_weather_store_folder, self.hmn_input_raw_weather_data_file)
+
+            # Grab the raw weather data for each day, and ensure that we actually have data for the days we want to
+            # predict for. Stop at the first day that does not exist in the raw weather dataset.
+            for date in dates_to_execute:
+                raw_weather_data_df = raw_weather_store.getDay(date)
+                if raw_weather_data_df.empty:
+                    # print("humanFOPController(): The provided date, %s, does not exist in the raw weather dataset. \r\n" \
+                        # "Please provide a more up-to-date raw weather data file or adjust the prediction date and try again." % str(date))
+                    missing_raw_weather_date = date
+                    break
+                raw_weather_data_dfs.append(raw_weather_data_df)
+
+            if missing_raw_weather_date is not None:
+                dates_to_predict_for = [date for date in dates_to_predict_for if date < missing_raw_weather_date]
+                dates_to_execute = dates_to_execute[:len(raw_weather_data_dfs)]
+
+        if dates_to_execute:
+            # We are good to go on the raw weather data side. Let's start the Human FOP flow for all of these days.
+            raw_weather_data_df = pd.concat(raw_weather_data_dfs)
+
+            # Reduce the hourly observations to one (noon) observation per station per day, so that no station
+            # appears more than once in the weather interpolation.
+            if FOPConstantsAndFunctions.REDUCE_RAW_WEATHER_TO_STATION_DAILY:
+                raw_weather_data_df = FOPConstantsAndFunctions.reduceToStationDailyObservations(raw_weather_data_df)
 
             # 1. Call the raw weather data massager method on the prepared raw weather dataframe.
             FOPConstantsAndFunctions.rawWeatherDataMassager(raw_weather_data_df,
@@ -1242,27 +1098,127 @@ class HumanFireOccurrencePrediction(object):
             self.weatherInterpolationBinnerWrapper()
 
             # 3. Calculate the expected values and probabilities for human-caused fires.
-            self.humanFOPProbabilitiesCalculator(date_to_predict_for)
+            self.humanFOPRangeProbabilitiesCalculator(dates_to_execute)
 
-            # 4. Determine the confidence intervals for this day by calling the simulation method.
-            self.humanSimulationConfidenceIntervalGeneratorV2([date_to_predict_for], hmn_fire_confidence_interval)
+            # 4. Update the FOP system state DB with the newly-processed dates, and write it to disk once.
+            for date in dates_to_execute:
+                self.fop_system_state_db_df.at[date, 'HUMAN_FOP_COMPLETED'] = 'Y'
 
-            # 5. Update the FOP system state DB with the newly-processed dates.
+            self.fop_system_state_db_df.to_csv(self.fop_system_state_db_path, sep=',', index=True)
 
-            # Convert date_to_predict_for to a datetime64 for FOP system state DB indexing purposes.
-            date_to_predict_for = pd.to_datetime(date_to_predict_for)
-            
-            # Update the row index at date_to_predict_for in the FOP system state DB as being predicted for.
-            self.fop_system_state_db_df.at[date_to_predict_for, 'HUMAN_FOP_COMPLETED'] = 'Y'
-                     
+        if dates_to_predict_for:
+            # 5. Determine the confidence intervals for these days by calling the simulation method.
+            self.humanSimulationConfidenceIntervalGeneratorV2(dates_to_predict_for, hmn_fire_confidence_interval)
 
-            # Write the new information to the DB on disk.
-            self.fop_system_state_db_df.to_csv(self.fop_system_state_db_path, sep=',', index=True)
+            # 6. Call the mapping method which will produce maps for the desired dates.
+            # Valid map strings: 'probability', 'ffmc', ... all case sensitive.
+            # Use 'all' to output all maps.
+            self.humanFirePredictionMapper('all', dates_to_predict_for, display_historical_fires_on_maps, hmn_fire_confidence_interval)
 
-            # 5. Call the mapping method which will produce maps for the desired date.
-            self.humanFirePredictionMapper('all', [date_to_predict_for], display_historical_fires_on_maps, hmn_fire_confidence_interval)
+        if missing_raw_weather_date is not None:
+            raise Exception
 
         # We are done!
         print("humanFOPController(): Run successfully completed.")
         return
-        
+
+    def humanFOPScenario(self, date, ffmc_overrides=None, ffmc_shifts=None, day_of_year_overrides=None, hmn_fire_confidence_interval=90.0,
+                         map_type=None):
+        """ This method answers "what if" questions about a day that has already been predicted for (e.g. "what if the
+            FFMC rises 5 points across the Slave Lake Forest Area?") without re-running the Human FOP pipeline.
+
+            ffmc_overrides sets, and ffmc_shifts adds to, the FFMC of the cells; day_of_year_overrides sets the day of
+            year (Julian) that they are predicted for. Each is a dictionary keyed by fishnet ID, forest area (e.g.
+            'Slave Lake' or 'Slave Lake Forest Area'), CI region ('Slopes', 'West Boreal' or 'East Boreal'), or 'Alberta'
+            for every cell. Every other predictor is the day's, as found in the predictions store.
+
+            The logits and probabilities are re-computed from the forest area models' cached static effects and term
+            tables (see FOPHumanModel), and the regional confidence intervals exactly (as humanExactConfidenceIntervalGenerator()
+            does). Nothing is written to the predictions store or the output files; if map_type is given ('probability',
+            'ffmc' or 'all'), maps of the scenario are saved as hmn_scenario_<map type>_YYYY-MM-DD.png.
+
+            Returns the scenario's predictions (HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS columns, one row per cell,
+            sorted by fishnet_id) and confidence intervals (HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS columns, one row).
+        """
+        # Load up the day's predictions from the predictions store; the scenario starts from them.
+        hmn_predictions_store = HumanPredictionsStore(self.hmn_predictions_store_folder, self.hmn_cumulative_probs_expvals_output_path)
+        baseline_df = hmn_predictions_store.getDay(date)
+
+        if len(baseline_df.index) == 0:
+            raise ValueError("humanFOPScenario(): There are no Human FOP predictions for %s to base a scenario on." % date.strftime('%Y-%m-%d'))
+
+        # Where a fishnet cell appears more than once, its first row is used.
+        baseline_df = baseline_df.drop_duplicates(subset='fishnet_id', keep='first')
+        fishnet_ids = baseline_df['fishnet_id'].values
+        forest_areas = baseline_df['forest_area'].values
+        regions = baseline_df['region_ci'].values
+
+        def scenarioCells(key):
+            """ Returns which of the day's cells an override key applies to, as a boolean array. """
+            if isinstance(key, str):
+                cells = (key == 'Alberta') | (forest_areas == key) | (forest_areas == key + ' Forest Area') | (regions == key)
+            else:
+                cells = fishnet_ids == key
+
+            if not np.any(cells):
+                raise KeyError("humanFOPScenario(): No fishnet cells match the override key %r." % (key,))
+
+            return cells
+
+        # Apply the FFMC overrides, then the shifts. Cells without valid data (an FFMC of -1.0) stay without it unless
+        # their FFMC is overridden; the scenario's FFMC is kept within the range covered by the FFMC terms.
+        ffmc = np.where(baseline_df['ffmc_interpolated'].values >= 0, baseline_df['ffmc_interpolated'].values.astype(float), np.nan)
+        for key, value in (ffmc_overrides or {}).items():
+            ffmc[scenarioCells(key)] = value
+        for key, shift in (ffmc_shifts or {}).items():
+            ffmc[scenarioCells(key)] += shift
+        ffmc = np.clip(ffmc, *FOPConstantsAndFunctions.HMN_FFMC_TERM_RANGE)
+
+        # Apply the day of year overrides. Each distinct day of year in the scenario is scored as a separate "day".
+        day_of_years = baseline_df['day_of_year'].values.astype(np.int64)
+        for key, value in (day_of_year_overrides or {}).items():
+            day_of_years[scenarioCells(key)] = value
+        day_of_year_julians, cell_day_indices = np.unique(day_of_years, return_inverse=True)
+        march_april_days = np.isin([(datetime.date(date.year, 1, 1) + datetime.timedelta(days=int(day_of_year) - 1)).month
+                                    for day_of_year in day_of_year_julians], [3, 4])
+
+        # Re-score every forest area in this process, where their compiled models are kept loaded between scenarios.
+        ffmc_by_fishnet_df = pd.DataFrame(np.repeat(ffmc[:, np.newaxis], len(day_of_year_julians), axis=1), index=fishnet_ids)
+        scoring_inputs = self.humanScoringInputs(day_of_year_julians, march_april_days, ffmc_by_fishnet_df)
+        forest_area_results = [result for result in FOPHumanModel.scoreHumanForestAreas(self.humanForestAreas(), scoring_inputs) if result is not None]
+
+        # Keep the scored cells that are in the day's predictions, each with the scores of its own day of year.
+        scored_fishnet_ids = np.concatenate([result['fishnet_id'] for result in forest_area_results])
+        scored_day_indices = pd.Series(cell_day_indices, index=fishnet_ids).reindex(scored_fishnet_ids).values
+        cells = np.flatnonzero(~np.isnan(scored_day_indices))
+        cell_day_indices = scored_day_indices[cells].astype(np.int64)
+
+        scenario_columns = OrderedDict([('fishnet_id', scored_fishnet_ids[cells]),
+                                        ('date', pd.Timestamp(date)),
+                                        ('day_of_year', day_of_year_julians[cell_day_indices])])
+        for column in FOPHumanModel.HMN_FOREST_AREA_CELL_COLUMNS[1:]:
+            scenario_columns[column] = np.concatenate([result[column] for result in forest_area_results])[cells]
+        for column in FOPHumanModel.HMN_FOREST_AREA_DAY_CELL_COLUMNS:
+            scenario_columns[column] = np.concatenate([result[column] for result in forest_area_results], axis=1)[cell_day_indices, cells]
+
+        # Lay out the scenario's predictions as the predictions store does.
+        scenario_df = pd.DataFrame(scenario_columns)
+        scenario_df.columns = FOPConstantsAndFunctions.HMN_PROBABILITIES_EXPECTED_VALUES_HEADERS
+        for column in HumanPredictionsStore.NUMERIC_COLUMNS:
+            scenario_df[column] = pd.to_numeric(scenario_df[column])
+        for column, ndigits in HumanPredictionsStore.ROUNDED_COLUMNS:
+            scenario_df[column] = FOPConstantsAndFunctions.roundLikeBuiltin(scenario_df[column].values, ndigits)
+        scenario_df = scenario_df.sort_values('fishnet_id', kind='mergesort').drop_duplicates(subset='fishnet_id', keep='first').reset_index(drop=True)
+
+        # Province of Alberta, Slopes, West Boreal and East Boreal (low and high bounds of each).
+        confidence_interval_row = [date.year, date.timetuple().tm_yday, date.month, date.day]
+        confidence_interval_row += FOPConstantsAndFunctions.humanRegionalConfidenceIntervals(scenario_df['probability'].values, scenario_df['region_ci'].values,
+                                                                                             hmn_fire_confidence_interval)
+        confidence_intervals_df = pd.DataFrame([confidence_interval_row], columns=FOPConstantsAndFunctions.HMN_CONFIDENCE_INTERVAL_PREDICTIONS_HEADERS)
+
+        # Map the scenario, if asked to.
+        if map_type is not None:
+            self.humanFirePredictionMapper(map_type, [date], False, float(hmn_fire_confidence_interval),
+                                           gridded_predictions_df=scenario_df, confidence_intervals_df=confidence_intervals_df, map_name_prefix='hmn_scenario_')
+
+        return scenario_df, confidence_intervals_df
@@ -12,11 +12,13 @@
 import csv  # Used for simple sequential input / output data processing.
 import os.path  # Used for determining the CWD, and other I/O-related tasks.
 import subprocess  # Used for calling Dr. Wotton's compiled exe files.
+import numpy as np
 import pandas as pd  # Used for more complicated (occasionally SQL-like) input / output data processing.
 import math  # Used for model calculations.
 import operator # Used for CSV sort-by-column.
 import timeit  # Used for measuring code execution time.
 from decimal import Decimal  # Used to round probabilities to an exact decimal as opposed to float.
+from collections import OrderedDict  # Used to keep the row counts of the probability stage in order.
 import datetime  # Used to determine the day of year (Julian), as well as date-based arithmetic.
 import random  # Used to generate a random number seed for the C simulation tool.
 import geopandas as gpd  # This and the following imports are used for mapping purposes.
@@ -27,6 +29,9 @@ from matplotlib import text
 import matplotlib.dates as mdates
 import pylab
 import FOPConstantsAndFunctions
+import FOPGridRegistry  # Canonical grid cells, shared with the Human FOP model.
+import FOPWeatherInterpolation  # Used for the weather interpolation cross-validation diagnostic.
+from FOPDataStores import LightningProbabilityCube, RawWeatherStore, WeatherGridStore  # Per-day raw weather and interpolated weather grids, shared with the Human FOP model.
 import pandas.io.common
 import sys
 import streamlit as st
@@ -49,15 +54,25 @@ class LightningFireOccurrencePrediction(object):
         # 1. Raw weather data file (path is already constructed, explicit from the GUI).
         self.ltg_input_raw_weather_data_file = ltg_input_raw_weather_data_file
 
+        # 1a. Raw weather store folder, holding the raw weather data partitioned by day (to be put in the intermediate data folder; shared with the Human FOP model).
+        self.ltg_raw_weather_store_folder = intermediate_output + '/' + FOPConstantsAndFunctions.RAW_WEATHER_STORE_FOLDER_NAME
+
         # 2. Massaged weather data file (to be put in the intermediate data folder).
         self.ltg_weather_massaged_output_path = intermediate_output + '/2_Massaged_Weather.csv'
 
         # 3. Weather interpolation coefficients data file path (to be put in the intermediate data folder)
         self.ltg_weather_interpolation_coefficients_path = intermediate_output + '/3_weather_interpolation_coefficients'
 
+        # 3a. Weather interpolation cross-validation output file paths (to be put in the intermediate data folder).
+        self.ltg_weather_interpolation_loo_residuals_path = intermediate_output + '/3_weather_interpolation_loo_residuals.csv'
+        self.ltg_weather_interpolation_gcv_scores_path = intermediate_output + '/3_weather_interpolation_gcv_scores.csv'
+
         # 4. Binned weather data file (to be put in the intermediate data folder).
         self.ltg_weather_binned_output_path = intermediate_output + '/4_Binned_Weather.csv'
 
+        # 4a. Interpolated weather grid store folder (to be put in the intermediate data folder; shared with the Human FOP model).
+        self.ltg_weather_grid_store_folder = intermediate_output + '/' + FOPConstantsAndFunctions.WEATHER_GRID_STORE_FOLDER_NAME
+
         # (4). Binned weather data file with lat-longs added (to be put in the intermediate data folder).
         self.ltg_weather_binned_output_lat_longs_added_path = intermediate_output + '/4_Binned_Weather_LatLongs_Added.csv'
 
@@ -73,6 +88,9 @@ class LightningFireOccurrencePrediction(object):
         # 8. Merged binned weather and lightning file path (to be put in the intermediate data folder).
         self.ltg_merged_weather_lightning_data_path = intermediate_output + '/8_Alberta_Merged_Weather_Lightning.csv'
 
+        # 8a. Lightning probability cube folder, passing the arrival and holdover ignition probabilities on to the simulator and mapper (to be put in the intermediate data folder).
+        self.ltg_probability_cube_folder = intermediate_output + '/' + FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_FOLDER_NAME
+
         # 9. Confidence intervals output file path (to be put in the output data folder)
         self.ltg_confidence_intervals_output_path = ltg_output_data_folder + '/AB-predictions.out'
 
@@ -175,9 +193,12 @@ class LightningFireOccurrencePrediction(object):
         if map_type in ['probign', 'probarr0', 'DMC', 'DC', 'totltg', 'all']:    
 
 
-            # Load up the probability file and add column headers.
-            probabilities_df = pd.read_csv(self.ltg_arrivals_holdovers_probabilities_output_path, delim_whitespace=True, header=None)
-            probabilities_df.columns = FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS
+            # Load up the probability cubes (each day is read as it is mapped), or the probability file with column headers added.
+            if FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_ENABLED:
+                probability_cube = LightningProbabilityCube(self.ltg_probability_cube_folder, self.ltg_grid_locations_path)
+            else:
+                probabilities_df = pd.read_csv(self.ltg_arrivals_holdovers_probabilities_output_path, delim_whitespace=True, header=None)
+                probabilities_df.columns = FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS
         
         # Loop through all of the days that we need to map.
         for date in days_to_map:
@@ -235,8 +256,11 @@ class LightningFireOccurrencePrediction(object):
             # If we are creating a map based on FWI, raw probabilities, or total lightning, load up a new view for this new date.
             if map_type in ['probign', 'probarr0', 'DMC', 'DC', 'totltg', 'all']:
                 
-                probabilities_df_view = probabilities_df.loc[(probabilities_df['jd'] == int(date.strftime('%j'))) &
-                                                             (probabilities_df['year'] == date.year)]
+                if FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_ENABLED:
+                    probabilities_df_view = probability_cube.getDayFrame(date)
+                else:
+                    probabilities_df_view = probabilities_df.loc[(probabilities_df['jd'] == int(date.strftime('%j'))) &
+                                                                 (probabilities_df['year'] == date.year)]
 
                 geo_df_fwi_probabilities = gpd.GeoDataFrame(probabilities_df_view,
                                                             crs={'init': 'EPSG:4269'},  # Initialize the coordinate system based on NAD83 lat/long.
@@ -637,24 +661,28 @@ class LightningFireOccurrencePrediction(object):
         #subprocess.run([f"{sys.executable}",self.lightning_wrapper_exe_path, self.ltg_grid_locations_path,self.ltg_strike_raw_massaged_output_path,self.ltg_lightning_binned_output_path])
         
     def weatherInterpolationBinnerWrapper(self):
-        """ Calls the wrapped weather interpolation and binning tools, feeding it the massaged weather data.
-            Here, we use subprocess.call as opposed to subprocess.Popen because subprocess.call
-            is blocking; we need the external call to finish before we carry on with other stages of
-            the processing flow. """
+        """ Interpolates the massaged weather data onto the Alberta grid and bins it.
+
+            The interpolated grids are kept in a per-day weather grid store that is shared with the Human FOP model;
+            a day is only re-interpolated when its massaged weather observations have changed. The binned weather
+            file is then written out from the store for the days found in the massaged weather data. """
         
-        # raw_input("Press Enter to continue . . .")
-        #st.write("Entering build.py")
-        subprocess.run([f"{sys.executable}", "lightning/weather/cf-build-AB.py"])
-        #st.write("Exiting build.py and entering use.py")
-        subprocess.run([f"{sys.executable}", "lightning/weather/use_cf2.py"])
-        #st.write("Exiting use.py")
-        #subprocess.call([f"{sys.executable}",self.weather_interpolation_exe_path, self.ltg_weather_massaged_output_path, self.ltg_weather_interpolation_coefficients_path])
-        #subprocess.call([f"{sys.executable}",self.weather_binning_exe_path, self.ltg_weather_binned_output_path, self.ltg_grid_locations_path, self.ltg_weather_interpolation_coefficients_path])
-    def simulationWrapper(self, start_day, end_day, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval):
+        weather_grid_store = WeatherGridStore(self.ltg_weather_grid_store_folder, self.ltg_grid_locations_path)
+
+        # Interpolate any new or changed days, and remember which days we have weather for.
+        self.ltg_interpolated_weather_dates = weather_grid_store.update(self.ltg_weather_massaged_output_path)
+
+        # Write out the binned weather file for these days.
+        weather_grid_store.writeBinnedWeatherFile(self.ltg_interpolated_weather_dates, self.ltg_weather_binned_output_path)
+
+    def simulationWrapper(self, start_day, end_day, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval, year):
         """ Calls the wrapped simulation tool, feeding it the massaged probability data.
             The simulation tool will produce two output files: one will contain the expected number
             of lightning-caused fires and holdovers on the landscape, and the other will contain
             the confidence interval data.
+
+            start_day and end_day are days of the given year (Julian); only that year's probability cube is
+            simulated, even though the cube folder keeps the probabilities of earlier runs' years as well.
             
             Here, we use subprocess.call as opposed to subprocess.Popen because subprocess.call
             is blocking; we need the external call to finish before we carry on with other stages of
@@ -670,7 +698,11 @@ class LightningFireOccurrencePrediction(object):
                          str(start_day),
                          str(end_day),
                          str(ltg_fire_holdover_lookback_time),
-                         str(ltg_fire_confidence_interval)
+                         str(ltg_fire_confidence_interval),
+                         # The simulator reads the probability cubes in place of the probabilities text file, if given.
+                         os.path.abspath(self.ltg_probability_cube_folder) if FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_ENABLED else '',
+                         # The year being simulated (the only one of the probability cubes that is read).
+                         str(year)
         ]
 
         with open('intermediate_output\\arguments.csv', 'w', newline='') as csv_file:
@@ -691,6 +723,31 @@ class LightningFireOccurrencePrediction(object):
                          #str(ltg_fire_holdover_lookback_time),
                          #str(ltg_fire_confidence_interval)])
     
+    def weatherInterpolationCrossValidation(self):
+        """ This diagnostic method cross-validates the weather interpolation spline against the massaged weather data.
+
+            It writes out the exact leave-one-out residual for every station and weather variable (i.e. how far off the
+            interpolated value at a station is when that station is left out), and the generalized cross-validation
+            score for each candidate smoothing factor. Both are computed from a single factorization per variable and
+            day rather than by refitting the spline.
+
+            Returns the smoothing factor selected for each weather variable (in WEATHER_INTERPOLATION_VARIABLES order),
+            which can be passed on to the weather grid store. """
+
+        loo_residuals_df, gcv_scores_df, selected_smoothing_factors = \
+            FOPWeatherInterpolation.crossValidateMassagedWeather(self.ltg_weather_massaged_output_path)
+
+        loo_residuals_df.to_csv(self.ltg_weather_interpolation_loo_residuals_path, sep=',', index=False)
+        gcv_scores_df.to_csv(self.ltg_weather_interpolation_gcv_scores_path, sep=',', index=False)
+
+        # Summarize the leave-one-out error per variable.
+        print(loo_residuals_df.groupby('variable')['loo_residual'].apply(lambda residuals: np.sqrt(np.mean(residuals ** 2))))
+
+        for variable, smoothing_factor in zip(FOPWeatherInterpolation.WEATHER_INTERPOLATION_VARIABLES, selected_smoothing_factors):
+            print("Selected smoothing factor for %s: %g" % (variable, smoothing_factor))
+
+        return selected_smoothing_factors
+
     def createGridLocationsFromWeatherStationLocationsAndTest(self):
         """ This debugging method will take in the weather station locations file and produce another file
             analogous in format to the GridLocations.prn file.
@@ -719,10 +776,12 @@ class LightningFireOccurrencePrediction(object):
             processLightningArrivalsHoldoversIgnitions() method to compute probabilities of arrivals and
             holdovers. """
 
+        # Read the interpolated and binned weather for the days we have weather for from the weather grid store.
+        weather_grid_store = WeatherGridStore(self.ltg_weather_grid_store_folder, self.ltg_grid_locations_path)
+        input_binned_weather_df = weather_grid_store.getDaysFrame(self.ltg_interpolated_weather_dates)
+
         # For the binned lightning CSV, treat multiple consecutive whitespace characters as a
         # single delimeter.
-        input_binned_weather_df = pd.read_csv(self.ltg_weather_binned_output_path, sep=',', header=None)
-        input_binned_weather_df.columns = FOPConstantsAndFunctions.INTERPOLATED_BINNED_WEATHER_DATA_HEADERS
                                                  
         try:
             input_binned_lightning_df = pd.read_csv(self.ltg_lightning_binned_output_path, header=None, delim_whitespace=True, error_bad_lines=False)
@@ -735,142 +794,73 @@ class LightningFireOccurrencePrediction(object):
             input_binned_lightning_df = pd.DataFrame(columns=['grid', 'latitude', 'longitude', 'year', 'month', 'day',
                                                               'period', 'neg', 'pos'])                       
         
-        # Swap the ordering of the neg and pos columns.
-        new_columns = ['grid', 'latitude', 'longitude', 'year', 'month', 'day', 'period', 'pos', 'neg']
-        input_binned_lightning_df = input_binned_lightning_df.reindex(columns=new_columns)   
-
-        merged_lightning_weather_df = pd.merge(input_binned_weather_df, input_binned_lightning_df,
-                                                how="outer", on=["grid", "year", "month", "day"])
-
-
-        # Drop the latitude and longitude columns.
-        #merged_lightning_weather_df = merged_lightning_weather_df.drop('latitude', axis=1)
-        #merged_lightning_weather_df = merged_lightning_weather_df.drop('longitude', axis=1)
-
-        # Add a new column called numfire, place it as the 14th column, and assign it 0 values.
-        merged_lightning_weather_df.insert(loc=14, column='numfire', value=0)
-
-        # Add a new column for pos/neg strikes per period, place them as the 16th...nth columns, and assign them 0 values for now.
-        merged_lightning_weather_df.insert(loc=16, column='neg4', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='pos4', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='neg3', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='pos3', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='neg2', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='pos2', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='neg1', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='pos1', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='neg0', value=0)
-        merged_lightning_weather_df.insert(loc=16, column='pos0', value=0)
-
-        # Replace all of the nan values in the period, neg and pos columns.
-        merged_lightning_weather_df['period'].fillna(0, inplace=True)        
-        merged_lightning_weather_df['neg'].fillna(0, inplace=True)
-        merged_lightning_weather_df['pos'].fillna(0, inplace=True)
-
-        # Set the appropriate column type for period, neg and pos.
-        merged_lightning_weather_df['period'] = merged_lightning_weather_df['period'].astype('int32')
-        merged_lightning_weather_df['neg'] = merged_lightning_weather_df['neg'].astype('int32')
-        merged_lightning_weather_df['pos'] = merged_lightning_weather_df['pos'].astype('int32')
-
-        # Assign the appropriate values to the new period-based pos and neg columns based on
-        # what the value in the period column is.
-        # Period 0.
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==0, 'neg0'] = merged_lightning_weather_df['neg']
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==0, 'pos0'] = merged_lightning_weather_df['pos']
-        merged_lightning_weather_df['nltg0'] = merged_lightning_weather_df['pos0'] + merged_lightning_weather_df['neg0']
-        
-        # Period 1.
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==1, 'neg1'] = merged_lightning_weather_df['neg']
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==1, 'pos1'] = merged_lightning_weather_df['pos']
-        merged_lightning_weather_df['nltg1'] = merged_lightning_weather_df['pos1'] + merged_lightning_weather_df['neg1']
-        
-        # Period 2.
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==2, 'neg2'] = merged_lightning_weather_df['neg']
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==2, 'pos2'] = merged_lightning_weather_df['pos']
-        merged_lightning_weather_df['nltg2'] = merged_lightning_weather_df['pos2'] + merged_lightning_weather_df['neg2']
-
-        # Period 3.
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==3, 'neg3'] = merged_lightning_weather_df['neg']
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==3, 'pos3'] = merged_lightning_weather_df['pos']
-        merged_lightning_weather_df['nltg3'] = merged_lightning_weather_df['pos3'] + merged_lightning_weather_df['neg3']
-
-        # Period 4.
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==4, 'neg4'] = merged_lightning_weather_df['neg']
-        merged_lightning_weather_df.loc[merged_lightning_weather_df['period']==4, 'pos4'] = merged_lightning_weather_df['pos']
-        merged_lightning_weather_df['nltg4'] = merged_lightning_weather_df['pos4'] + merged_lightning_weather_df['neg4']
-
-        # Drop the period column.
-        merged_lightning_weather_df = merged_lightning_weather_df.drop(columns='period')
-
-        # Rename the "month" column to "mon".
-        merged_lightning_weather_df = merged_lightning_weather_df.rename(columns={"month": "mon"})
-
-        # Read in the file which will help us tie fishnet grid # to lat/long, zone and NSR name, etc.
-        input_fishnet_nsr_dr = pd.read_csv(self.ltg_fishnet_nsr_path, sep=',')
-        input_fishnet_nsr_dr = input_fishnet_nsr_dr.rename(columns={"fishnet_AB": "grid"})
-        input_fishnet_nsr_dr['grid'] = input_fishnet_nsr_dr['grid'].astype('int32')
-
-        # Merge rows together that have a common grid, year, mon and day, as well as all other features EXCEPT for the period-based
-        # lightning strikes.
-        # The goal is to 'sum' the pos0, neg0, ..., pos4, neg4 columns after the groupby SQL operation.
-        merged_lightning_weather_df = merged_lightning_weather_df.groupby(['year', 'mon', 'day', 'grid', 'temp', 'rh', 'ws', 'rain', 'ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']).sum()
-        merged_lightning_weather_df = merged_lightning_weather_df.reset_index()
+        # Total up the positive and negative strikes for each grid cell, day and period. Only the day's weather grid cells
+        # are kept, so lightning strikes in grid cells with no weather are dropped.
+        input_binned_lightning_df = input_binned_lightning_df[['grid', 'year', 'month', 'day', 'period', 'pos', 'neg']].astype('int64')
+        period_strikes_df = input_binned_lightning_df.groupby(['grid', 'year', 'month', 'day', 'period'])[['pos', 'neg']].sum()
+
+        # Pivot the periods out into columns with one reshape: pos0, neg0, ..., pos4, neg4 (one row per grid cell and day).
+        period_strikes_df = period_strikes_df.unstack('period', fill_value=0)
+        period_strikes_df = period_strikes_df.reindex(columns=pd.MultiIndex.from_product([['pos', 'neg'], FOPConstantsAndFunctions.LTG_STRIKE_PERIODS]), fill_value=0)
+
+        merged_lightning_weather_df = input_binned_weather_df.rename(columns={"month": "mon"})
+
+        # Join the strikes onto the weather on the integer (grid, year, month, day) keys; cells with no lightning get 0 strikes.
+        weather_keys = pd.MultiIndex.from_arrays([merged_lightning_weather_df['grid'], merged_lightning_weather_df['year'],
+                                                  merged_lightning_weather_df['mon'], merged_lightning_weather_df['day']])
+        day_strikes = period_strikes_df.reindex(weather_keys, fill_value=0).to_numpy(dtype='int64')
+        pos_strikes = day_strikes[:, :len(FOPConstantsAndFunctions.LTG_STRIKE_PERIODS)]
+        neg_strikes = day_strikes[:, len(FOPConstantsAndFunctions.LTG_STRIKE_PERIODS):]
+
+        # The totals include any strikes outside of the five periods.
+        total_strikes = input_binned_lightning_df.groupby(['grid', 'year', 'month', 'day'])[['pos', 'neg']].sum()
+        total_strikes = total_strikes.reindex(weather_keys, fill_value=0).to_numpy(dtype='int64')
+
+        # Add a new column called numfire, and assign it 0 values.
+        merged_lightning_weather_df['numfire'] = 0
+
+        # Add the pos/neg strikes per period.
+        for period in FOPConstantsAndFunctions.LTG_STRIKE_PERIODS:
+            merged_lightning_weather_df['pos' + str(period)] = pos_strikes[:, period]
+            merged_lightning_weather_df['neg' + str(period)] = neg_strikes[:, period]
+
+        merged_lightning_weather_df['pos'] = total_strikes[:, 0]
+        merged_lightning_weather_df['neg'] = total_strikes[:, 1]
+
+        # Add the total number of strikes per period.
+        for period in FOPConstantsAndFunctions.LTG_STRIKE_PERIODS:
+            merged_lightning_weather_df['nltg' + str(period)] = pos_strikes[:, period] + neg_strikes[:, period]
 
         # Add a new "timing" column that will take the value of "DAY" or "NIGHT" depending on whether more lightning strokes happen
         # during the day periods or night periods (night wins in the event of a tie)
-        merged_lightning_weather_df['timing'] = ''
-        merged_lightning_weather_df.loc[(merged_lightning_weather_df.pos0 +
-                                         merged_lightning_weather_df.neg0 +
-                                         merged_lightning_weather_df.pos4 +
-                                         merged_lightning_weather_df.neg4) >=
-                                        (merged_lightning_weather_df.pos1 +
-                                         merged_lightning_weather_df.neg1 +
-                                         merged_lightning_weather_df.pos2 +
-                                         merged_lightning_weather_df.neg2 +
-                                         merged_lightning_weather_df.pos3 +
-                                         merged_lightning_weather_df.neg3), 'timing'] = "NIGHT"
-        merged_lightning_weather_df.loc[(merged_lightning_weather_df.pos0 +
-                                         merged_lightning_weather_df.neg0 +
-                                         merged_lightning_weather_df.pos4 +
-                                         merged_lightning_weather_df.neg4) <
-                                        (merged_lightning_weather_df.pos1 +
-                                         merged_lightning_weather_df.neg1 +
-                                         merged_lightning_weather_df.pos2 +
-                                         merged_lightning_weather_df.neg2 +
-                                         merged_lightning_weather_df.pos3 +
-                                         merged_lightning_weather_df.neg3), 'timing'] = "DAY"
-        
+        night_strikes = pos_strikes[:, [0, 4]].sum(axis=1) + neg_strikes[:, [0, 4]].sum(axis=1)
+        day_strikes = pos_strikes[:, 1:4].sum(axis=1) + neg_strikes[:, 1:4].sum(axis=1)
+        merged_lightning_weather_df['timing'] = np.where(night_strikes >= day_strikes, "NIGHT", "DAY")
+
         # Add a new "totltg" column which is the sum of the neg and pos columns.
-        merged_lightning_weather_df['totltg'] = merged_lightning_weather_df['pos'] + merged_lightning_weather_df['neg']        
+        merged_lightning_weather_df['totltg'] = merged_lightning_weather_df['pos'] + merged_lightning_weather_df['neg']
 
         # Excel formula for double-checking the correctness of the period-based day / night timing:
         # =IF(OR((AND((AD2 + AH2 >= AE2 + AF2 + AG2),(AI2="NIGHT"))),((AND((AD2 + AH2 < AE2 + AF2 + AG2),(AI2="DAY"))))),0,1)
 
-        # Add three columns to the dataset: ZONE_CODE, NSR, and NSRNAME, using this fancy merge function.
-        merged_lightning_weather_df['ZONE_CODE'] = merged_lightning_weather_df[['grid']].merge(input_fishnet_nsr_dr, how='left').ZONE_CODE   
-        merged_lightning_weather_df['NSR'] = merged_lightning_weather_df[['grid']].merge(input_fishnet_nsr_dr, how='left').NSR
+        # Order the rows by day, and then by grid cell.
+        merged_lightning_weather_df = merged_lightning_weather_df.sort_values(by=['year', 'mon', 'day', 'grid'], kind='mergesort')
+        merged_lightning_weather_df = merged_lightning_weather_df.reset_index(drop=True)
 
+        # Attach all of the static grid cell attributes (lat, lon, ZONE_CODE, NSR and NSRNAME) from the grid registry, which
+        # ties the fishnet grid # to lat/long (gridlocations.prn), zone and NSR name, etc.
         # NSR is 'region' in the simulation code.
-        merged_lightning_weather_df['NSRNAME'] = merged_lightning_weather_df[['grid']].merge(input_fishnet_nsr_dr, how='left').NSRNAME
-
-        # Do the same for latitude and longitude; populate the entire column using gridlocations.prn.
-        # Using engine='python' because we want to be able to parse consecutive whitespace as a single separator, and the
-        # default C engine in pandas does not support it.
-        grid_locations_df = pd.read_csv(self.ltg_grid_locations_path, delim_whitespace=True, header=None)
-        grid_locations_df.columns = ['grid', 'latitude', 'longitude']
+        grid_registry = FOPGridRegistry.getGridRegistry(self.ltg_grid_locations_path, self.ltg_fishnet_nsr_path)
+        grid_cells = grid_registry.indexOf(merged_lightning_weather_df['grid'])
 
-        merged_lightning_weather_df['latitude'] = merged_lightning_weather_df[['grid']].merge(grid_locations_df, how='left').latitude
-        merged_lightning_weather_df['longitude'] = merged_lightning_weather_df[['grid']].merge(grid_locations_df, how='left').longitude
+        merged_lightning_weather_df['lat'] = grid_registry.latitudes[grid_cells]
+        merged_lightning_weather_df['lon'] = grid_registry.longitudes[grid_cells]
 
-        # Rename the latitude and longitude columns to lat and lon.
-        merged_lightning_weather_df = merged_lightning_weather_df.rename(columns={'latitude': 'lat', 'longitude': 'lon'})
+        for column in FOPGridRegistry.GRID_STATIC_ATTRIBUTES:
+            merged_lightning_weather_df[column] = grid_registry.static_df[column].values[grid_cells]
 
-        # Rearrange the column headers so that 'grid' is first, followed by 'lat', and then by 'long'.
-        column_headers = merged_lightning_weather_df.columns.tolist()
-        column_headers.insert(0, column_headers.pop(column_headers.index('grid')))        
-        column_headers.insert(1, column_headers.pop(column_headers.index('lat')))
-        column_headers.insert(2, column_headers.pop(column_headers.index('lon')))
-        merged_lightning_weather_df = merged_lightning_weather_df[column_headers]
+        # Arrange the column headers so that 'grid' is first, followed by 'lat', and then by 'lon'.
+        merged_lightning_weather_df = merged_lightning_weather_df[FOPConstantsAndFunctions.LTG_MERGED_WEATHER_LIGHTNING_HEADERS]
 
         # raw_input("Press enter to continue...")
 
@@ -882,456 +872,215 @@ class LightningFireOccurrencePrediction(object):
             values:
 
             probarr0 = The probability that a fire arrives on the day it is ignited by lightning;
-            probarr1 = The probability that a fire arrives the day after ignition. """
-            
-        
-        input_file_handle = open(self.ltg_merged_weather_lightning_data_path, 'r')
-        input_csv_file = csv.reader(input_file_handle, quotechar='|')
-        with open(self.ltg_arrivals_holdovers_probabilities_output_path, 'w') as file:
-            pass  # This does nothing, but it clears the file
-
-        # We want to append the new dates to the existing probability dataset.        
-        # Need to add newline='' parameter so that Python 3 does not add an extra carriage return (\r\r\n) to the output file.       
-        output_file_handle = open(self.ltg_arrivals_holdovers_probabilities_output_path, 'a', newline='')
-        output_csv_file = csv.writer(output_file_handle, quotechar='|', delimiter=' ')
-
-        # Retain the first line of the file, which is the header.
-        input_csv_header = next(input_csv_file)
-
-        # The output CSV header has two more columns, one for each of the computed
-        # probabilities.
-        # We want a new list, not a list reference, which is why we use [:] here.
-        #output_csv_header = input_csv_header[:]
-        
-        # Delete irrelevent columns from the output header list.
-        # output_csv_header = filter(lambda a: a not in ['neg', 'rh', 'ws', 'rain', 'isi',
-        #                                                'pos', 'timing', 'ZONE_CODE', 'NSRNAME',
-        #                                                'mon', 'day', 'temp', 'ffmc', 'bui',
-        #                                                'fwi', 'pos0', 'neg0', 'pos1', 'neg1',
-        #                                                'pos2', 'neg2', 'pos3', 'neg3', 'pos4',
-        #                                                'neg4'], output_csv_header)
-
-        # output_csv_header.extend(['probarr0', 'probarr1', 'probign', 'jd'])
-        
-        # Move the jd (Julian date) column to the 5th position.
-        # output_csv_header.insert(4, output_csv_header.pop(output_csv_header.index('jd'))) 
-
-        ###################################################################################################### 
-
-        # The columns required by Dr. Wotton's C simulation program.
-        output_csv_header = ['grid', 'lat', 'lon', 'year', 'jd', 'probign', 'probarr0', 'probarr1', 'totltg',
-                             'numfire', 'region', 'nltg0', 'nltg1', 'nltg2', 'nltg3', 'nltg4', 'dmc', 'dc']
-        
-        # Output csv header not required.
-        # output_csv_file.writerow(output_csv_header)
-        counter = 0
-        i = 0
-        processed = 0
-        for next_row in input_csv_file:
-            assert(len(input_csv_header) == len(next_row))
-            counter += 1
-            if counter >= 1000000:
-                break 
-
-
-            i = i + 1
-            processed = processed + 1
-            # if i == 30270:
-            #     break  # Break out of the for loop if we get past i.
-
-            # For easy and per-row data manipulation and referencing, use a dictionary
-            # data structure. Its keys will be the input CSV header, and their corresponding
-            # values will be those of the current row.
-            working_dict = dict(zip(input_csv_header, next_row))
-            
-            # Mike: Just a rough seasonal separation pre-flush/post-flush.
-
-            if int(working_dict['mon']) < 6:
-                season = "Spring"
-            else:
-                season = "Summer"
-            
-            # Mike: For modelling... not enough lightning fire data outside these dates
-            if int(working_dict['mon']) < 5 or int(working_dict['mon']) > 9:
-                processed = processed - 1  # Decrement processed because this row will not get processed.
-                continue  # Skip the current row and go on to the next one.
-
-            # Note: Commented out in Mike's code?
-            # if working_dict['zone_code'] == '':
-            #     continue
-
-            if working_dict['NSR'] == '':
-                processed = processed - 1  # Decrement i because this row will not get processed.
-                continue  # Skip the current row and go on to the next one.
-            
-            if float(working_dict['ffmc']) < 0:
-                working_dict['ffmc'] = ''
-            
-            if float(working_dict['dmc']) < 0:
-                working_dict['dmc'] = ''
-            
-            if float(working_dict['ws']) < 0:
-                working_dict['ws'] = ''
-
-            if float(working_dict['dc']) < 0:
-                working_dict['dc'] = ''
-            
-            if int(working_dict['ZONE_CODE']) == 10:
-                working_dict['ZONE_CODE'] = 9
-            
-            # Mike: IMPORTANT: RECASTING some small NSRs that had few ltg fires into
-            # neighbors.
-            if int(working_dict['NSR']) == 15:
-                working_dict['NSR'] = 1
-            
-            if int(working_dict['NSR']) == 18:
-                working_dict['NSR'] = 11
-            
-            if int(working_dict['NSR']) == 14:
-                working_dict['NSR'] = 11
-            
-            if int(working_dict['NSR']) == 5:
-                working_dict['NSR'] = 12
-            
-            if int(working_dict['NSR']) == 7:
-                working_dict['NSR'] = 8
-            
-            int_season = 0  # Mike: Default to summer
-            ffmc_season = 0  # Mike: Default to summer
-
-            if season == "Spring":
-                int_season = -2.33
-                ffmc_season = 0.023
-            
-            int_first = 2.54
-            dmc_first = -0.013
-            ws_first = -0.041
-
-            # Mike: The complex set of coefficients here is how they change with NSR...
-            # and the interations between NSR and the core predictors... SO that is
-            # what this next stuff is about.
-
-            int_nsr = 0.0
-            ffmc_nsr = 0.0
-            dmc_nsr = 0.0
-            dc_nsr = 0.0
-
-            if int(working_dict['NSR']) == 1:
-                int_nsr = -0.279
-                ffmc_nsr = 0.0011
-                dmc_nsr = 0.0033
-                dc_nsr = -0.0005
-            
-            if int(working_dict['NSR']) == 2:
-                int_nsr = 0.8539
-                ffmc_nsr = -0.014
-                dmc_nsr = 0.0064
-                dc_nsr = -0.0007
-            
-            if int(working_dict['NSR']) == 3:
-                int_nsr = -0.768
-                ffmc_nsr = 0.0099
-                dmc_nsr = -0.0043
-                dc_nsr = 0.0002
-            
-            if int(working_dict['NSR']) == 4:
-                int_nsr = 0.466
-                ffmc_nsr = -0.0056
-                dmc_nsr = 0.0232
-                dc_nsr = -0.0023
-            
-            if int(working_dict['NSR']) == 6:
-                int_nsr = -0.373
-                ffmc_nsr = 0.0105
-                dmc_nsr = -0.0057
-                dc_nsr = -0.0014
-            
-            if int(working_dict['NSR']) == 8:
-                int_nsr = 1.45
-                ffmc_nsr = -0.0221
-                dmc_nsr = 0.0098
-                dc_nsr = -0.002
-            
-            if int(working_dict['NSR']) == 9:
-                int_nsr = 1.523
-                ffmc_nsr = -0.0307
-                dmc_nsr = 0.0032
-                dc_nsr = 0.0002
-            
-            if int(working_dict['NSR']) == 10:
-                int_nsr = 1.1089
-                ffmc_nsr = -0.0150
-                dmc_nsr = 0.0225
-                dc_nsr = -0.0023
-            
-            if int(working_dict['NSR']) == 11:
-                int_nsr = 1.19
-                ffmc_nsr = -0.0164
-                dmc_nsr = 0.0217
-                dc_nsr = -0.0028
-            
-            if int(working_dict['NSR']) == 12:
-                int_nsr = -1.0345
-                ffmc_nsr = 0.0039
-                dmc_nsr = -0.0042
-                dc_nsr = 0.0019
-            
-            if int(working_dict['NSR']) == 13:
-                int_nsr = -1.47
-                ffmc_nsr = -0.0009
-                dmc_nsr = 0.0042
-                dc_nsr = 0.0022
-
-            if working_dict['dc'] == '':
-                processed = processed - 1  # Skip over this entry.
-                continue
-            # Probability calculations.
-            # Rest of your existing code for calculation...
-                # Handle the error appropriately, e.g., set a default value or skip the calculation
-            pr0 = (-4.223 + int_nsr + int_season + int_first) + \
-                    float(working_dict['ffmc']) * (0.0447 + ffmc_nsr + ffmc_season) + \
-                    float(working_dict['dmc']) * (0.0186 + dmc_first + dmc_nsr) + \
-                    float(working_dict['dc']) * (-0.0026 + dc_nsr) + \
-                    float(working_dict['ws']) * (-0.01 + ws_first)
-            pr1 = (-4.223 + int_nsr + int_season + 0) + \
-                    float(working_dict['ffmc']) * (0.0447 + ffmc_nsr + ffmc_season) + \
-                    float(working_dict['dmc']) * (0.0186 + 0 + dmc_nsr) + \
-                    float(working_dict['dc']) * (-0.0026 + dc_nsr) + \
-                    float(working_dict['ws']) * (-0.01 + 0)
-            
-            # Prob. that a fire arrives on the day it is ignited.
-            # prob_arr0 = Decimal(math.exp(pr0) / (1 + math.exp(pr0)))
-            # working_dict['probarr0'] = round(prob_arr0, 10)  # 10 decimal places to match Mike
-            # self.prob_arr0.append(prob_arr0)
-
-            prob_arr0 = math.exp(pr0) / (1 + math.exp(pr0))
-            working_dict['probarr0'] = ('{0:.10f}'.format(prob_arr0)).rstrip('0')  # 10 decimal places            
-
-            # Prob. that a fire arrives any day after ignition.
-            # prob_arr1 = Decimal(math.exp(pr1) / (1 + math.exp(pr1)))
-            # working_dict['probarr1'] = round(prob_arr1, 10)  # 10 decimal places to match Mike
+            probarr1 = The probability that a fire arrives the day after ignition.
 
-            prob_arr1 = math.exp(pr1) / (1 + math.exp(pr1))
-            working_dict['probarr1'] = ('{0:.10f}'.format(prob_arr1)).rstrip('0')  # 10 decimal places
+            The probability of ignition of a holdover (probign) is also computed. The merged weather and lightning
+            data is streamed through in chunks of LTG_PROBABILITY_CHUNK_ROWS rows, so memory use stays bounded
+            for any number of input rows.
 
-            #self.prob_arr1.append(prob_arr1)
+            The probabilities are upserted into the binary season cubes (see LightningProbabilityCube), which are read
+            by the simulator and the mapper: only the days computed by this run are replaced, so the probabilities of
+            earlier days (needed for the holdover lookback) are kept. They can also be exported as the space-delimited
+            probabilities text file, which only holds the days computed by this run. """
 
-            # ######## HOLDOVER IGNITION PROBABILITIES ######## #
+        # Counts of the rows read, skipped (by reason) and written out.
+        row_counts = OrderedDict((count_name, 0) for count_name in FOPConstantsAndFunctions.LTG_PROBABILITY_ROW_COUNTS)
 
-            # Mike: This is the probability of ignition of a holdover
+        probability_cube = None
+        if FOPConstantsAndFunctions.LTG_PROBABILITY_CUBE_ENABLED:
+            probability_cube = LightningProbabilityCube(self.ltg_probability_cube_folder, self.ltg_grid_locations_path)
 
-            if int(working_dict['totltg']) > 0 and int(working_dict['pos']) >= 0:
-                perpos = float(working_dict['pos']) / float(working_dict['totltg']) * 100.0
-            else:
-                perpos = 20
-            
-            if working_dict['dmc'] == '':
-                processed = processed - 1  # Skip over this entry.
-                continue
-            
-            if working_dict['ZONE_CODE'] == '':
-                processed = processed - 1  # Skip over this entry.
-                continue
-
-            if int(working_dict['ZONE_CODE']) == 10:
-                working_dict['ZONE_CODE'] = 9
-            
-            # Mike: IMPORTANT...RECASTING some small NSRS that had few ltg fires into neighbors
-
-            if working_dict['NSR'] == '':
-                processed = processed - 1  # Skip over this entry.
-                continue
-            
-            if int(working_dict['NSR']) == 15:
-                working_dict['NSR'] = 1
-            
-            if int(working_dict['NSR']) == 18:
-                working_dict['NSR'] = 11
-            
-            if int(working_dict['NSR']) == 14:
-                working_dict['NSR'] = 11
-            
-            if int(working_dict['NSR']) == 5:
-                working_dict['NSR'] = 12
-            
-            if int(working_dict['NSR']) == 7:
-                working_dict['NSR'] = 8
-            
-            if working_dict['dmc'] == '':
-                processed = processed - 1  # Skip over this entry.
-                continue
-            
-            # dry variable not used.
-            # if float(working_dict['rain']) > 0.2:
-            #     dry = "WET"
-            # else:
-            #     dry = "DRY"          
-            
-            if int(working_dict['mon']) < 6:
-                season = "Spring"
-                int_season = 0.3201
-            else:
-                season = "Summer"
-                int_season = 0.0
-            
-            # Mike: Just a categorical classification of density to get at rainfall
-            
-            if int(working_dict['totltg']) > 17:  # Mike: extreme
-                dense = -1.51
-            elif int(working_dict['totltg']) > 6:
-                dense = -0.48
-            elif int(working_dict['totltg']) > 2:
-                dense = 0.0
-            else:
-                dense = 0.2332
-            
-            # Mike: SEE the definition in the data conditioning part for this
-            # IF nighttime ltg total (9pm to 6am) is > daytime lightning total (6am to
-            # 9pm) then it's NIGHT, otherwise DAY
-            
-            if working_dict['timing'] == 'NIGHT':
-                int_timing = 0.406
-            else:
-                int_timing = 0.0
-            
-            int_nsr = 0.0
-            ffmc_nsr = 0.0
-            dmc_nsr = 0.0
-            
-            if int(working_dict['NSR']) == 1:
-                int_nsr = 1.43
-                ffmc_nsr = -0.0193
-                dmc_nsr = 0.0027
-            
-            if int(working_dict['NSR']) == 2:
-                int_nsr = 2.67
-                ffmc_nsr = -0.0398
-                dmc_nsr = 0.0029
-            
-            if int(working_dict['NSR']) == 3:
-                int_nsr = 1.55
-                ffmc_nsr = -0.0139
-                dmc_nsr = -0.0093
-            
-            if int(working_dict['NSR']) == 4:
-                int_nsr = -0.6778
-                ffmc_nsr = 0.0065
-                dmc_nsr = -0.0096
-            
-            if int(working_dict['NSR']) == 6:
-                int_nsr = 0.3966
-                ffmc_nsr = -0.0051
-                dmc_nsr = 0.0014
-            
-            if int(working_dict['NSR']) == 8:
-                int_nsr = 0.9429
-                ffmc_nsr = -0.0188
-                dmc_nsr = -0.0030
-            
-            if int(working_dict['NSR']) == 9:
-                int_nsr = 3.388
-                ffmc_nsr = -0.0579
-                dmc_nsr = 0.0006
-            
-            if int(working_dict['NSR']) == 10:
-                int_nsr = 0.776
-                ffmc_nsr = -0.0197
-                dmc_nsr = 0.0204
-            
-            if int(working_dict['NSR']) == 11:
-                int_nsr = 1.688
-                ffmc_nsr = -0.0292
-                dmc_nsr = 0.0190
-            
-            if int(working_dict['NSR']) == 12:
-                int_nsr = 1.566
-                ffmc_nsr = -0.028
-                dmc_nsr = 0.0025
-            
-            if int(working_dict['NSR']) == 13:
-                int_nsr = 4.80
-                ffmc_nsr = -0.062
-                dmc_nsr = 0.0018
-            
-            f = (-11.873 + int_nsr + int_timing + int_season + dense) + \
-                float(working_dict['dmc']) * (0.0179 + dmc_nsr) + \
-                float(working_dict['dc']) * (0.0020) + \
-                float(working_dict['ffmc']) * (0.0709 + ffmc_nsr) - (0.0097 * perpos)
-
-            probign = math.exp(f) / (1.0 + math.exp(f))
-            
-            if probign > 0.04:
-                probign = 0.04 + ((probign - 0.04) * 0.25)
-            if probign > 0.05:
-                probign = 0.05
-            
-            # Mike: This is just a quick fix to addressing the roll over flaw in the
-            # GLM linearity ... SIMPLE for now
-            
-            jd = datetime.date(int(working_dict['year']), \
-                                int(working_dict['mon']), \
-                                int(working_dict['day'])).timetuple().tm_yday
-            
-            # Append the probign and jds columns to the end of the dataset.
-            working_dict['probign'] = ('{0:.10f}'.format(probign)).rstrip('0')  # 10 decimal places
-            working_dict['jd'] = jd
-            
-            # Now that we have all of the probabilities, let's append these columns to the data set.
-            new_row = []
-            
-            # Ensure that we output the columns in the same order as they were during the input
-            # stage.
-            for column_name in output_csv_header:
-                
-                # Handle the column name change for NSR / region.
-                if column_name == 'region':
-                    column_name = 'NSR'
+        # Need to add newline='' parameter so that Python 3 does not add an extra carriage return (\r\r\n) to the output file.
+        # Output csv header not required.
+        output_file_handle = None
+        if FOPConstantsAndFunctions.LTG_PROBABILITY_TEXT_EXPORT:
+            output_file_handle = open(self.ltg_arrivals_holdovers_probabilities_output_path, 'w', newline='')
+            output_csv_file = csv.writer(output_file_handle, quotechar='|', delimiter=' ')
 
-                # Omit the following columns from the data set.
-                """if column_name == 'neg':
-                    continue
-                
-                if column_name == 'rh':
-                    continue
-                
-                if column_name == 'ws':
-                    continue
-                
-                if column_name == 'rain':
-                    continue
-                
-                if column_name == 'isi':
-                    continue
-                
-                if column_name == 'pos':
-                    continue
-                
-                if column_name == 'timing':
-                    continue
-                
-                if column_name == 'ZONE_CODE':
-                    continue
-                
-                if column_name == 'NSRNAME':
-                    continue"""
-
-                # Perform rounding and casting as per Dr. Wotton's C code requirements.
-                working_dict['lat'] = round(float(working_dict['lat']), 4)
-                working_dict['lon'] = round(float(working_dict['lon']), 4)
-                working_dict['dmc'] = int(float(working_dict['dmc']))
-                working_dict['dc'] = int(float(working_dict['dc']))
-                
-                new_row.append(working_dict[column_name])
-            
-            #print("process: working_dict is ", working_dict)
-            ## raw_input("Press enter to continue...")
-            
-            # Append to the output file.
+        try:
+            for output_columns in self.arrivalHoldoverIgnitionProbabilityChunks(row_counts):
+                # The probabilities are only formatted as text if they are exported.
+                if output_file_handle is not None:
+                    output_csv_file.writerows(zip(*[FOPConstantsAndFunctions.formatProbabilities(output_columns[column_name])
+                                                    if column_name in FOPConstantsAndFunctions.LTG_PROBABILITY_COLUMNS else output_columns[column_name]
+                                                    for column_name in FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS]))
+
+                if probability_cube is not None:
+                    probability_cube.addColumns(output_columns)
+
+                print("computeArrivalHoldoverIgnitionProbabilities(): " +
+                      ", ".join("%s: %d" % (count_name, count) for count_name, count in row_counts.items()))
+        finally:
+            if output_file_handle is not None:
+                output_file_handle.close()
+
+        # Upsert the computed days into the season cubes.
+        if probability_cube is not None:
+            probability_cube.save()
+
+        return row_counts
+
+    def arrivalHoldoverIgnitionProbabilityChunks(self, row_counts):
+        """ This generator reads in the merged weather and lightning data in chunks of LTG_PROBABILITY_CHUNK_ROWS rows,
+            and yields the output columns of each chunk (see arrivalHoldoverIgnitionProbabilityColumns()).
+            The given row_counts are updated as each chunk is processed. """
+
+        # The merged weather and lightning columns used by the models.
+        input_columns = ['grid', 'lat', 'lon', 'year', 'mon', 'day', 'ws', 'ffmc', 'dmc', 'dc', 'numfire', 'pos', 'nltg0',
+                         'nltg1', 'nltg2', 'nltg3', 'nltg4', 'timing', 'totltg', 'ZONE_CODE', 'NSR']
+
+        # Read every field in as text, so that the fields which are passed straight through are output unchanged.
+        merged_chunks = pd.read_csv(self.ltg_merged_weather_lightning_data_path, sep=',', quotechar='|', usecols=input_columns,
+                                    dtype=str, keep_default_na=False, chunksize=FOPConstantsAndFunctions.LTG_PROBABILITY_CHUNK_ROWS)
+
+        for merged_df in merged_chunks:
+            row_counts['read'] += len(merged_df)
+
+            output_columns = self.arrivalHoldoverIgnitionProbabilityColumns(merged_df, row_counts)
+            row_counts['written'] += len(output_columns['grid'])
+
+            yield output_columns
+
+    def arrivalHoldoverIgnitionProbabilityColumns(self, merged_df, row_counts):
+        """ Computes the arrival and holdover ignition probabilities for a chunk of the merged weather and lightning
+            data (all of its rows at once, column by column), and returns a dictionary holding a list of output values
+            for each of the columns required by Dr. Wotton's C simulation program (LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS).
+
+            Skipped rows are added to row_counts under the first reason they were skipped for. """
+
+        # Mike: For modelling... not enough lightning fire data outside these dates
+        month = merged_df['mon'].astype(np.int64).values
+        skip_reasons = [('skipped_month', (month < 5) | (month > 9))]
+
+        # Rows without an NSR or ZONE_CODE are skipped.
+        skip_reasons.append(('skipped_region', (merged_df['NSR'] == '').values | (merged_df['ZONE_CODE'] == '').values))
+
+        # Rows with a missing (negative) DMC or DC are skipped. Rows with a missing FFMC or wind speed can not be
+        # modelled either, and are skipped as well.
+        for column in ['ffmc', 'dmc', 'dc', 'ws']:
+            skip_reasons.append(('skipped_' + column, merged_df[column].astype(float).values < 0))
+
+        keep = np.ones(len(merged_df), dtype=bool)
+        for count_name, skip in skip_reasons:
+            row_counts[count_name] += int(np.count_nonzero(keep & skip))
+            keep &= ~skip
+
+        merged_df = merged_df.loc[keep]
+
+        month = merged_df['mon'].astype(np.int64).values
+        ffmc = merged_df['ffmc'].astype(float).values
+        dmc = merged_df['dmc'].astype(float).values
+        dc = merged_df['dc'].astype(float).values
+        ws = merged_df['ws'].astype(float).values
+        pos = merged_df['pos'].astype(np.int64).values
+        totltg = merged_df['totltg'].astype(np.int64).values
+
+        # Mike: IMPORTANT: RECASTING some small NSRs that had few ltg fires into neighbors.
+        original_nsr = merged_df['NSR'].astype(np.int64).values
+        nsr = original_nsr.copy()
+        for from_nsr, to_nsr in FOPConstantsAndFunctions.LTG_NSR_RECODES.items():
+            nsr[original_nsr == from_nsr] = to_nsr
+
+        # Mike: The complex set of coefficients here is how they change with NSR...
+        # and the interations between NSR and the core predictors... SO that is
+        # what this next stuff is about.
+        # Gather each row's NSR coefficients from lookup tables indexed by NSR (NSRs without coefficients get 0.0).
+        lookup_size = max(list(FOPConstantsAndFunctions.LTG_ARRIVAL_NSR_COEFFICIENTS.keys()) +
+                          list(FOPConstantsAndFunctions.LTG_HOLDOVER_NSR_COEFFICIENTS.keys()) + [nsr.max() if len(nsr) else 0]) + 1
+        in_lookup = nsr >= 0
+
+        arrival_coefficients = np.zeros((lookup_size, 4))
+        for table_nsr, coefficients in FOPConstantsAndFunctions.LTG_ARRIVAL_NSR_COEFFICIENTS.items():
+            arrival_coefficients[table_nsr] = coefficients
+
+        holdover_coefficients = np.zeros((lookup_size, 3))
+        for table_nsr, coefficients in FOPConstantsAndFunctions.LTG_HOLDOVER_NSR_COEFFICIENTS.items():
+            holdover_coefficients[table_nsr] = coefficients
+
+        int_nsr, ffmc_nsr, dmc_nsr, dc_nsr = (np.where(in_lookup, arrival_coefficients[np.where(in_lookup, nsr, 0)][:, k], 0.0) for k in range(4))
+
+        # ######## ARRIVAL PROBABILITIES ######## #
+
+        # Mike: Just a rough seasonal separation pre-flush/post-flush.
+        spring = month < 6
+        int_season = np.where(spring, -2.33, 0.0)
+        ffmc_season = np.where(spring, 0.023, 0.0)
+
+        int_first = 2.54
+        dmc_first = -0.013
+        ws_first = -0.041
+
+        pr0 = (-4.223 + int_nsr + int_season + int_first) + \
+                ffmc * (0.0447 + ffmc_nsr + ffmc_season) + \
+                dmc * (0.0186 + dmc_first + dmc_nsr) + \
+                dc * (-0.0026 + dc_nsr) + \
+                ws * (-0.01 + ws_first)
+        pr1 = (-4.223 + int_nsr + int_season + 0) + \
+                ffmc * (0.0447 + ffmc_nsr + ffmc_season) + \
+                dmc * (0.0186 + 0 + dmc_nsr) + \
+                dc * (-0.0026 + dc_nsr) + \
+                ws * (-0.01 + 0)
+
+        # Prob. that a fire arrives on the day it is ignited, and any day after ignition.
+        prob_arr0 = FOPConstantsAndFunctions.logistic(pr0)
+        prob_arr1 = FOPConstantsAndFunctions.logistic(pr1)
+
+        # ######## HOLDOVER IGNITION PROBABILITIES ######## #
+
+        # Mike: This is the probability of ignition of a holdover
+        with np.errstate(divide='ignore', invalid='ignore'):
+            perpos = np.where((totltg > 0) & (pos >= 0), pos.astype(float) / totltg.astype(float) * 100.0, 20)
+
+        int_season = np.where(spring, 0.3201, 0.0)
+
+        # Mike: Just a categorical classification of density to get at rainfall
+        dense = np.select([totltg > 17, totltg > 6, totltg > 2], [-1.51, -0.48, 0.0], default=0.2332)
+
+        # Mike: SEE the definition in the data conditioning part for this
+        # IF nighttime ltg total (9pm to 6am) is > daytime lightning total (6am to
+        # 9pm) then it's NIGHT, otherwise DAY
+        int_timing = np.where(merged_df['timing'].values == 'NIGHT', 0.406, 0.0)
+
+        int_nsr, ffmc_nsr, dmc_nsr = (np.where(in_lookup, holdover_coefficients[np.where(in_lookup, nsr, 0)][:, k], 0.0) for k in range(3))
+
+        f = (-11.873 + int_nsr + int_timing + int_season + dense) + \
+            dmc * (0.0179 + dmc_nsr) + \
+            dc * (0.0020) + \
+            ffmc * (0.0709 + ffmc_nsr) - (0.0097 * perpos)
+
+        probign = FOPConstantsAndFunctions.logistic(f)
+
+        # Mike: This is just a quick fix to addressing the roll over flaw in the
+        # GLM linearity ... SIMPLE for now
+        probign = np.where(probign > 0.04, 0.04 + ((probign - 0.04) * 0.25), probign)
+        probign = np.where(probign > 0.05, 0.05, probign)
+
+        # Julian date.
+        jd = pd.to_datetime(pd.DataFrame({'year': merged_df['year'].astype(np.int64).values,
+                                          'month': month,
+                                          'day': merged_df['day'].astype(np.int64).values})).dt.dayofyear.values
+
+        # Perform rounding and casting as per Dr. Wotton's C code requirements. The recast NSRs are output as the
+        # 'region' column; probabilities are rounded to the 10 decimal places that they are output to, and kept as
+        # floats (they are only formatted as text for the probabilities text file).
+        output_columns = {'grid': merged_df['grid'].tolist(),
+                          'lat': FOPConstantsAndFunctions.roundLikeBuiltin(merged_df['lat'].astype(float).values, 4).tolist(),
+                          'lon': FOPConstantsAndFunctions.roundLikeBuiltin(merged_df['lon'].astype(float).values, 4).tolist(),
+                          'year': merged_df['year'].tolist(),
+                          'jd': jd.tolist(),
+                          'probign': FOPConstantsAndFunctions.roundLikeBuiltin(probign, 10),
+                          'probarr0': FOPConstantsAndFunctions.roundLikeBuiltin(prob_arr0, 10),
+                          'probarr1': FOPConstantsAndFunctions.roundLikeBuiltin(prob_arr1, 10),
+                          'region': np.where(nsr != original_nsr, nsr.astype(str), merged_df['NSR'].values.astype(str)).tolist(),
+                          'dmc': np.trunc(dmc).astype(np.int64).tolist(),
+                          'dc': np.trunc(dc).astype(np.int64).tolist()}
+
+        for column_name in FOPConstantsAndFunctions.LTG_PROBABILITY_ARRIVALS_HOLDOVERS_HEADERS:
+            if column_name not in output_columns:
+                output_columns[column_name] = merged_df[column_name].tolist()
+
+        return output_columns
 
-            output_csv_file.writerow(new_row)
-        
-        # End of fire arrivals for loop.
-    
     def addLatLongsToGriddedFWIWeatherFile(self):
         """ This is a "debugging" method which will add lat/longs as columns to the gridded FWI weather file
             for plotting in Google Earth, as an example.
@@ -1499,7 +1248,7 @@ class LightningFireOccurrencePrediction(object):
             start_day_of_year = start_day.timetuple().tm_yday
             end_day_minus_one_day_of_year = end_day_minus_one.timetuple().tm_yday
 
-            self.simulationWrapper(start_day_of_year, end_day_minus_one_day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval)
+            self.simulationWrapper(start_day_of_year, end_day_minus_one_day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval, start_day.year)
 
             # Call the Mapping method to produce maps for this date range.
 
@@ -1526,7 +1275,7 @@ class LightningFireOccurrencePrediction(object):
         end_day_of_year = end_day.timetuple().tm_yday
 
         # Get a fresh set of simulations for the days in the FOP System State DB.
-        self.simulationWrapper(start_day_of_year, end_day_of_year, int_ltg_fire_holdover_lookback_time, float_ltg_fire_confidence_interval)
+        self.simulationWrapper(start_day_of_year, end_day_of_year, int_ltg_fire_holdover_lookback_time, float_ltg_fire_confidence_interval, start_day.year)
 
         date_range_list = []
         for date in FOPConstantsAndFunctions.daterange(start_day, end_day + datetime.timedelta(days=1)):
@@ -1587,7 +1336,7 @@ class LightningFireOccurrencePrediction(object):
             # Determine the day of year (Julian) so that we can simulate only for this day.
             day_of_year = date_to_predict_for.timetuple().tm_yday
 
-            self.simulationWrapper(day_of_year, day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval)
+            self.simulationWrapper(day_of_year, day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval, date_to_predict_for.year)
             
             # 2. Call the mapping method which will produce maps for the desired date.
 
@@ -1620,50 +1369,12 @@ class LightningFireOccurrencePrediction(object):
             
             # Next, we need to select only the raw weather and lightning data for the date range which falls between the first
             # missing day in the FOP system state DB and date_to_predict_for.
-            raw_weather_data_df = pd.read_csv(self.ltg_input_raw_weather_data_file, sep=',')
+            # The raw weather data is read in (and checked to be well-formed) once per uploaded file, and kept in a store
+            # partitioned by day; a ValueError is raised if the CSV is not well-formed.
+            raw_weather_store = RawWeatherStore(self.ltg_raw_weather_store_folder, self.ltg_input_raw_weather_data_file)
 
-            # Perform a header check to determine the well-formed nature of the CSV.
-            if list(raw_weather_data_df.columns) == FOPConstantsAndFunctions.RAW_WEATHER_CSV_HEADERS:
-
-                # Raw weather headers type 1.
-                raw_weather_data_df['weather_date'] = pd.to_datetime(raw_weather_data_df['weather_date'], format='%m/%d/%y %H:%M', infer_datetime_format=True)
-
-            elif list(raw_weather_data_df.columns) == FOPConstantsAndFunctions.RAW_WEATHER_CSV_HEADERS_2:
-                
-                # Raw weather headers type 2.
-                
-                # Make all of the weather column headers to be lowercase.
-                raw_weather_data_df.columns = map(str.lower, raw_weather_data_df.columns)
-                raw_weather_data_df['weather_date'] = pd.to_datetime(raw_weather_data_df['weather_date'], format='%Y-%m-%d %H:%M:%S', infer_datetime_format=True)
-
-            else:
-                print("lightningFOPController(): Raw weather data columns do not match what is expected. ERROR")
-                raise ValueError            
-
-            # Sort the raw weather dataframe by the column: "weather_date".
-            raw_weather_data_df = raw_weather_data_df.sort_values(by='weather_date')
-
-            #day_after_most_recent_day = most_recent_date + datetime.timedelta(days=1)    ###   + datetime.timedelta(days=1)
-            #date_mask_weather = ((raw_weather_data_df['weather_date'] > pd.Timestamp(most_recent_date)) & (raw_weather_data_df['weather_date'] <= pd.Timestamp(date_to_predict_for + datetime.timedelta(days=1))))
-
-            # Perform the date selection for this dataframe; selection is inclusive.
-            # raw_weather_data_df = raw_weather_data_df.loc[raw_weather_data_df['weather_date'][str(day_after_most_recent_day):str(date_to_predict_for)]]
-            #raw_weather_data_df = raw_weather_data_df.loc[date_mask_weather]
-
-
-            # Ensure that we actually have date_to_predict_for in the range that we grabbed.
-            """if datetime.datetime.date(raw_weather_data_df['weather_date'].max()) != date_to_predict_for:
-                print("lightningFOPController(): The provided date, %s, does not exist in the raw weather dataset. \r\n" \
-                    "Please provide a more up-to-date raw weather data file or adjust the prediction date and try again." % str(date_to_predict_for))
-                return"""            
-
-
-            date_mask_weather = ((raw_weather_data_df['weather_date'].dt.year == date_to_predict_for.year) &
-                                             (raw_weather_data_df['weather_date'].dt.month == date_to_predict_for.month) &
-                                             (raw_weather_data_df['weather_date'].dt.day == date_to_predict_for.day))
-
-            # Perform the date selection for this dataframe; selection is inclusive.
-            raw_weather_data_df = raw_weather_data_df.loc[date_mask_weather]
+            # Grab the raw weather data for the date we want to predict for.
+            raw_weather_data_df = raw_weather_store.getDay(date_to_predict_for)
 
 
 
@@ -1722,6 +1433,11 @@ class LightningFireOccurrencePrediction(object):
             # 2. Call the lightning strike binner executable through the following method.
             self.lightningBinnerWrapper()
 
+            # Reduce the hourly observations to one (noon) observation per station per day, so that no station
+            # appears more than once in the weather interpolation.
+            if FOPConstantsAndFunctions.REDUCE_RAW_WEATHER_TO_STATION_DAILY:
+                raw_weather_data_df = FOPConstantsAndFunctions.reduceToStationDailyObservations(raw_weather_data_df)
+
             # 3. Call the raw weather data massager method on the prepared raw weather dataframe.
             FOPConstantsAndFunctions.rawWeatherDataMassager(raw_weather_data_df,
                                                             self.ltg_weather_massaged_output_path,
@@ -1740,7 +1456,7 @@ class LightningFireOccurrencePrediction(object):
             # Determine the day of year (Julian) so that we can simulate only for this day.
             day_of_year = date_to_predict_for.timetuple().tm_yday
 
-            self.simulationWrapper(day_of_year, day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval)
+            self.simulationWrapper(day_of_year, day_of_year, ltg_fire_holdover_lookback_time, ltg_fire_confidence_interval, date_to_predict_for.year)
 
             # 8. Update the FOP system state DB with the newly-processed dates.
             
@@ -1,5 +1,8 @@
 import random
 import csv
+import json
+import os
+import numpy as np
 def ignbin(ltg_value, pp):
     count = 0
     n = int(ltg_value)
@@ -23,6 +26,36 @@ def nailuj(jd, leap):
         day = jd - monthl[mon-1]
     return mon, day
 
+def loadcube(cube_folder, manifest, cells, year, first_jd, last_jd, eco, pign, parr0, parr1, dmcgrid, dcgrid, lati, longi, ltg, firegrid, ltgp):
+    # Fills the season arrays for days first_jd to last_jd from the probability cube for the given year (days by grid
+    # cells by fields, with NaN where there is no probability row), in place of reading the probabilities text file.
+    # Only the days in the window are read from the cube; every grid cell with probabilities is located.
+    cube = np.load(os.path.join(cube_folder, 'probabilities_%d.npy' % year), mmap_mode='r')
+    field = {name: k for k, name in enumerate(manifest['fields'])}
+    for c in np.flatnonzero(~np.isnan(cells['lat'])).tolist():
+        lati[int(cells['grid'][c])] = float(cells['lat'][c])
+        longi[int(cells['grid'][c])] = float(cells['lon'][c])
+    first_jd = max(first_jd, 121, manifest['first_day'])
+    last_jd = min(last_jd, 273, manifest['first_day'] + manifest['days'] - 1)
+    if last_jd < first_jd:
+        return
+    window = np.asarray(cube[first_jd - manifest['first_day']:last_jd - manifest['first_day'] + 1])
+    for d in range(len(window)):
+        j = first_jd + d - 121
+        for c in np.flatnonzero(~np.isnan(window[d, :, 0])).tolist():
+            i = int(cells['grid'][c])
+            row = window[d, c].tolist()
+            eco[i][j] = row[field['region']]
+            pign[i][j] = row[field['probign']]
+            parr0[i][j] = row[field['probarr0']]
+            parr1[i][j] = row[field['probarr1']]
+            dmcgrid[i][j] = row[field['dmc']]
+            dcgrid[i][j] = row[field['dc']]
+            ltg[i][j] = row[field['totltg']]
+            firegrid[i][j] = row[field['numfire']]
+            for k in range(5):
+                ltgp[i][j][k] = row[field['nltg%d' % k]]
+
 def main():
     grid = 0
     jd = 0
@@ -93,7 +126,13 @@ def main():
         arguments = next(csv_reader)
     # Access individual arguments by index
 
-    argv1, argv2, argv3, argv4, argv5, argv6, argv7, argv8 = arguments
+    argv1, argv2, argv3, argv4, argv5, argv6, argv7, argv8 = arguments[:8]
+    # Optional ninth argument: the probability cube folder, read in place of the probabilities text file (argv2).
+    argv9 = arguments[8] if len(arguments) > 8 else ''
+    cube_folder = argv9 if argv9 and os.path.isfile(os.path.join(argv9, 'manifest.json')) else ''
+    # Optional tenth argument: the year being simulated. The cube folder keeps every year predicted for so far, but
+    # only this year's cube is simulated (the latest year's, if no year is given).
+    argv10 = arguments[9] if len(arguments) > 9 else ''
     cells = 9999
     baseyear = 1990
     holdover_time = int(argv7)
@@ -102,14 +141,28 @@ def main():
     ci_low = int(0 + ((1 - (confidence_interval / 100)) / 2) * sims)
     ci_high = int(sims - ((1 - (confidence_interval / 100)) / 2) * sims)
     numfires = [[0] * 183 for _ in range(25)]
-    inp = open(argv2, "r")
     out = open(argv3, "w")
     out2 = open(argv4, "w")
     SEED = int(argv1)
     start_date = int(argv5)
     end_date = int(argv6)
     random.seed(SEED)
-    grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, inp.readline().split())
+    if cube_folder:
+        with open(os.path.join(cube_folder, 'manifest.json'), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        cube_cells = np.load(os.path.join(cube_folder, 'cells.npy'))
+        if argv10:
+            cube_years = [year for year in manifest['years'] if int(year) == int(argv10)]
+        else:
+            cube_years = sorted(manifest['years'])[-1:]
+        if not cube_years:
+            out.close()
+            out2.close()
+            return
+        year = cube_years.pop(0)
+    else:
+        inp = open(argv2, "r")
+        grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, inp.readline().split())
     oldyear = int(year)
     while True:
         for i in range(cells):
@@ -133,28 +186,33 @@ def main():
         else:
             leap = 0
         ltgsum2 = 0
-        while True:
-            if jd > 120 and jd < 274:
-                eco[int(grid)][int(jd) - 121] = region
-                pign[int(grid)][int(jd) - 121] = probign
-                parr0[int(grid)][int(jd) - 121] = probarr0
-                parr1[int(grid)][int(jd) - 121] = probarr1
-                dmcgrid[int(grid)][int(jd) - 121] = dmc
-                dcgrid[int(grid)][int(jd) - 121] = dc
-                lati[int(grid)] = lat
-                longi[int(grid)] = lon
-                ltg[int(grid)][int(jd) - 121] = totltg
-                firegrid[int(grid)][int(jd) - 121] = numfire
-                ltgsum2 += totltg
-                ltgp[int(grid)][int(jd) - 121][0] = nltg0
-                ltgp[int(grid)][int(jd) - 121][1] = nltg1
-                ltgp[int(grid)][int(jd) - 121][2] = nltg2
-                ltgp[int(grid)][int(jd) - 121][3] = nltg3
-                ltgp[int(grid)][int(jd) - 121][4] = nltg4
-            line = inp.readline()
-            if not line:
-                break
-            grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, line.split())
+        if cube_folder:
+            # The lookback window: up to 14 days of holdovers (with the DC-based holdover time) before the start date.
+            lookback = 14 if holdover_time < 0 else holdover_time
+            loadcube(cube_folder, manifest, cube_cells, year, start_date - lookback, end_date, eco, pign, parr0, parr1, dmcgrid, dcgrid, lati, longi, ltg, firegrid, ltgp)
+        else:
+            while True:
+                if jd > 120 and jd < 274:
+                    eco[int(grid)][int(jd) - 121] = region
+                    pign[int(grid)][int(jd) - 121] = probign
+                    parr0[int(grid)][int(jd) - 121] = probarr0
+                    parr1[int(grid)][int(jd) - 121] = probarr1
+                    dmcgrid[int(grid)][int(jd) - 121] = dmc
+                    dcgrid[int(grid)][int(jd) - 121] = dc
+                    lati[int(grid)] = lat
+                    longi[int(grid)] = lon
+                    ltg[int(grid)][int(jd) - 121] = totltg
+                    firegrid[int(grid)][int(jd) - 121] = numfire
+                    ltgsum2 += totltg
+                    ltgp[int(grid)][int(jd) - 121][0] = nltg0
+                    ltgp[int(grid)][int(jd) - 121][1] = nltg1
+                    ltgp[int(grid)][int(jd) - 121][2] = nltg2
+                    ltgp[int(grid)][int(jd) - 121][3] = nltg3
+                    ltgp[int(grid)][int(jd) - 121][4] = nltg4
+                line = inp.readline()
+                if not line:
+                    break
+                grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, line.split())
         ltgsum2 = 0
         for today in range(start_date, end_date+1):
             ltgsum = 0
@@ -261,12 +319,19 @@ def main():
             for i in range(cells):
                 if lati[i] > 0:
                     out2.write(f"{i} {oldyear} {mon} {day} {lati[i]} {longi[i]} {narrtoday[i]} {nholdtoday[i]} {nigntoday[i]}\n")
-        oldyear = int(year)
-        line = inp.readline()
-        if not line:
-            break
-        grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, line.split())
-    inp.close()
+        if cube_folder:
+            if not cube_years:
+                break
+            year = cube_years.pop(0)
+            oldyear = int(year)
+        else:
+            oldyear = int(year)
+            line = inp.readline()
+            if not line:
+                break
+            grid, lat, lon, year, jd, probign, probarr0, probarr1, totltg, numfire, region, nltg0, nltg1, nltg2, nltg3, nltg4, dmc, dc = map(float, line.split())
+    if not cube_folder:
+        inp.close()
     out.close()
     out2.close()
 